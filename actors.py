@@ -0,0 +1,204 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from models import LogEvent
+from config_manager import Config
+from netinfo import ip_ranges, ip_to_int
+from timeutil import US_PER_MINUTE, from_micros
+
+# Участники (entity resolution): пользователи, IP клиентов и выданные VPN
+# адреса, встречающиеся вместе, объединяются в один кластер.
+#
+# Узлы — пользователь (один на имя) и «эпизод» IP-адреса: появления адреса,
+# разделённые не более чем actor_window_minutes. Адрес, выданный VPN сегодня
+# одному сотруднику, а через неделю другому, даёт два разных эпизода и не
+# связывает этих людей; пользователи, работавшие с одного адреса в пределах
+# окна, — связываются. Все сущности одного события (user, ip, assigned_ip)
+# объединяются в системе непересекающихся множеств (union-find со сжатием
+# путей и объединением по размеру): один проход по событиям в порядке
+# времени, почти линейно по их числу.
+#
+# Адреса NAT-пулов из справочника сетей общие по определению и пользователей
+# не связывают.
+
+# поля details, содержащие дополнительные IP-адреса события
+ACTOR_IP_DETAILS = ("assigned_ip",)
+
+
+class DisjointSet:
+    # Система непересекающихся множеств над узлами 0..n-1.
+
+    def __init__(self):
+        self.parent: List[int] = []
+        self.size: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self.parent)
+
+    def add(self) -> int:
+        node = len(self.parent)
+        self.parent.append(node)
+        self.size.append(1)
+        return node
+
+    def find(self, node: int) -> int:
+        parent = self.parent
+        root = node
+        while parent[root] != root:
+            root = parent[root]
+        while parent[node] != root:  # сжатие пути: все узлы пути — сразу к корню
+            parent[node], node = root, parent[node]
+        return root
+
+    def union(self, a: int, b: int) -> int:
+        ra, rb = self.find(a), self.find(b)
+        if ra == rb:
+            return ra
+        size = self.size
+        if size[ra] < size[rb]:
+            ra, rb = rb, ra
+        self.parent[rb] = ra
+        size[ra] += size[rb]
+        return ra
+
+
+@dataclass
+class Actor:
+    # Кластер связанных пользователей и адресов.
+    id: int
+    users: List[str]
+    ips: List[str]
+    events: List[LogEvent] = field(default_factory=list)
+    first_us: Optional[int] = None
+    last_us: Optional[int] = None
+    sources: List[str] = field(default_factory=list)
+    classes: List[str] = field(default_factory=list)
+
+    @property
+    def identities(self) -> int:
+        return len(self.users) + len(self.ips)
+
+    @property
+    def start_time(self):
+        return from_micros(self.first_us) if self.first_us is not None else None
+
+    @property
+    def end_time(self):
+        return from_micros(self.last_us) if self.last_us is not None else None
+
+
+def resolve_actors(events: List[LogEvent], cfg: Config) -> List[Actor]:
+    # Кластеры участников; сначала связанные (больше пользователей и адресов),
+    # затем по числу событий. События без пользователя и IP в кластеры не входят,
+    # события без времени присоединяются только через пользователя.
+    window = cfg.actor_window_minutes * US_PER_MINUTE
+    ranges = ip_ranges(cfg)
+    dsu = DisjointSet()
+    add, union = dsu.add, dsu.union
+    labels: List[Tuple[str, str]] = []          # узел -> ('user' | 'ip', значение)
+    user_nodes: Dict[str, int] = {}
+    episodes: Dict[object, List[int]] = {}      # адрес -> [узел текущего эпизода, последнее время]
+    shared: Dict[object, bool] = {}             # адрес -> входит ли в NAT-пул
+    event_node: List[int] = [-1] * len(events)
+
+    def user_node(name: str) -> int:
+        node = user_nodes.get(name)
+        if node is None:
+            node = user_nodes[name] = add()
+            labels.append(("user", name))
+        return node
+
+    def is_shared(key: object, ip: str) -> bool:
+        flag = shared.get(key)
+        if flag is None:
+            rng = ranges.lookup_ip(ip) if ranges is not None else None
+            flag = shared[key] = bool(rng is not None and rng.nat)
+        return flag
+
+    timed = sorted((i for i, ev in enumerate(events) if ev.ts_us is not None), key=lambda i: events[i].ts_us)
+    extra_keys: Dict[type, Tuple[str, ...]] = {}   # тип details -> имеющиеся поля ACTOR_IP_DETAILS
+    for i in timed:
+        ev = events[i]
+        ts = ev.ts_us
+        anchor = user_node(ev.user) if ev.user else -1
+        fallback = -1
+        ips = []
+        if ev.ip:
+            ips.append((ev.ip, ev.ip_int if ev.ip_int is not None else ev.ip))
+        details = ev.details
+        if details:
+            names = extra_keys.get(type(details))
+            if names is None or type(details) is dict:
+                names = tuple(name for name in ACTOR_IP_DETAILS if name in details)
+                extra_keys[type(details)] = names
+            for name in names:
+                extra = details.get(name)
+                if extra and extra != "-":
+                    value = ip_to_int(extra)
+                    # ключ — ip_int: выданный VPN адрес совпадает с тем же адресом клиента в proxy
+                    ips.append((extra, value if value is not None else extra))
+        for ip, key in ips:
+            state = episodes.get(key)
+            if state is None or ts - state[1] > window:
+                node = add()
+                labels.append(("ip", ip))
+                state = episodes[key] = [node, ts]
+            else:
+                state[1] = ts
+            node = state[0]
+            if ranges is not None and is_shared(key, ip):
+                if fallback < 0:
+                    fallback = node
+            elif anchor < 0:
+                anchor = node
+            else:
+                union(anchor, node)
+        event_node[i] = anchor if anchor >= 0 else fallback
+
+    untimed = [i for i, ev in enumerate(events) if ev.ts_us is None]
+    for i in untimed:
+        user = events[i].user
+        if user:
+            event_node[i] = user_node(user)
+
+    # кластеры по корням; события — в порядке времени, без времени — в конце
+    find = dsu.find
+    roots = [find(node) for node in range(len(dsu))]
+    clusters: Dict[int, Actor] = {}
+    for node, (kind, value) in enumerate(labels):
+        root = roots[node]
+        actor = clusters.get(root)
+        if actor is None:
+            actor = clusters[root] = Actor(0, [], [])
+        (actor.users if kind == "user" else actor.ips).append(value)
+    source_sets: Dict[int, set] = {root: set() for root in clusters}
+    class_sets: Dict[int, set] = {root: set() for root in clusters}
+    for i in timed + untimed:
+        node = event_node[i]
+        if node < 0:
+            continue
+        root = roots[node]
+        actor = clusters[root]
+        ev = events[i]
+        actor.events.append(ev)
+        ts = ev.ts_us
+        if ts is not None:
+            if actor.first_us is None:
+                actor.first_us = ts
+            actor.last_us = ts
+        source_sets[root].add(ev.source)
+        if ev.evidential_class:
+            class_sets[root].add(ev.evidential_class)
+
+    actors = []
+    for root, actor in clusters.items():
+        if not actor.events:
+            continue
+        actor.users = sorted(set(actor.users))
+        actor.ips = sorted(set(actor.ips))
+        actor.sources = sorted(source_sets[root])
+        actor.classes = sorted(class_sets[root])
+        actors.append(actor)
+    actors.sort(key=lambda a: (-a.identities, -len(a.events), a.first_us or 0))
+    for n, actor in enumerate(actors, 1):
+        actor.id = n
+    return actors
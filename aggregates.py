@@ -0,0 +1,158 @@
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from models import LogEvent
+from sketches import EventSketches
+from timeutil import US_PER_MINUTE
+
+WEAK_CLASSES = ("C", "D")
+WEAK_TRACES_LIMIT = 20
+
+
+def minute_index(ts: datetime) -> int:
+    # Номер минуты от начала эпохи proleptic-календаря (без учёта часового пояса).
+    return ts.toordinal() * 1440 + ts.hour * 60 + ts.minute
+
+
+def minute_to_datetime(idx: int) -> datetime:
+    day, minute = divmod(idx, 1440)
+    return datetime.fromordinal(day) + timedelta(minutes=minute)
+
+
+@dataclass
+class EventAggregates:
+    # Сводные показатели по событиям, собираемые за один проход
+    # (или инкрементально по мере классификации).
+    total: int = 0
+    class_counts: Counter = field(default_factory=Counter)
+    source_counts: Counter = field(default_factory=Counter)
+    event_type_counts: Counter = field(default_factory=Counter)
+    # ключ — начало часа (datetime с обнулёнными минутами и секундами)
+    hour_counts: Counter = field(default_factory=Counter)
+    # класс -> Counter{номер минуты: количество событий}
+    minute_counts: Dict[str, Counter] = field(default_factory=dict)
+    weak_limit: int = WEAK_TRACES_LIMIT
+    weak_total: int = 0
+    weak_traces: List[LogEvent] = field(default_factory=list)
+    # вероятностные сводки (различные пользователи/IP, частые значения); None — не собираются
+    sketches: Optional[EventSketches] = None
+
+    def add(self, ev: LogEvent) -> None:
+        self.total += 1
+        cls = ev.evidential_class
+        if cls:
+            self.class_counts[cls] += 1
+        self.source_counts[ev.source] += 1
+        self.event_type_counts[ev.event_type] += 1
+        ts = ev.timestamp
+        if ts is not None:
+            self.hour_counts[ts.replace(minute=0, second=0, microsecond=0)] += 1
+            per_class = self.minute_counts.get(cls)
+            if per_class is None:
+                per_class = self.minute_counts[cls] = Counter()
+            per_class[minute_index(ts)] += 1
+        if cls in WEAK_CLASSES:
+            self.weak_total += 1
+            if len(self.weak_traces) < self.weak_limit:
+                self.weak_traces.append(ev)
+        if self.sketches is not None:
+            self.sketches.add(ev)
+
+    def update(self, events: Iterable[LogEvent]) -> None:
+        for ev in events:
+            self.add(ev)
+
+    def merge(self, other: "EventAggregates") -> None:
+        # Добавить итоги другой части тех же данных (частичные итоги узлов
+        # распределённого разбора); слабые следы — до weak_limit.
+        self.total += other.total
+        self.class_counts.update(other.class_counts)
+        self.source_counts.update(other.source_counts)
+        self.event_type_counts.update(other.event_type_counts)
+        self.hour_counts.update(other.hour_counts)
+        for cls, counts in other.minute_counts.items():
+            per_class = self.minute_counts.get(cls)
+            if per_class is None:
+                self.minute_counts[cls] = Counter(counts)
+            else:
+                per_class.update(counts)
+        self.weak_total += other.weak_total
+        room = self.weak_limit - len(self.weak_traces)
+        if room > 0:
+            self.weak_traces.extend(other.weak_traces[:room])
+        if other.sketches is not None:
+            if self.sketches is None:
+                self.sketches = EventSketches(other.sketches.precision)
+            self.sketches.merge(other.sketches)
+
+    def class_stats(self) -> Dict[str, int]:
+        return dict(self.class_counts)
+
+    def source_stats(self) -> Dict[str, int]:
+        return dict(self.source_counts)
+
+
+def compute_aggregates(
+    events: Iterable[LogEvent], weak_limit: int = WEAK_TRACES_LIMIT, sketches: bool = False
+) -> EventAggregates:
+    # Все гистограммы и выборка слабых следов за один проход по событиям
+    # (с sketches=True — и вероятностные сводки).
+    agg = EventAggregates(weak_limit=weak_limit, sketches=EventSketches() if sketches else None)
+    agg.update(events)
+    return agg
+
+
+def timeline_by_class(
+    aggregates: EventAggregates, max_points: int
+) -> Tuple[List[datetime], Dict[str, List[int]], int]:
+    # Поминутный таймлайн по классам, прореженный до max_points точек
+    # (обычно — ширина области графика в пикселях). Возвращает начала
+    # интервалов, ряды по классам и ширину интервала в минутах.
+    minutes = [m for c in aggregates.minute_counts.values() for m in c]
+    if not minutes:
+        return [], {}, 1
+    first, last = min(minutes), max(minutes)
+    span = last - first + 1
+    max_points = max(1, max_points)
+    step = -(-span // max_points)  # деление с округлением вверх
+    n_bins = -(-span // step)
+
+    series: Dict[str, List[int]] = {}
+    for cls in sorted(aggregates.minute_counts):
+        bins = [0] * n_bins
+        for m, cnt in aggregates.minute_counts[cls].items():
+            bins[(m - first) // step] += cnt
+        series[cls or "—"] = bins
+    starts = [minute_to_datetime(first + i * step) for i in range(n_bins)]
+    return starts, series, step
+
+
+@dataclass
+class MinuteGroup:
+    # События цепочки одной минуты, одного источника и типа (свёрнутая строка хронологии).
+    minute_us: Optional[int]   # начало минуты, мкс UTC; None — события без времени
+    source: str
+    event_type: str
+    first_index: int           # индекс первого события группы в исходном списке
+    count: int = 0
+    classes: Counter = field(default_factory=Counter)
+
+
+def minute_groups(events: List[LogEvent]) -> List[MinuteGroup]:
+    # Свёртка цепочки событий (сессии) по (минута, источник, тип события)
+    # за один проход; группы — по времени, события без времени — в конце.
+    groups: Dict[tuple, MinuteGroup] = {}
+    for i, ev in enumerate(events):
+        ts = ev.ts_us
+        minute = ts - ts % US_PER_MINUTE if ts is not None else None
+        key = (minute, ev.source, ev.event_type)
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = MinuteGroup(minute, ev.source, ev.event_type, i)
+        group.count += 1
+        group.classes[ev.evidential_class] += 1
+    return sorted(
+        groups.values(),
+        key=lambda g: (g.minute_us is None, g.minute_us or 0, g.first_index),
+    )
@@ -0,0 +1,78 @@
+# Замер времени импорта main.py через `python -X importtime`.
+#
+# Запуск:
+#     python bench_startup.py [--budget-ms 250] [--runs 5]
+#
+# Завершается с ненулевым кодом, если медианное кумулятивное время импорта
+# main превышает бюджет или если при старте подгружаются тяжёлые модули,
+# которые должны импортироваться лениво.
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List
+
+# Модули, которые не должны загружаться до первого обращения к ним
+LAZY_MODULES = ("matplotlib", "generator", "reports", "parsers")
+
+DEFAULT_BUDGET_MS = 250.0
+
+
+def measure_once(module: str = "main") -> Dict[str, int]:
+    # Один холодный запуск интерпретатора: {модуль: кумулятивное время, мкс}.
+    here = os.path.dirname(os.path.abspath(__file__))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=here,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr else "import failed")
+
+    result: Dict[str, int] = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        try:
+            cumulative = int(parts[1].strip())
+        except ValueError:
+            continue  # строка заголовка
+        result[parts[2].strip()] = cumulative
+    return result
+
+
+def main(argv: List[str] = None) -> int:
+    ap = argparse.ArgumentParser(description="Замер времени старта LogClass")
+    ap.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    ap.add_argument("--runs", type=int, default=5)
+    args = ap.parse_args(argv)
+
+    timings: List[float] = []
+    loaded = set()
+    for _ in range(max(1, args.runs)):
+        data = measure_once()
+        timings.append(data.get("main", 0) / 1000.0)
+        loaded.update(name.split(".")[0] for name in data)
+
+    median_ms = statistics.median(timings)
+    print(f"import main: медиана {median_ms:.1f} мс, мин {min(timings):.1f} мс "
+          f"(бюджет {args.budget_ms:.0f} мс, запусков {len(timings)})")
+
+    failed = False
+    eager = [m for m in LAZY_MODULES if m in loaded]
+    if eager:
+        print(f"ОШИБКА: при старте загружаются модули: {', '.join(eager)}")
+        failed = True
+    if median_ms > args.budget_ms:
+        print("ОШИБКА: время старта превышает бюджет")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,385 @@
+import json
+import mmap
+import struct
+import sys
+import zlib
+from array import array
+from dataclasses import asdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from models import LogEvent, Session
+from config_manager import Config, config_from_dict
+from correlator import NO_TIME_LAST
+from custody import CustodyLog, FileCustody
+from rawstore import RawLineStore
+from netinfo import ip_to_int
+from timeutil import from_micros
+
+# Файл дела (.lcase): снимок событий, сессий, конфигурации и служебных данных.
+#
+# Структура:
+#   заголовок  <8s H H I>: MAGIC, версия формата, флаги (резерв), длина оглавления
+#   оглавление JSON: {"byteorder": ..., "sections": {имя: [смещение, длина, исходная длина(, способ)]}}
+#   секции     каждая сжата zlib независимо от остальных (способ 0 — записана как есть);
+#              смещение — от конца оглавления
+#
+# События хранятся по столбцам: строковые поля с малым числом значений —
+# словарём и массивом кодов, время — массивом целых микросекунд UTC, details —
+# отдельным сжатым блоком. Исходные строки (с версии 2) — сжатыми блоками
+# хранилища строк (rawstore) как есть, у событий — номера строк: при открытии
+# блоки принимаются в хранилище без распаковки и пересжатия. В делах версии 1
+# строки лежат одной секцией текста. Файл открывается через mmap, а секции
+# распаковываются только при обращении к ним.
+#
+# Журнал хранения (custody): записи о файлах — JSON, смещения блоков и хэши
+# блоков — общими массивами; ссылки событий на блоки — два столбца. В делах,
+# сохранённых до появления журнала, этих секций нет — журнал пуст.
+
+MAGIC = b"LOGCASE\0"
+FORMAT_VERSION = 2
+HEADER = struct.Struct("<8sHHI")
+CASE_EXTENSION = ".lcase"
+
+NO_TIME = -(2 ** 63)
+NO_SESSION = -1
+NO_BLOCK = -1
+
+# поля событий, кодируемые словарём (код 0 — None)
+DICT_COLUMNS = ("source", "event_type", "user", "ip", "evidential_class", "notes")
+# секции, которые уже сжаты и записываются как есть
+STORED_SECTIONS = ("raw.blocks",)
+
+
+class CaseFormatError(ValueError):
+    pass
+
+
+def _encode_dict_column(values: List[Optional[str]]) -> Tuple[List[Optional[str]], array]:
+    vocab: List[Optional[str]] = [None]
+    lookup: Dict[Optional[str], int] = {None: 0}
+    codes = array("I")
+    append = codes.append
+    for v in values:
+        code = lookup.get(v)
+        if code is None:
+            code = lookup[v] = len(vocab)
+            vocab.append(v)
+        append(code)
+    return vocab, codes
+
+
+def save_case(
+    path: str,
+    events: List[LogEvent],
+    sessions: List[Session],
+    cfg: Config,
+    instrumentation: Optional[Dict[str, Any]] = None,
+    level: int = 6,
+    custody: Optional[CustodyLog] = None,
+    raw: Optional[RawLineStore] = None,
+) -> None:
+    # Сохранить дело в файл. raw — хранилище строк событий, упакованных в него.
+    sections: Dict[str, bytes] = {}
+
+    for name in DICT_COLUMNS:
+        vocab, codes = _encode_dict_column([getattr(ev, name) or None for ev in events])
+        sections[f"ev.{name}.vocab"] = json.dumps(vocab, ensure_ascii=False).encode("utf-8")
+        sections[f"ev.{name}.codes"] = codes.tobytes()
+
+    sections["ev.timestamp"] = array(
+        "q", (ev.ts_us if ev.ts_us is not None else NO_TIME for ev in events)
+    ).tobytes()
+    sections["ev.session_id"] = array(
+        "q", (ev.session_id if ev.session_id is not None else NO_SESSION for ev in events)
+    ).tobytes()
+    if raw is not None and all(ev.raw_line is None for ev in events):
+        # строки уже в хранилище: блоки сохраняются сжатыми, у событий — номера строк
+        blocks, offsets, _first, pending, raw_bytes = raw.snapshot()
+        sections["raw.blocks"] = b"".join(blocks)
+        sections["raw.block_sizes"] = array("q", map(len, blocks)).tobytes()
+        sections["raw.block_lines"] = array("q", (len(o) - 1 for o in offsets)).tobytes()
+        sections["raw.offsets"] = b"".join(o.tobytes() for o in offsets)
+        sections["raw.pending"] = b"\n".join(pending)
+        sections["raw.meta"] = json.dumps({"raw_bytes": raw_bytes, "pending": len(pending)}).encode("utf-8")
+        sections["ev.raw_ref"] = array("q", (ev.raw_ref for ev in events)).tobytes()
+    else:
+        line = raw.line if raw is not None else (lambda ev: ev.raw_line)
+        sections["ev.raw_line"] = "\n".join(map(line, events)).encode("utf-8")
+    sections["ev.details"] = "\n".join(
+        json.dumps(dict(ev.details), ensure_ascii=False, separators=(",", ":")) for ev in events
+    ).encode("utf-8")
+
+    if custody is not None and len(custody):
+        refs = [ev.block_ref for ev in events]
+        sections["ev.block_file"] = array("i", (r[0] if r else NO_BLOCK for r in refs)).tobytes()
+        sections["ev.block"] = array("i", (r[1] if r else NO_BLOCK for r in refs)).tobytes()
+        sections["custody"] = json.dumps(
+            [dict(rec.to_dict(), blocks=rec.blocks) for rec in custody], ensure_ascii=False
+        ).encode("utf-8")
+        sections["custody.offsets"] = array("q", (o for rec in custody for o in rec.offsets)).tobytes()
+        sections["custody.leaves"] = b"".join(leaf for rec in custody for leaf in rec.leaves)
+
+    sections["sessions"] = json.dumps(
+        [[s.id, s.key, s.key_type] for s in sessions], ensure_ascii=False
+    ).encode("utf-8")
+    sections["config"] = json.dumps(asdict(cfg), ensure_ascii=False).encode("utf-8")
+    meta = {
+        "event_count": len(events),
+        "session_count": len(sessions),
+        "saved_at": datetime.now().isoformat(timespec="seconds"),
+        "instrumentation": instrumentation or {},
+    }
+    sections["meta"] = json.dumps(meta, ensure_ascii=False).encode("utf-8")
+
+    compressed = {
+        name: data if name in STORED_SECTIONS else zlib.compress(data, level)
+        for name, data in sections.items()
+    }
+
+    # смещения в оглавлении отсчитываются от начала области секций
+    toc_sections: Dict[str, List[int]] = {}
+    offset = 0
+    for name, data in compressed.items():
+        toc_sections[name] = [offset, len(data), len(sections[name])]
+        if name in STORED_SECTIONS:
+            toc_sections[name].append(0)
+        offset += len(data)
+    toc_bytes = json.dumps({"byteorder": sys.byteorder, "sections": toc_sections}).encode("utf-8")
+
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, 0, len(toc_bytes)))
+        f.write(toc_bytes)
+        for data in compressed.values():
+            f.write(data)
+
+
+class CaseFile:
+    # Открытый файл дела: оглавление читается сразу, секции — по требованию.
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # пустой файл
+            self._file.close()
+            raise CaseFormatError("файл дела пуст")
+        if len(self._mm) < HEADER.size:
+            self.close()
+            raise CaseFormatError("файл дела повреждён")
+        magic, version, _flags, toc_len = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self.close()
+            raise CaseFormatError("это не файл дела LogClass")
+        if version > FORMAT_VERSION:
+            self.close()
+            raise CaseFormatError(f"версия файла дела {version} не поддерживается")
+        self.version = version
+        try:
+            toc = json.loads(bytes(self._mm[HEADER.size:HEADER.size + toc_len]).decode("utf-8"))
+            self._swap = toc.get("byteorder", sys.byteorder) != sys.byteorder
+            self._sections: Dict[str, List[int]] = toc["sections"]
+            if not isinstance(self._sections, dict):
+                raise TypeError("sections")
+        except (ValueError, KeyError, TypeError, AttributeError):
+            self.close()
+            raise CaseFormatError("оглавление файла дела повреждено")
+        self._data_start = HEADER.size + toc_len
+        self._cache: Dict[str, bytes] = {}
+
+    def close(self) -> None:
+        mm = getattr(self, "_mm", None)
+        if mm is not None:
+            mm.close()
+            self._mm = None
+        self._file.close()
+
+    def __enter__(self) -> "CaseFile":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    @property
+    def section_names(self) -> List[str]:
+        return list(self._sections)
+
+    def section(self, name: str) -> bytes:
+        data = self._cache.get(name)
+        if data is None:
+            try:
+                offset, length, _raw_len, *method = self._sections[name]
+            except KeyError:
+                raise CaseFormatError(f"в файле дела нет секции {name}")
+            except (ValueError, TypeError):
+                raise CaseFormatError(f"оглавление файла дела повреждено (секция {name})")
+            start = self._data_start + offset
+            if start + length > len(self._mm):
+                raise CaseFormatError(f"секция {name} обрезана")
+            if method and method[0] == 0:
+                data = self._mm[start:start + length]
+            else:
+                try:
+                    data = zlib.decompress(self._mm[start:start + length])
+                except zlib.error:
+                    raise CaseFormatError(f"секция {name} повреждена")
+            self._cache[name] = data
+        return data
+
+    def _json(self, name: str) -> Any:
+        return json.loads(self.section(name).decode("utf-8"))
+
+    def _array(self, name: str, typecode: str) -> array:
+        arr = array(typecode)
+        arr.frombytes(self.section(name))
+        if self._swap:
+            arr.byteswap()
+        return arr
+
+    @property
+    def meta(self) -> Dict[str, Any]:
+        return self._json("meta")
+
+    def config(self) -> Config:
+        return config_from_dict(self._json("config"))
+
+    def raw_store(self, store: RawLineStore) -> None:
+        # Принять сохранённые блоки строк в пустое хранилище (дело версии 2).
+        sizes = self._array("raw.block_sizes", "q")
+        lines = self._array("raw.block_lines", "q")
+        blocks_data = self.section("raw.blocks")
+        offsets_all = self._array("raw.offsets", "I")
+        info = self._json("raw.meta")
+        blocks: List[bytes] = []
+        offsets: List[array] = []
+        first = array("q")
+        pos = opos = line_no = 0
+        if len(sizes) != len(lines):
+            raise CaseFormatError("хранилище строк в файле дела повреждено")
+        for size, count in zip(sizes, lines):
+            blocks.append(blocks_data[pos:pos + size])
+            offsets.append(offsets_all[opos:opos + count + 1])
+            first.append(line_no)
+            pos += size
+            opos += count + 1
+            line_no += count
+        if pos != len(blocks_data) or opos != len(offsets_all):
+            raise CaseFormatError("хранилище строк в файле дела повреждено")
+        pending = self.section("raw.pending").split(b"\n") if info["pending"] else []
+        store.adopt(blocks, offsets, first, pending, info["raw_bytes"])
+
+    def events(self, raw: Optional[RawLineStore] = None) -> List[LogEvent]:
+        # С raw исходные строки сразу оказываются в хранилище (у событий — raw_ref):
+        # в пустое хранилище блоки дела принимаются как есть.
+        n = self.meta["event_count"]
+        columns = {}
+        ip_ints: List[Optional[int]] = []
+        for name in DICT_COLUMNS:
+            vocab = self._json(f"ev.{name}.vocab")
+            codes = self._array(f"ev.{name}.codes", "I")
+            columns[name] = [vocab[c] for c in codes]
+            if name == "ip":
+                # числовой IP — один раз на значение словаря, а не на событие
+                int_vocab = [ip_to_int(v) if v else None for v in vocab]
+                ip_ints = [int_vocab[c] for c in codes]
+        times = self._array("ev.timestamp", "q")
+        session_ids = self._array("ev.session_id", "q")
+        raw_lines: Optional[List[str]] = None
+        raw_refs = None
+        if "ev.raw_ref" in self._sections:
+            refs = self._array("ev.raw_ref", "q")
+            store = raw if raw is not None and not len(raw) else RawLineStore()
+            self.raw_store(store)
+            if store is raw:
+                raw_refs = refs
+            else:
+                raw_lines = [store.get(r) for r in refs]
+        else:
+            raw_lines = self.section("ev.raw_line").decode("utf-8").split("\n") if n else []
+        # details — по объекту JSON в строке; переводы строк внутри значений
+        # экранированы, поэтому вся секция разбирается одним вызовом как массив
+        details = json.loads("[" + self.section("ev.details").decode("utf-8").replace("\n", ",") + "]") if n else []
+        lines_count = len(raw_refs) if raw_refs is not None else len(raw_lines)
+        if not (len(times) == len(session_ids) == lines_count == len(details) == len(ip_ints) == n):
+            raise CaseFormatError("число записей в секциях событий не совпадает")
+        block_files = block_nos = None
+        if "ev.block" in self._sections:
+            block_files = self._array("ev.block_file", "i")
+            block_nos = self._array("ev.block", "i")
+            if not (len(block_files) == len(block_nos) == n):
+                raise CaseFormatError("число записей в секциях событий не совпадает")
+
+        sources, event_types = columns["source"], columns["event_type"]
+        users, ips = columns["user"], columns["ip"]
+        classes, notes = columns["evidential_class"], columns["notes"]
+        if raw is not None and raw_refs is None:
+            raw_refs = [raw.add(line) for line in raw_lines]
+            raw_lines = None
+        events: List[LogEvent] = []
+        append = events.append
+        for i in range(n):
+            sid = session_ids[i]
+            us = times[i]
+            if us == NO_TIME:
+                us = None
+            append(LogEvent(
+                source=sources[i],
+                raw_line=raw_lines[i] if raw_refs is None else None,
+                timestamp=from_micros(us) if us is not None else None,
+                ip=ips[i],
+                user=users[i],
+                event_type=event_types[i],
+                details=details[i],
+                evidential_class=classes[i] or "",
+                notes=notes[i] or "",
+                session_id=sid if sid != NO_SESSION else None,
+                ts_us=us,
+                ip_int=ip_ints[i],
+                block_ref=None if block_nos is None or block_nos[i] == NO_BLOCK else (block_files[i], block_nos[i]),
+                raw_ref=raw_refs[i] if raw_refs is not None else None,
+            ))
+        return events
+
+    def custody(self) -> CustodyLog:
+        log = CustodyLog()
+        if "custody" not in self._sections:
+            return log
+        offsets = self._array("custody.offsets", "q")
+        leaves = self.section("custody.leaves")
+        pos = 0
+        for item in self._json("custody"):
+            blocks = item.pop("blocks")
+            rec = FileCustody(**item)
+            rec.offsets = list(offsets[pos:pos + blocks])
+            rec.leaves = [leaves[32 * j:32 * j + 32] for j in range(pos, pos + blocks)]
+            pos += blocks
+            log.files.append(rec)
+        if pos != len(offsets) or 32 * pos != len(leaves):
+            raise CaseFormatError("журнал хранения повреждён")
+        return log
+
+    def sessions(self, events: List[LogEvent]) -> List[Session]:
+        # Сессии восстанавливаются по session_id событий в том же порядке,
+        # в котором их собирает build_sessions (стабильная сортировка по времени).
+        sessions = [Session(id=sid, key=key, key_type=key_type) for sid, key, key_type in self._json("sessions")]
+        by_id = {s.id: s for s in sessions}
+        for ev in sorted(events, key=lambda e: e.ts_us if e.ts_us is not None else NO_TIME_LAST):
+            if ev.session_id is not None:
+                sess = by_id.get(ev.session_id)
+                if sess is not None:
+                    sess.events.append(ev)
+        return sessions
+
+
+def load_case(
+    path: str, raw: Optional[RawLineStore] = None
+) -> Tuple[List[LogEvent], List[Session], Config, Dict[str, Any], CustodyLog]:
+    # Загрузить дело целиком: события, сессии, конфигурацию, служебные данные и журнал хранения.
+    # С raw исходные строки событий переносятся в хранилище строк.
+    with CaseFile(path) as case:
+        events = case.events(raw)
+        sessions = case.sessions(events)
+        cfg = case.config()
+        meta = case.meta
+        custody = case.custody()
+    return events, sessions, cfg, meta, custody
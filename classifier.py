@@ -1,55 +1,57 @@
-from typing import List, Dict
+from typing import List, Dict, Optional
 from collections import Counter
 from models import LogEvent
 from config_manager import Config
+from aggregates import EventAggregates
+from corroboration import Corroboration
+from rule_engine import compiled_rules
 
 def classify_event(event: LogEvent, cfg: Config) -> None:
     # Классификация события по юридической значимости (класс A/B/C/D).
-    w = cfg.scoring
-    score = 0
-    reasons = []
+    # Правила (базовые веса из ScoringWeights и пользовательские из rules.json)
+    # заранее скомпилированы в функции, специализированные по источнику.
+    compiled_rules(cfg).classify(event)
 
-    if event.user:
-        score += w.weight_user
-        reasons.append("есть учётная запись пользователя")
 
-    if event.ip:
-        score += w.weight_ip
-        reasons.append("записан IP-адрес клиента")
+def corroboration_reason(sources: List[str]) -> str:
+    return f"подтверждено другими источниками: {', '.join(sources)}"
 
-    if event.source == "vpn":
-        score += w.weight_vpn_source
-        reasons.append("событие на VPN-сервере (обычно связка учётка-IP более надёжна)")
 
-    if event.event_type in ("AUTH_SUCCESS", "AUTH_FAILURE", "AUTH_ATTEMPT"):
-        score += w.weight_auth_event
-        reasons.append("аутентификация / попытка входа")
-
-    if event.event_type in ("ACCESS_SENSITIVE", "FILE_TRANSFER", "CONFIG_CHANGE"):
-        score += w.weight_sensitive_event
-        reasons.append("доступ к чувствительному ресурсу или изменение конфигурации")
-
-    if event.timestamp is None:
-        score += w.penalty_no_time
-        reasons.append("не удалось однозначно определить время события")
-
-    if score >= 4:
-        event.evidential_class = "A"
-    elif score >= 2:
-        event.evidential_class = "B"
-    elif score >= 1:
-        event.evidential_class = "C"
-    else:
-        event.evidential_class = "D"
-        if not reasons:
-            reasons.append("недостаточно данных для уверенной юридической оценки")
-
-    event.notes = "; ".join(reasons)
-
-
-def classify_events(events: List[LogEvent], cfg: Config) -> None:
+def classify_events(
+    events: List[LogEvent],
+    cfg: Config,
+    aggregates: Optional[EventAggregates] = None,
+    corroboration: Optional[Corroboration] = None,
+) -> None:
+    # Если передан aggregates — статистика собирается в том же проходе.
+    # С corroboration подтверждённые другими источниками события получают
+    # бонус scoring.corroboration_bonus к баллам и пояснение.
+    rules = compiled_rules(cfg)
+    by_source = rules.by_source
+    default = rules.default
+    bonus = cfg.scoring.corroboration_bonus
+    if corroboration is not None and bonus:
+        reasons: Dict[int, str] = {}
+        add = aggregates.add if aggregates is not None else None
+        for ev, mask in zip(events, corroboration.masks):
+            if mask:
+                reason = reasons.get(mask)
+                if reason is None:
+                    reason = reasons[mask] = corroboration_reason(corroboration.sources_of(mask))
+                by_source.get(ev.source, default)(ev, bonus, reason)
+            else:
+                by_source.get(ev.source, default)(ev)
+            if add is not None:
+                add(ev)
+        return
+    if aggregates is None:
+        for ev in events:
+            by_source.get(ev.source, default)(ev)
+        return
+    add = aggregates.add
     for ev in events:
-        classify_event(ev, cfg)
+        by_source.get(ev.source, default)(ev)
+        add(ev)
 
 
 def compute_class_stats(events: List[LogEvent]) -> Dict[str, int]:
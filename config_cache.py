@@ -0,0 +1,31 @@
+import weakref
+from typing import Any, Dict, Generic, Optional, Tuple, TypeVar
+
+# Производные данные конфигурации (скомпилированные правила, справочник сетей)
+# хранятся не в самом Config, а в кэше по объекту конфигурации: в asdict /
+# save_config и в снимки дела они не попадают, а копия конфигурации (например,
+# вариант в «Что если…») начинает с пустого кэша и строит свои данные сама.
+# Запись удаляется, когда объект конфигурации собран сборщиком мусора.
+
+T = TypeVar("T")
+
+
+class ConfigCache(Generic[T]):
+    def __init__(self):
+        self._entries: Dict[int, Tuple[weakref.ref, T]] = {}
+
+    def get(self, cfg: Any) -> Optional[T]:
+        entry = self._entries.get(id(cfg))
+        if entry is None or entry[0]() is not cfg:
+            return None
+        return entry[1]
+
+    def set(self, cfg: Any, value: T) -> T:
+        key = id(cfg)
+        entries = self._entries
+        entries[key] = (weakref.ref(cfg, lambda _ref: entries.pop(key, None)), value)
+        return value
+
+    def discard(self, cfg: Any) -> None:
+        if self.get(cfg) is not None:
+            del self._entries[id(cfg)]
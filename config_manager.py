@@ -1,7 +1,8 @@
 import json
 import os
 from dataclasses import dataclass, field, asdict
-from typing import Dict, List
+from typing import Any, Dict, List
+from rule_engine import recompile_rules
 
 CONFIG_FILE = "rules.json"
 
@@ -14,6 +15,10 @@ class ScoringWeights:
     weight_auth_event: int = 1
     weight_sensitive_event: int = 1
     penalty_no_time: int = -1
+    # бонус событию, подтверждённому другим источником (0 — не учитывать);
+    # применяется при загрузке в программу; сетевой приём и распределённый
+    # разбор его не применяют и отмечают это в своих итогах
+    corroboration_bonus: int = 1
 
 
 @dataclass
@@ -26,14 +31,52 @@ class Config:
         "/login", "/signin", "auth", "authenticate"
     ])
     file_transfer_threshold: int = 100_000  # байт
+    # шумовые строки (health-check, статика): подстроки исходной строки лога,
+    # такие строки отбрасываются до разбора и считаются отдельно от пропущенных
+    noise_patterns: List[str] = field(default_factory=list)
     session_window_minutes: int = 30
-    # смещение времени (минуты) для разных источников
+    # сессии по IP: адреса с общим префиксом такой длины — один участник
+    # (32 / 128 — каждый адрес отдельно)
+    session_prefix_v4: int = 32
+    session_prefix_v6: int = 128
+    # участники: пользователи и адреса, встречающиеся вместе в пределах окна, — один кластер
+    actor_window_minutes: int = 30
+    # подтверждение другими источниками: события с тем же пользователем или IP
+    # (включая выданный VPN адрес) не дальше этого окна друг от друга
+    corroboration_window_minutes: int = 10
+    # справочник сетей (CSV: cidr,site,owner,nat,tag); адреса NAT-пулов
+    # объединяются в сессии по сети целиком
+    ip_ranges_file: str = ""
+    # быстрая оценка (triage): доля каждого файла, читаемая выборочно, и уровень доверия интервалов
+    triage_fraction: float = 0.01
+    triage_confidence: float = 0.95
+    # триграммный индекс исходных строк для поиска text= / re= (строится при загрузке;
+    # без него поиск просматривает все строки)
+    text_index: bool = True
+    # потоковая корреляция: насколько событие может отставать от самого позднего
+    # уже принятого времени и всё ещё попасть в свою сессию
+    allowed_lateness_minutes: int = 5
+    # часовой пояс для строк логов без явной зоны: 'UTC', 'local', '+03:00'
+    # или имя IANA ('Europe/Moscow'); time_zones — по источникам (пусто — по умолчанию)
+    default_time_zone: str = "UTC"
+    time_zones: Dict[str, str] = field(default_factory=dict)
+    # поправка часов источника (минуты) поверх часового пояса
     time_offsets_minutes: Dict[str, int] = field(default_factory=lambda: {
         "web": 0,
         "proxy": 0,
         "vpn": 0,
     })
     scoring: ScoringWeights = field(default_factory=ScoringWeights)
+    # пороги баллов для классов значимости (ниже порога C — класс D)
+    class_thresholds: Dict[str, int] = field(default_factory=lambda: {
+        "A": 4,
+        "B": 2,
+        "C": 1,
+    })
+    # базовые правила на весах из scoring (можно отключить и описать всё в rules)
+    use_builtin_rules: bool = True
+    # пользовательские правила классификации (формат — см. rule_engine.py)
+    rules: List[Dict[str, Any]] = field(default_factory=list)
     # юридические описания классов значимости
     class_descriptions: Dict[str, str] = field(default_factory=lambda: {
         "A": "Сильный цифровой след: однозначная связка учётной записи, IP-адреса и времени, "
@@ -65,7 +108,11 @@ def load_config(path: str = CONFIG_FILE) -> Config:
             data = json.load(f)
     except Exception:
         return DEFAULT_CONFIG
+    return config_from_dict(data)
+
 
+def config_from_dict(data: Dict[str, Any]) -> Config:
+    # Собрать Config из словаря (rules.json или снимок конфигурации в файле дела).
     def get(key, default):
         return data.get(key, default)
 
@@ -73,8 +120,20 @@ def load_config(path: str = CONFIG_FILE) -> Config:
     cfg.sensitive_keywords = get("sensitive_keywords", cfg.sensitive_keywords)
     cfg.auth_keywords = get("auth_keywords", cfg.auth_keywords)
     cfg.file_transfer_threshold = get("file_transfer_threshold", cfg.file_transfer_threshold)
+    cfg.noise_patterns = get("noise_patterns", cfg.noise_patterns)
     cfg.session_window_minutes = get("session_window_minutes", cfg.session_window_minutes)
+    cfg.session_prefix_v4 = get("session_prefix_v4", cfg.session_prefix_v4)
+    cfg.session_prefix_v6 = get("session_prefix_v6", cfg.session_prefix_v6)
+    cfg.ip_ranges_file = get("ip_ranges_file", cfg.ip_ranges_file)
+    cfg.actor_window_minutes = get("actor_window_minutes", cfg.actor_window_minutes)
+    cfg.corroboration_window_minutes = get("corroboration_window_minutes", cfg.corroboration_window_minutes)
+    cfg.triage_fraction = get("triage_fraction", cfg.triage_fraction)
+    cfg.triage_confidence = get("triage_confidence", cfg.triage_confidence)
+    cfg.text_index = bool(get("text_index", cfg.text_index))
+    cfg.allowed_lateness_minutes = get("allowed_lateness_minutes", cfg.allowed_lateness_minutes)
     cfg.time_offsets_minutes = get("time_offsets_minutes", cfg.time_offsets_minutes)
+    cfg.default_time_zone = get("default_time_zone", cfg.default_time_zone)
+    cfg.time_zones = get("time_zones", cfg.time_zones)
 
     scoring_data = data.get("scoring", {})
     scoring = ScoringWeights()
@@ -84,12 +143,24 @@ def load_config(path: str = CONFIG_FILE) -> Config:
     scoring.weight_auth_event = scoring_data.get("weight_auth_event", scoring.weight_auth_event)
     scoring.weight_sensitive_event = scoring_data.get("weight_sensitive_event", scoring.weight_sensitive_event)
     scoring.penalty_no_time = scoring_data.get("penalty_no_time", scoring.penalty_no_time)
+    scoring.corroboration_bonus = scoring_data.get("corroboration_bonus", scoring.corroboration_bonus)
     cfg.scoring = scoring
 
+    thresholds = data.get("class_thresholds")
+    if isinstance(thresholds, dict):
+        cfg.class_thresholds.update(thresholds)
+    cfg.use_builtin_rules = bool(get("use_builtin_rules", cfg.use_builtin_rules))
+    rules = data.get("rules")
+    if isinstance(rules, list):
+        cfg.rules = rules
+
     # юридические описания классов — обновляем только тем, что есть в файле
     cd = data.get("class_descriptions")
     if isinstance(cd, dict):
         cfg.class_descriptions.update(cd)
+
+    # правила компилируются один раз при загрузке; ошибки — в compiled_rules(cfg).errors
+    recompile_rules(cfg)
     return cfg
 
 def save_config(config: Config, path: str = CONFIG_FILE) -> None:
@@ -1,45 +1,199 @@
-from typing import List, Dict
-from datetime import timedelta
+import heapq
+from typing import Callable, List, Dict, Optional, Tuple
+from datetime import datetime
 from models import LogEvent, Session
 from config_manager import Config
+from netinfo import ip_ranges, is_v4, network_name, prefix_mask
+from timeutil import US_PER_MINUTE, from_micros
 
-def build_sessions(events: List[LogEvent], cfg: Config) -> List[Session]:
-    # Объединение событий в сессии по user/IP и окну времени.
-    events_sorted = sorted(
-        events,
-        key=lambda e: e.timestamp if e.timestamp is not None else 9999999999,
-    )
+SessionSink = Callable[[Session], None]
 
-    sessions: List[Session] = []
-    last_session_for_key: Dict[str, Session] = {}
+NO_TIME_LAST = 2 ** 63 - 1
 
-    window = timedelta(minutes=cfg.session_window_minutes)
-    session_id_counter = 1
-    for ev in events_sorted:
-        key_type = "user" if ev.user else "ip" if ev.ip else None
-        if key_type is None or ev.timestamp is None:
+
+class SessionKeyer:
+    # Ключ сессии события: пользователь, иначе IP. IP сравниваются целыми
+    # числами (LogEvent.ip_int); адрес из NAT-пула справочника сетей заменяется
+    # всей сетью, а при session_prefix_v4/v6 короче полного адреса — сетью
+    # этого префикса. Возвращает (ключ словаря, тип ключа, ключ для показа)
+    # или None, если ключа нет.
+
+    def __init__(self, cfg: Config):
+        self.ranges = ip_ranges(cfg)
+        self.prefix_v4 = 96 + min(max(cfg.session_prefix_v4, 0), 32)
+        self.prefix_v6 = min(max(cfg.session_prefix_v6, 0), 128)
+        self.mask_v4 = prefix_mask(self.prefix_v4)
+        self.mask_v6 = prefix_mask(self.prefix_v6)
+        self._names: Dict[Tuple[int, int], str] = {}
+
+    def __call__(self, ev: LogEvent) -> Optional[Tuple[object, str, str]]:
+        user = ev.user
+        if user:
+            return "user:" + user, "user", user
+        ip = ev.ip
+        if not ip:
+            return None
+        value = ev.ip_int
+        if value is None:  # не разобран как адрес — сравнивается строкой
+            return "ip:" + ip, "ip", ip
+        ranges = self.ranges
+        if ranges is not None:
+            rng = ranges.lookup(value)
+            if rng is not None and rng.nat:
+                return rng.key, "net", rng.cidr
+        if is_v4(value):
+            prefix, mask = self.prefix_v4, self.mask_v4
+        else:
+            prefix, mask = self.prefix_v6, self.mask_v6
+        if prefix == 128:
+            return value, "ip", ip
+        key = (value & mask, prefix)
+        name = self._names.get(key)
+        if name is None:
+            name = self._names[key] = network_name(*key)
+        return key, "net", name
+
+
+class SessionCorrelator:
+    # Инкрементальное объединение событий в сессии по user/IP и окну времени.
+    # События можно подавать по мере поступления; для каждого ключа хранится
+    # последняя сессия и её текущее время окончания.
+    #
+    # Без sink все сессии накапливаются в self.sessions (пакетный режим).
+    # С sink включается потоковый режим: водяной знак — самое позднее
+    # принятое время минус allowed_lateness; сессия, ключ которой простаивает
+    # дольше окна относительно водяного знака, завершается, передаётся в sink
+    # и забывается. Память растёт с числом активных ключей, а не с историей.
+    # События старше водяного знака считаются опоздавшими: они не попадают
+    # в сессии и передаются в on_late (если задан).
+    #
+    # Время сравнивается целыми микросекундами UTC (LogEvent.ts_us), ключи
+    # строятся SessionKeyer (IP — целыми числами, с учётом префикса и NAT-пулов).
+
+    def __init__(
+        self,
+        cfg: Config,
+        start_id: int = 1,
+        sink: Optional[SessionSink] = None,
+        on_late: Optional[Callable[[LogEvent], None]] = None,
+    ):
+        self.window = cfg.session_window_minutes * US_PER_MINUTE
+        self.allowed_lateness = cfg.allowed_lateness_minutes * US_PER_MINUTE
+        self.sink = sink
+        self.on_late = on_late
+        self.keyer = SessionKeyer(cfg)
+        self.sessions: List[Session] = []
+        self.last_session_for_key: Dict[object, Session] = {}
+        self.last_time_for_key: Dict[object, int] = {}
+        self.next_id = start_id
+        self.max_time: Optional[int] = None
+        self.finalized = 0
+        self.late = 0
+        # (время окончания на момент записи, id сессии, ключ); устаревшие записи пропускаются
+        self._expiry: List[Tuple[int, int, object]] = []
+
+    @property
+    def watermark(self) -> Optional[datetime]:
+        if self.max_time is None:
+            return None
+        return from_micros(self.max_time - self.allowed_lateness)
+
+    @property
+    def active_count(self) -> int:
+        return len(self.last_session_for_key)
+
+    def add(self, ev: LogEvent) -> Optional[Session]:
+        ts = ev.ts_us
+        keyed = self.keyer(ev) if ts is not None else None
+        if keyed is None:
             ev.session_id = None
-            continue
+            return None
 
-        key_val = ev.user if key_type == "user" else ev.ip
-        assert key_val is not None
+        streaming = self.sink is not None
+        if streaming:
+            if self.max_time is not None and ts < self.max_time - self.allowed_lateness:
+                self.late += 1
+                ev.session_id = None
+                if self.on_late is not None:
+                    self.on_late(ev)
+                return None
+            if self.max_time is None or ts > self.max_time:
+                self.max_time = ts
+                self._evict_idle(self.max_time - self.allowed_lateness)
 
-        key = f"{key_type}:{key_val}"
-        prev_session = last_session_for_key.get(key)
+        key, key_type, key_val = keyed
+        prev_session = self.last_session_for_key.get(key)
+        prev_end = self.last_time_for_key.get(key)
 
-        if prev_session and prev_session.end_time and ev.timestamp - prev_session.end_time <= window:
+        if prev_session is not None and ts - prev_end <= self.window:
             prev_session.events.append(ev)
             ev.session_id = prev_session.id
+            if ts > prev_end:
+                self.last_time_for_key[key] = ts
+            return prev_session
+
+        if streaming and prev_session is not None:
+            # новая сессия ключа — предыдущая больше не может пополниться
+            self._finalize(prev_session)
+
+        sess = Session(
+            id=self.next_id,
+            key=key_val,
+            key_type=key_type,
+            events=[ev],
+        )
+        if streaming:
+            heapq.heappush(self._expiry, (ts, sess.id, key))
         else:
-            sess = Session(
-                id=session_id_counter,
-                key=key_val,
-                key_type=key_type,
-                events=[ev],
-            )
-            sessions.append(sess)
-            ev.session_id = session_id_counter
-            last_session_for_key[key] = sess
-            session_id_counter += 1
-
-    return sessions
+            self.sessions.append(sess)
+        ev.session_id = sess.id
+        self.last_session_for_key[key] = sess
+        self.last_time_for_key[key] = ts
+        self.next_id += 1
+        return sess
+
+    def _evict_idle(self, watermark: int) -> None:
+        # Завершить сессии, чьи ключи простаивают дольше окна относительно водяного знака.
+        expiry = self._expiry
+        horizon = watermark - self.window
+        while expiry and expiry[0][0] < horizon:
+            _end, sess_id, key = heapq.heappop(expiry)
+            sess = self.last_session_for_key.get(key)
+            if sess is None or sess.id != sess_id:
+                continue  # сессия уже завершена
+            end = self.last_time_for_key[key]
+            if end < horizon:
+                del self.last_session_for_key[key]
+                del self.last_time_for_key[key]
+                self._finalize(sess)
+            else:
+                heapq.heappush(expiry, (end, sess_id, key))
+
+    def _finalize(self, sess: Session) -> None:
+        self.finalized += 1
+        self.sink(sess)
+
+    def close(self) -> None:
+        # Конец потока: завершить все активные сессии (в потоковом режиме).
+        if self.sink is None:
+            return
+        active = sorted(self.last_session_for_key.values(), key=lambda s: s.id)
+        self.last_session_for_key.clear()
+        self.last_time_for_key.clear()
+        self._expiry.clear()
+        for sess in active:
+            self._finalize(sess)
+
+
+def build_sessions(events: List[LogEvent], cfg: Config) -> List[Session]:
+    # Объединение событий в сессии по user/IP и окну времени.
+    # события без времени — в конце (в сессии они не попадают)
+    events_sorted = sorted(
+        events,
+        key=lambda e: e.ts_us if e.ts_us is not None else NO_TIME_LAST,
+    )
+
+    correlator = SessionCorrelator(cfg)
+    for ev in events_sorted:
+        correlator.add(ev)
+    return correlator.sessions
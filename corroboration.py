@@ -0,0 +1,128 @@
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from models import LogEvent
+from config_manager import Config
+from actors import ACTOR_IP_DETAILS
+from netinfo import ip_ranges, ip_to_int
+from timeutil import US_PER_MINUTE
+
+# Подтверждение событий другими источниками (corroboration).
+#
+# Событие подтверждено, если в пределах corroboration_window_minutes от него
+# есть событие другого источника с тем же пользователем или тем же IP-адресом;
+# адрес, выданный VPN (details.assigned_ip), считается адресом VPN-события,
+# поэтому вход по VPN подтверждает трафик proxy / web с выданного адреса.
+# Адреса NAT-пулов из справочника сетей общие и ничего не подтверждают.
+#
+# События раскладываются по потокам ключей (пользователь, адрес) в порядке
+# времени — одна сортировка всех событий, — и каждый поток, где встречается
+# больше одного источника, проходится дважды (вперёд и назад) с последним
+# временем каждого источника: O(n log n) на сортировку и O(n · источники) на
+# проходы, без попарного сравнения событий.
+
+
+@dataclass
+class Corroboration:
+    # Итог прохода: для каждого события — маска подтвердивших его источников.
+    sources: List[str] = field(default_factory=list)   # бит -> источник
+    masks: List[int] = field(default_factory=list)     # по индексам событий
+    window_minutes: int = 0
+
+    def __len__(self) -> int:
+        return sum(1 for m in self.masks if m)
+
+    def sources_of(self, mask: int) -> List[str]:
+        return [src for bit, src in enumerate(self.sources) if mask >> bit & 1]
+
+    def mask_of(self, indices: Iterable[int]) -> int:
+        # Объединённая маска группы событий (например, сессии).
+        masks = self.masks
+        mask = 0
+        for i in indices:
+            mask |= masks[i]
+        return mask
+
+    def session_ids(self, events: List[LogEvent]) -> Set[int]:
+        # Сессии, в которых есть хотя бы одно подтверждённое событие.
+        return {
+            events[i].session_id for i, m in enumerate(self.masks)
+            if m and events[i].session_id is not None
+        }
+
+
+def corroborate(events: List[LogEvent], cfg: Config) -> Corroboration:
+    window = cfg.corroboration_window_minutes * US_PER_MINUTE
+    ranges = ip_ranges(cfg)
+    result = Corroboration(window_minutes=cfg.corroboration_window_minutes)
+    bits: Dict[str, int] = {}
+    src_bit: List[int] = [0] * len(events)
+    for i, ev in enumerate(events):
+        bit = bits.get(ev.source)
+        if bit is None:
+            bit = bits[ev.source] = 1 << len(result.sources)
+            result.sources.append(ev.source)
+        src_bit[i] = bit
+    masks = result.masks = [0] * len(events)
+    if len(bits) < 2:
+        return result
+
+    # потоки ключей: ключ -> индексы событий по времени; маска источников потока
+    streams: Dict[object, List[int]] = {}
+    stream_sources: Dict[object, int] = {}
+    shared: Dict[object, bool] = {}
+    extra_keys: Dict[type, Tuple[str, ...]] = {}
+
+    def ip_key(ip: str, value: Optional[int]) -> Optional[object]:
+        key = value if value is not None else ("ip", ip)
+        if ranges is None:
+            return key
+        flag = shared.get(key)
+        if flag is None:
+            rng = ranges.lookup_ip(ip)
+            flag = shared[key] = bool(rng is not None and rng.nat)
+        return None if flag else key
+
+    timed = sorted((i for i, ev in enumerate(events) if ev.ts_us is not None), key=lambda i: events[i].ts_us)
+    for i in timed:
+        ev = events[i]
+        keys = []
+        if ev.user:
+            keys.append(ev.user)
+        if ev.ip:
+            keys.append(ip_key(ev.ip, ev.ip_int))
+        details = ev.details
+        if details:
+            names = extra_keys.get(type(details))
+            if names is None or type(details) is dict:
+                names = tuple(name for name in ACTOR_IP_DETAILS if name in details)
+                extra_keys[type(details)] = names
+            for name in names:
+                extra = details.get(name)
+                if extra and extra != "-":
+                    keys.append(ip_key(extra, ip_to_int(extra)))
+        bit = src_bit[i]
+        for key in keys:
+            if key is None:
+                continue
+            stream = streams.get(key)
+            if stream is None:
+                streams[key] = [i]
+                stream_sources[key] = bit
+            elif stream[-1] != i:   # адрес клиента и выданный VPN адрес могут совпасть
+                stream.append(i)
+                stream_sources[key] |= bit
+
+    for key, stream in streams.items():
+        mask = stream_sources[key]
+        if mask & (mask - 1) == 0:   # в потоке один источник
+            continue
+        for order in (stream, reversed(stream)):
+            last: Dict[int, int] = {}    # бит источника -> время последнего события
+            for i in order:
+                ts = events[i].ts_us
+                bit = src_bit[i]
+                for other, seen in last.items():
+                    if other != bit and abs(ts - seen) <= window:
+                        masks[i] |= other
+                last[bit] = ts
+    return result
@@ -0,0 +1,352 @@
+import csv
+import hashlib
+import os
+import sys
+from dataclasses import dataclass, field
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+
+# Цепочка хранения (chain of custody): доказуемая неизменность исходных файлов.
+#
+# Пока цикл загрузки читает файл, каждая прочитанная строка попадает и в
+# SHA-256 файла целиком, и в текущий блок (~BLOCK_BYTES, граница — по концу
+# строки). Над хэшами блоков строится дерево Меркла; событие хранит ссылку на
+# свой блок (номер файла в журнале, номер блока). Чтобы доказать, что строка
+# raw_line взята из исходного файла, достаточно байтов её блока (смещение и
+# длина известны) и пути из log2(числа блоков) соседних хэшей до корня.
+# Второго чтения файла не нужно.
+#
+# Листья и узлы хэшируются с разными префиксами (0x00 / 0x01, как в RFC 6962),
+# непарный узел уровня поднимается выше без изменений. Если ядер больше
+# одного, хэши блоков и файла считаются в отдельных потоках (hashlib отпускает
+# GIL на больших буферах) параллельно с разбором строк.
+
+BLOCK_BYTES = 64 * 1024
+LEAF_PREFIX = b"\x00"
+NODE_PREFIX = b"\x01"
+MAX_HASH_THREADS = 4
+
+BlockRef = Tuple[int, int]    # (номер файла в журнале хранения, номер блока)
+ProofStep = Tuple[str, str]   # ('L' | 'R' — сторона соседнего узла, его хэш hex)
+
+EMPTY_ROOT = hashlib.sha256(b"").hexdigest()
+
+
+def leaf_hash(data: bytes) -> bytes:
+    h = hashlib.sha256(LEAF_PREFIX)
+    h.update(data)
+    return h.digest()
+
+
+def node_hash(left: bytes, right: bytes) -> bytes:
+    return hashlib.sha256(NODE_PREFIX + left + right).digest()
+
+
+def merkle_levels(leaves: List[bytes]) -> List[List[bytes]]:
+    # Уровни дерева от листьев к корню.
+    levels = [list(leaves)]
+    while len(levels[-1]) > 1:
+        prev = levels[-1]
+        level = [node_hash(prev[i], prev[i + 1]) for i in range(0, len(prev) - 1, 2)]
+        if len(prev) % 2:
+            level.append(prev[-1])
+        levels.append(level)
+    return levels
+
+
+def merkle_proof(levels: List[List[bytes]], index: int) -> List[ProofStep]:
+    # Путь включения листа index: соседние хэши снизу вверх.
+    proof: List[ProofStep] = []
+    for level in levels[:-1]:
+        sibling = index ^ 1
+        if sibling < len(level):
+            proof.append(("L" if sibling < index else "R", level[sibling].hex()))
+        index >>= 1
+    return proof
+
+
+def verify_proof(data: bytes, proof: List[ProofStep], root: str) -> bool:
+    # Байты блока + путь включения дают корень root.
+    h = leaf_hash(data)
+    for side, other in proof:
+        sibling = bytes.fromhex(other)
+        h = node_hash(sibling, h) if side == "L" else node_hash(h, sibling)
+    return h.hex() == root
+
+
+def block_contains_line(data: bytes, raw_line: str) -> bool:
+    # Строка события (как её хранит LogEvent.raw_line) — одна из строк блока.
+    target = raw_line.strip()
+    return any(
+        line.strip().decode("utf-8", "ignore") == target
+        for line in data.split(b"\n")
+    )
+
+
+def format_proof(proof: List[ProofStep]) -> str:
+    return " ".join(f"{side}:{h}" for side, h in proof)
+
+
+def parse_proof(text: str) -> List[ProofStep]:
+    steps = []
+    for item in text.split():
+        side, _, h = item.partition(":")
+        if side not in ("L", "R") or len(h) != 64:
+            raise ValueError(f"некорректный шаг доказательства: {item}")
+        steps.append((side, h))
+    return steps
+
+
+def hash_threads() -> int:
+    # Потоки хэширования: на одном ядре хэши считаются в потоке разбора.
+    return min(MAX_HASH_THREADS, (os.cpu_count() or 1) - 1)
+
+
+@dataclass
+class FileCustody:
+    # Запись журнала хранения об одном прочитанном файле.
+    path: str
+    source: str = ""
+    sha256: str = ""
+    size: int = 0
+    lines: int = 0
+    offsets: List[int] = field(default_factory=list)   # смещение начала каждого блока
+    leaves: List[bytes] = field(default_factory=list)  # хэши блоков
+    complete: bool = False                             # файл прочитан до конца
+    _levels: Optional[List[List[bytes]]] = field(default=None, repr=False, compare=False)
+
+    @property
+    def blocks(self) -> int:
+        return len(self.leaves)
+
+    @property
+    def name(self) -> str:
+        return os.path.basename(self.path)
+
+    def _tree(self) -> List[List[bytes]]:
+        if self._levels is None or len(self._levels[0]) != len(self.leaves):
+            self._levels = merkle_levels(self.leaves)
+        return self._levels
+
+    @property
+    def root(self) -> str:
+        if not self.leaves:
+            return EMPTY_ROOT
+        return self._tree()[-1][0].hex()
+
+    def block_span(self, index: int) -> Tuple[int, int]:
+        # (смещение, длина) блока в исходном файле
+        start = self.offsets[index]
+        end = self.offsets[index + 1] if index + 1 < len(self.offsets) else self.size
+        return start, end - start
+
+    def proof(self, index: int) -> List[ProofStep]:
+        return merkle_proof(self._tree(), index)
+
+    def read_block(self, index: int, path: Optional[str] = None) -> bytes:
+        offset, length = self.block_span(index)
+        with open(path or self.path, "rb") as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def verify_block(self, index: int, path: Optional[str] = None) -> bool:
+        # Перечитать блок из файла (path — копия файла) и проверить путь до корня.
+        return verify_proof(self.read_block(index, path), self.proof(index), self.root)
+
+    def to_dict(self) -> dict:
+        return {
+            "path": self.path, "source": self.source, "sha256": self.sha256,
+            "size": self.size, "lines": self.lines, "complete": self.complete,
+        }
+
+
+class CustodyReader:
+    # Построчное чтение файла с попутным хэшированием; ref — блок последней выданной строки.
+
+    def __init__(self, record: FileCustody, file_no: int, threads: Optional[int] = None):
+        self.record = record
+        self.file_no = file_no
+        self.threads = hash_threads() if threads is None else threads
+        self.ref: BlockRef = (file_no, 0)
+
+    def lines(self, f: BinaryIO) -> Iterator[bytes]:
+        record = self.record
+        file_no = self.file_no
+        file_hash = hashlib.sha256()
+        leaves = record.leaves
+        offsets = record.offsets
+        pool = serial = None
+        futures = []
+        if self.threads > 0:
+            from concurrent.futures import ThreadPoolExecutor
+            pool = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="logclass-hash")
+            # хэш файла — строго по порядку блоков, поэтому отдельный однопоточный исполнитель
+            serial = ThreadPoolExecutor(max_workers=1, thread_name_prefix="logclass-sha")
+
+        block: List[bytes] = []
+        size = 0
+        offset = 0
+        lines = 0
+
+        def flush():
+            data = b"".join(block)
+            if pool is not None:
+                serial.submit(file_hash.update, data)
+                futures.append(pool.submit(leaf_hash, data))
+            else:
+                file_hash.update(data)
+                leaves.append(leaf_hash(data))
+
+        offsets.append(0)
+        self.ref = (file_no, 0)
+        try:
+            for line in f:
+                if size >= BLOCK_BYTES:
+                    flush()
+                    lines += len(block)
+                    offset += size
+                    block = []
+                    size = 0
+                    offsets.append(offset)
+                    self.ref = (file_no, len(offsets) - 1)
+                block.append(line)
+                size += len(line)
+                yield line
+            if block:
+                flush()
+                lines += len(block)
+                offset += size
+            else:
+                offsets.clear()  # пустой файл — блоков нет
+        finally:
+            if pool is not None:
+                serial.shutdown(wait=True)
+                pool.shutdown(wait=True)
+        leaves.extend(fut.result() for fut in futures)
+        record.sha256 = file_hash.hexdigest()
+        record.size = offset
+        record.lines = lines
+        record.complete = True
+
+
+class CustodyLog:
+    # Журнал хранения: прочитанные файлы в порядке загрузки.
+
+    def __init__(self):
+        self.files: List[FileCustody] = []
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    def __iter__(self):
+        return iter(self.files)
+
+    def __getitem__(self, file_no: int) -> FileCustody:
+        return self.files[file_no]
+
+    def reader(self, path: str, source: str = "", threads: Optional[int] = None) -> CustodyReader:
+        record = FileCustody(path=os.path.abspath(path), source=source)
+        self.files.append(record)
+        return CustodyReader(record, len(self.files) - 1, threads)
+
+    def record(self, ref: Optional[BlockRef]) -> Optional[FileCustody]:
+        if ref is None or not 0 <= ref[0] < len(self.files):
+            return None
+        return self.files[ref[0]]
+
+    def block_proof(self, ref: BlockRef) -> dict:
+        # Всё для проверки блока без программы: файл, его хэши, положение блока и путь до корня.
+        record = self.files[ref[0]]
+        offset, length = record.block_span(ref[1])
+        return {
+            "file": record.path,
+            "file_sha256": record.sha256,
+            "merkle_root": record.root,
+            "block": ref[1],
+            "offset": offset,
+            "length": length,
+            "leaf": record.leaves[ref[1]].hex(),
+            "proof": format_proof(record.proof(ref[1])),
+        }
+
+
+PROOF_FIELDS = ["file", "file_sha256", "merkle_root", "block", "offset", "length", "leaf", "proof"]
+
+
+def write_proofs_csv(custody: CustodyLog, refs, path: str) -> int:
+    # Доказательства включения для блоков refs (каждый блок — одна строка).
+    count = 0
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=PROOF_FIELDS, delimiter=";")
+        writer.writeheader()
+        for ref in sorted(set(refs)):
+            record = custody.record(ref)
+            if record is None or not record.complete:
+                continue
+            writer.writerow(custody.block_proof(ref))
+            count += 1
+    return count
+
+
+def verify_proofs_csv(path: str, base_dir: Optional[str] = None) -> List[Tuple[str, int, str]]:
+    # Проверка файла доказательств по исходным файлам: [(файл, блок, 'ok' | причина)].
+    results = []
+    with open(path, encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f, delimiter=";"):
+            src = row["file"]
+            if base_dir:
+                src = os.path.join(base_dir, os.path.basename(src))
+            block = int(row["block"])
+            try:
+                with open(src, "rb") as data_file:
+                    data_file.seek(int(row["offset"]))
+                    data = data_file.read(int(row["length"]))
+            except OSError as e:
+                results.append((src, block, f"ошибка чтения: {e}"))
+                continue
+            if leaf_hash(data).hex() != row["leaf"]:
+                results.append((src, block, "блок изменён"))
+            elif not verify_proof(data, parse_proof(row["proof"]), row["merkle_root"]):
+                results.append((src, block, "путь не сходится с корнем"))
+            else:
+                results.append((src, block, "ok"))
+    return results
+
+
+def hash_file(path: str, threads: Optional[int] = None) -> FileCustody:
+    # Журнальная запись для файла без разбора (для сверки с отчётом).
+    custody = CustodyLog()
+    reader = custody.reader(path, threads=threads)
+    with open(path, "rb") as f:
+        for _ in reader.lines(f):
+            pass
+    return reader.record
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import argparse
+    ap = argparse.ArgumentParser(description="LogClass: хэши исходных файлов и проверка доказательств включения")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p_hash = sub.add_parser("hash", help="SHA-256 и корень дерева Меркла для файлов")
+    p_hash.add_argument("files", nargs="+")
+    p_verify = sub.add_parser("verify", help="проверить файл доказательств (*.proofs.csv)")
+    p_verify.add_argument("proofs")
+    p_verify.add_argument("--dir", default=None, help="каталог с копиями исходных файлов")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "hash":
+        for path in args.files:
+            record = hash_file(path)
+            print(f"{record.path}\n  sha256 {record.sha256}\n  merkle {record.root}"
+                  f"\n  {record.size} байт, {record.lines} строк, {record.blocks} блоков")
+        return 0
+    failed = 0
+    for src, block, verdict in verify_proofs_csv(args.proofs, args.dir):
+        if verdict != "ok":
+            failed += 1
+            print(f"{src} блок {block}: {verdict}")
+    print("все блоки подтверждены" if not failed else f"не подтверждено блоков: {failed}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+import math
+from array import array
+from dataclasses import dataclass
+from hashlib import blake2b
+from typing import List
+
+
+def _next_prime(n: int) -> int:
+    # Размер фильтра берётся простым, чтобы шаг двойного хэширования
+    # не имел общих делителей с размером и позиции не зацикливались.
+    n |= 1
+    while True:
+        if all(n % d for d in range(3, int(n ** 0.5) + 1, 2)):
+            return n
+        n += 2
+
+
+def line_hash(source: str, raw: bytes) -> int:
+    # 64-битный хэш пары (источник, исходная строка).
+    return int.from_bytes(blake2b(raw, digest_size=8, person=source.encode("utf-8")[:16]).digest(), "little")
+
+
+class BloomFilter:
+    # Классический фильтр Блума; k позиций получаются двойным хэшированием
+    # из одного 64-битного значения.
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = max(1, capacity)
+        self.error_rate = error_rate
+        bits = int(math.ceil(-self.capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.size = _next_prime(max(64, bits))
+        self.k = max(1, int(round(self.size / self.capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def __contains__(self, h: int) -> bool:
+        bits = self.bits
+        size = self.size
+        h1 = h % size
+        h2 = (h >> 32) % size or 1
+        for i in range(self.k):
+            pos = (h1 + i * h2) % size
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def add(self, h: int) -> None:
+        bits = self.bits
+        size = self.size
+        h1 = h % size
+        h2 = (h >> 32) % size or 1
+        for i in range(self.k):
+            pos = (h1 + i * h2) % size
+            bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.bits)
+
+
+@dataclass
+class DedupStats:
+    exact: int = 0      # повтор найден в точном множестве недавних строк
+    probable: int = 0   # повтор по фильтру Блума (вне окна точного множества)
+
+    @property
+    def total(self) -> int:
+        return self.exact + self.probable
+
+
+class LineDeduplicator:
+    # Подавление повторов строк при повторной загрузке файлов и пересекающихся
+    # ротациях. Недавние хэши хранятся точно (кольцо array('Q') ограниченного
+    # размера и множество для поиска), все остальные — в масштабируемом фильтре
+    # Блума: при заполнении очередного фильтра добавляется новый, вдвое больший,
+    # так что память растёт пропорционально числу строк с фиксированной ценой
+    # в битах на строку.
+
+    def __init__(self, recent_limit: int = 65_536, capacity: int = 1_000_000, error_rate: float = 1e-7):
+        self.recent_limit = max(1, recent_limit)
+        self.error_rate = error_rate
+        self.recent = set()
+        self.recent_ring = array("Q")     # хэши окна в порядке добавления (кольцо)
+        self._ring_pos = 0
+        self.filters: List[BloomFilter] = [BloomFilter(capacity, error_rate)]
+        self.stats = DedupStats()
+
+    def seen(self, h: int) -> bool:
+        # Встречался ли хэш строки (line_hash); сам хэш не запоминается.
+        if h in self.recent:
+            self.stats.exact += 1
+            return True
+        for bf in self.filters:
+            if h in bf:
+                self.stats.probable += 1
+                return True
+        return False
+
+    def add(self, h: int) -> None:
+        # Запомнить хэш строки, из которой получено событие.
+        current = self.filters[-1]
+        if current.count >= current.capacity:
+            current = BloomFilter(current.capacity * 2, self.error_rate)
+            self.filters.append(current)
+        current.add(h)
+
+        ring = self.recent_ring
+        if len(ring) < self.recent_limit:
+            ring.append(h)
+        else:
+            pos = self._ring_pos
+            self.recent.discard(ring[pos])
+            ring[pos] = h
+            self._ring_pos = (pos + 1) % self.recent_limit
+        self.recent.add(h)
+
+    def is_duplicate(self, source: str, raw: bytes) -> bool:
+        # Проверить строку и запомнить её, если она встречается впервые.
+        h = line_hash(source, raw)
+        if self.seen(h):
+            return True
+        self.add(h)
+        return False
+
+    @property
+    def nbytes(self) -> int:
+        # Фильтры Блума и кольцо окна (без накладных расходов множества).
+        return sum(bf.nbytes for bf in self.filters) + len(self.recent_ring) * self.recent_ring.itemsize
@@ -0,0 +1,640 @@
+import hashlib
+import hmac
+import io
+import os
+import pickle
+import queue
+import socket
+import socketserver
+import struct
+import subprocess
+import sys
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from aggregates import EventAggregates
+from sketches import EventSketches
+from config_manager import Config, config_from_dict
+from ingest import IngestStats, iter_log_lines
+from timeutil import US_PER_MINUTE, from_micros
+
+# Распределённый разбор: координатор делит файлы на диапазоны байтов и
+# раздаёт их узлам-исполнителям (отдельные процессы, в том числе на других
+# машинах). Исполнитель разбирает свой диапазон (PARSERS), классифицирует
+# события (classify_event) и собирает частичные сессии по ключам, а назад
+# отправляет только сливаемые частичные итоги: EventAggregates (со сводками
+# EventSketches), IngestStats и фрагменты сессий (ключ, начало, конец, число
+# событий, источники, классы).
+#
+# Координатор складывает итоги и сшивает фрагменты одного ключа из разных
+# диапазонов и файлов: соседние фрагменты, разделённые не более чем
+# session_window_minutes, — одна сессия (как в build_sessions).
+#
+# Протокол — TCP, сообщения вида [длина, HMAC-SHA256, pickle]. Подпись
+# проверяется до распаковки, поэтому узлы должны иметь общий ключ
+# (переменная окружения LOGCLASS_CLUSTER_KEY или --key); запускать
+# исполнители стоит только в доверенной сети. Файлы узел читает сам (общий
+# диск) либо получает содержимое диапазона в задании (--ship).
+# Подавление повторно загруженных строк (dedup) в этом режиме не выполняется.
+
+DEFAULT_PORT = 9600
+CHUNK_BYTES = 32 * 1024 * 1024
+KEY_ENV = "LOGCLASS_CLUSTER_KEY"
+# длина сообщения приходит до проверки подписи: больше — соединение рвётся,
+# не выделяя память (задание с --ship несёт диапазон до половины предела)
+MAX_MESSAGE_BYTES = 4 * CHUNK_BYTES
+# исполнитель обслуживает соединения по очереди: молчащий собеседник не должен занимать его дольше
+WORKER_IDLE_TIMEOUT = 300.0
+
+_HEADER = struct.Struct(">I32s")  # длина сообщения, подпись
+
+
+@dataclass
+class Task:
+    # Диапазон [start, end) файла; границы выровнены по началу строк.
+    task_id: int
+    path: str
+    fmt: str                      # ключ PARSERS
+    start: int
+    end: int
+    data: Optional[bytes] = None  # содержимое диапазона, если узел не видит файл
+
+
+@dataclass
+class SessionFragment:
+    # Часть сессии ключа, собранная на одном узле (или уже сшитая сессия).
+    key_type: str
+    key: str
+    start_us: int
+    end_us: int
+    events: int
+    sources: Dict[str, int] = field(default_factory=dict)   # источник -> событий
+    classes: Dict[str, int] = field(default_factory=dict)   # класс -> событий
+    group: object = None          # ключ сравнения (SessionKeyer): строка, число или (сеть, префикс)
+    id: Optional[int] = None      # номер сессии после сшивки
+
+    def pack(self) -> "FragmentTuple":
+        return (self.group, self.key_type, self.key, self.start_us, self.end_us, self.events,
+                self.sources, self.classes)
+
+
+# фрагмент в передаваемом виде: кортежи и словари pickle обрабатывает
+# в несколько раз быстрее, чем экземпляры dataclass
+FragmentTuple = Tuple[object, str, str, int, int, int, Dict[str, int], Dict[str, int]]
+
+
+@dataclass
+class PartialResult:
+    task_id: int
+    aggregates: EventAggregates
+    stats: IngestStats
+    fragments: List[FragmentTuple]
+    elapsed: float = 0.0
+    worker: str = ""
+
+
+@dataclass
+class ClusterResult:
+    aggregates: EventAggregates
+    stats: IngestStats
+    sessions: List[SessionFragment]
+    tasks: int = 0
+    retried: int = 0
+    elapsed: float = 0.0
+    # узел -> (заданий, суммарное время разбора, с)
+    per_worker: Dict[str, Tuple[int, float]] = field(default_factory=dict)
+    # подтверждение другими источниками (бонус corroboration_bonus) не применяется:
+    # исполнители классифицируют каждый диапазон отдельно, событий у координатора нет
+    corroboration_applied: bool = False
+
+
+class ClusterError(RuntimeError):
+    pass
+
+
+# Сообщения
+
+def send_message(sock: socket.socket, obj, key: bytes) -> None:
+    payload = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+    digest = hmac.new(key, payload, hashlib.sha256).digest()
+    sock.sendall(_HEADER.pack(len(payload), digest))
+    sock.sendall(payload)
+
+
+def _recv_exact(sock: socket.socket, size: int) -> Optional[bytearray]:
+    buf = bytearray(size)
+    view = memoryview(buf)
+    got = 0
+    while got < size:
+        n = sock.recv_into(view[got:], size - got)
+        if not n:
+            if got == 0:
+                return None
+            raise ConnectionError("соединение закрыто посреди сообщения")
+        got += n
+    return buf
+
+
+def recv_message(sock: socket.socket, key: bytes):
+    # Следующее сообщение или None, если собеседник закрыл соединение.
+    header = _recv_exact(sock, _HEADER.size)
+    if header is None:
+        return None
+    length, digest = _HEADER.unpack(header)
+    if length > MAX_MESSAGE_BYTES:
+        raise ConnectionError(f"слишком длинное сообщение: {length} байт")
+    payload = _recv_exact(sock, length) if length else bytearray()
+    if payload is None:
+        raise ConnectionError("соединение закрыто посреди сообщения")
+    if not hmac.compare_digest(digest, hmac.new(key, payload, hashlib.sha256).digest()):
+        raise ConnectionError("подпись сообщения не совпадает (разные ключи кластера?)")
+    return pickle.loads(payload)
+
+
+def cluster_key(key: Optional[str] = None) -> bytes:
+    # Ключ из --key или $LOGCLASS_CLUSTER_KEY; пустой — нет ключа.
+    return (key if key is not None else os.environ.get(KEY_ENV, "")).encode("utf-8")
+
+
+def require_key(key: bytes) -> None:
+    # Сообщения — pickle: с пустым ключом подпись подделает кто угодно,
+    # а исполнитель выполнит присланное. Без ключа узлы не запускаются.
+    if not key:
+        raise ClusterError(f"не задан ключ кластера (--key или ${KEY_ENV})")
+
+
+# Задания
+
+def split_file(path: str, chunk_bytes: int = CHUNK_BYTES) -> List[Tuple[int, int]]:
+    # Диапазоны около chunk_bytes, каждая граница сдвинута к началу следующей строки.
+    size = os.path.getsize(path)
+    ranges = []
+    with open(path, "rb") as f:
+        start = 0
+        while start < size:
+            end = start + chunk_bytes
+            if end >= size:
+                end = size
+            else:
+                f.seek(end - 1)
+                f.readline()
+                end = f.tell()
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def make_tasks(files: Sequence[Tuple[str, str]], chunk_bytes: int = CHUNK_BYTES) -> List[Task]:
+    # files — (путь, формат).
+    tasks = []
+    for path, fmt in files:
+        for start, end in split_file(path, chunk_bytes):
+            tasks.append(Task(len(tasks), path, fmt, start, end))
+    return tasks
+
+
+def read_range(path: str, start: int, end: int) -> bytes:
+    with open(path, "rb") as f:
+        f.seek(start)
+        return f.read(end - start)
+
+
+def session_fragments(events: Iterable, cfg: Config) -> List[SessionFragment]:
+    # Частичные сессии по ключам (как в SessionCorrelator) для событий одной части данных.
+    from correlator import SessionKeyer
+    window = cfg.session_window_minutes * US_PER_MINUTE
+    keyer = SessionKeyer(cfg)
+    keyed = []
+    for ev in events:
+        if ev.ts_us is not None:
+            k = keyer(ev)
+            if k is not None:
+                keyed.append((ev.ts_us, k, ev))
+    keyed.sort(key=lambda item: item[0])
+    current: Dict[object, SessionFragment] = {}
+    fragments: List[SessionFragment] = []
+    for ts, (group, key_type, key), ev in keyed:
+        frag = current.get(group)
+        if frag is None or ts - frag.end_us > window:
+            frag = current[group] = SessionFragment(key_type, key, ts, ts, 0, group=group)
+            fragments.append(frag)
+        frag.end_us = ts
+        frag.events += 1
+        src = ev.source
+        frag.sources[src] = frag.sources.get(src, 0) + 1
+        cls = ev.evidential_class
+        if cls:
+            frag.classes[cls] = frag.classes.get(cls, 0) + 1
+    return fragments
+
+
+def run_task(task: Task, cfg: Config, parsers: Dict[str, object]) -> PartialResult:
+    # Разбор, классификация и частичные сессии для одного диапазона.
+    from rule_engine import compiled_rules
+    started = time.perf_counter()
+    parser = parsers.get(task.fmt)
+    if parser is None:
+        raise ValueError(f"неизвестный формат: {task.fmt}")
+    data = task.data if task.data is not None else read_range(task.path, task.start, task.end)
+    rules = compiled_rules(cfg)
+    by_source, default = rules.by_source, rules.default
+    stats = IngestStats()
+    aggregates = EventAggregates(sketches=EventSketches())
+    add = aggregates.add
+    events = []
+    for ev in iter_log_lines(io.BytesIO(data), parser, cfg, None, task.fmt, stats):
+        by_source.get(ev.source, default)(ev)
+        add(ev)
+        events.append(ev)
+    fragments = [frag.pack() for frag in session_fragments(events, cfg)]
+    return PartialResult(task.task_id, aggregates, stats, fragments, time.perf_counter() - started)
+
+
+# Сведение частичных итогов
+
+def stitch_sessions(fragments: Iterable[FragmentTuple], cfg: Config) -> List[SessionFragment]:
+    # Сшить фрагменты одного ключа: после сортировки по началу фрагмент
+    # продолжает текущую сессию, если начинается не позже чем через окно
+    # после её конца. Сессии нумеруются по времени начала.
+    window = cfg.session_window_minutes * US_PER_MINUTE
+    by_key: Dict[object, List[FragmentTuple]] = {}
+    for frag in fragments:
+        by_key.setdefault(frag[0], []).append(frag)
+    sessions: List[SessionFragment] = []
+    for frags in by_key.values():
+        frags.sort(key=lambda f: f[3])
+        cur = None
+        for group, key_type, key, start, end, events, sources, classes in frags:
+            if cur is not None and start - cur.end_us <= window:
+                if end > cur.end_us:
+                    cur.end_us = end
+                cur.events += events
+                for name, count in sources.items():
+                    cur.sources[name] = cur.sources.get(name, 0) + count
+                for name, count in classes.items():
+                    cur.classes[name] = cur.classes.get(name, 0) + count
+            else:
+                # словари фрагмента принадлежат только ему (получены распаковкой) — берём их себе
+                cur = SessionFragment(key_type, key, start, end, events, sources, classes, group)
+                sessions.append(cur)
+    sessions.sort(key=lambda s: (s.start_us, s.key_type, s.key))
+    for i, sess in enumerate(sessions, 1):
+        sess.id = i
+    return sessions
+
+
+def merge_partials(partials: Sequence[PartialResult], cfg: Config) -> ClusterResult:
+    aggregates = EventAggregates()
+    stats = IngestStats()
+    per_worker: Dict[str, Tuple[int, float]] = {}
+    for part in sorted(partials, key=lambda p: p.task_id):
+        aggregates.merge(part.aggregates)
+        stats.merge(part.stats)
+        count, spent = per_worker.get(part.worker, (0, 0.0))
+        per_worker[part.worker] = (count + 1, spent + part.elapsed)
+    sessions = stitch_sessions((f for part in partials for f in part.fragments), cfg)
+    return ClusterResult(aggregates, stats, sessions, tasks=len(partials), per_worker=per_worker)
+
+
+# Исполнитель
+
+class _WorkerHandler(socketserver.BaseRequestHandler):
+    # Одно соединение координатора: сначала конфигурация, затем задания по одному.
+
+    def handle(self) -> None:
+        key = self.server.key
+        sock = self.request
+        name = f"{socket.gethostname()}:{self.server.server_address[1]}"
+        cfg = None
+        sock.settimeout(WORKER_IDLE_TIMEOUT)
+        from parsers import PARSERS, load_parser_plugins
+        load_parser_plugins()
+        try:
+            while True:
+                msg = recv_message(sock, key)
+                if msg is None:
+                    return
+                kind, body = msg
+                if kind == "config":
+                    cfg = config_from_dict(body)
+                    send_message(sock, ("ok", name), key)
+                elif kind == "task" and cfg is not None:
+                    try:
+                        result = run_task(body, cfg, PARSERS)
+                    except Exception as e:
+                        send_message(sock, ("error", f"{type(e).__name__}: {e}"), key)
+                        continue
+                    result.worker = name
+                    send_message(sock, ("result", result), key)
+                else:
+                    send_message(sock, ("error", f"неожиданное сообщение: {kind}"), key)
+        except (OSError, ConnectionError) as e:
+            print(f"соединение {self.client_address}: {e}", file=sys.stderr)
+
+
+class WorkerServer(socketserver.TCPServer):
+    # Соединения обслуживаются по очереди: один процесс — одно ядро.
+    # Для нескольких ядер узла запускается несколько исполнителей.
+    allow_reuse_address = True
+
+    def __init__(self, host: str, port: int, key: bytes):
+        require_key(key)
+        super().__init__((host, port), _WorkerHandler)
+        self.key = key
+
+
+def start_local_workers(count: int, key: bytes) -> Tuple[List[subprocess.Popen], List[Tuple[str, int]]]:
+    # Локальные процессы-исполнители вместо узлов (проверка, один многоядерный узел).
+    env = dict(os.environ)
+    env[KEY_ENV] = key.decode("utf-8")
+    here = os.path.dirname(os.path.abspath(__file__))
+    procs, addrs = [], []
+    try:
+        for _ in range(count):
+            proc = subprocess.Popen(
+                [sys.executable, os.path.join(here, "distributed.py"), "worker", "--port", "0"],
+                cwd=here, env=env, stdout=subprocess.PIPE, text=True,
+            )
+            procs.append(proc)
+            line = proc.stdout.readline().split()
+            if not line or line[0] != "listening":
+                raise ClusterError("исполнитель не запустился")
+            host, _, port = line[1].rpartition(":")
+            addrs.append((host, int(port)))
+    except Exception:
+        stop_local_workers(procs)
+        raise
+    return procs, addrs
+
+
+def stop_local_workers(procs: Sequence[subprocess.Popen]) -> None:
+    for proc in procs:
+        proc.terminate()
+    for proc in procs:
+        proc.wait()
+        if proc.stdout is not None:
+            proc.stdout.close()
+
+
+# Координатор
+
+def run_distributed(
+    files: Sequence[Tuple[str, str]],
+    workers: Sequence[Tuple[str, int]],
+    cfg: Config,
+    key: bytes,
+    chunk_bytes: int = CHUNK_BYTES,
+    ship: bool = False,
+    timeout: Optional[float] = None,
+) -> ClusterResult:
+    # Разобрать files — (путь, формат) — на узлах workers и свести итоги.
+    # Задания берутся из общей очереди; задание узла, потерявшего связь,
+    # возвращается в очередь и достаётся другим узлам. Ошибка разбора
+    # (например, файл не найден на узле) прерывает весь прогон.
+    require_key(key)
+    if ship and chunk_bytes > MAX_MESSAGE_BYTES // 2:
+        raise ClusterError(f"с передачей диапазонов размер диапазона не больше {MAX_MESSAGE_BYTES // 2 >> 20} МБ")
+    started = time.perf_counter()
+    tasks = make_tasks(files, chunk_bytes)
+    pending: "queue.Queue[Task]" = queue.Queue()
+    for task in tasks:
+        pending.put(task)
+    cfg_data = asdict(cfg)
+    results: Dict[int, PartialResult] = {}
+    failures: List[str] = []
+    lost: List[str] = []
+    retried = 0
+    lock = threading.Lock()
+
+    def drive(addr: Tuple[str, int]) -> bool:
+        # Раздавать задания одному узлу, пока очередь не опустеет; False — узел потерян.
+        nonlocal retried
+        try:
+            sock = socket.create_connection(addr, timeout=timeout)
+        except OSError as e:
+            with lock:
+                lost.append(f"{addr[0]}:{addr[1]}: {e}")
+            return False
+        with sock:
+            task = None
+            try:
+                send_message(sock, ("config", cfg_data), key)
+                recv_message(sock, key)
+                while not failures:
+                    try:
+                        task = pending.get_nowait()
+                    except queue.Empty:
+                        return True
+                    if ship:
+                        task.data = read_range(task.path, task.start, task.end)
+                    send_message(sock, ("task", task), key)
+                    task.data = None
+                    reply = recv_message(sock, key)
+                    if reply is None:
+                        raise ConnectionError("узел закрыл соединение")
+                    kind, body = reply
+                    with lock:
+                        if kind == "result":
+                            results[body.task_id] = body
+                        else:
+                            failures.append(f"{task.path} [{task.start}:{task.end}]: {body}")
+                    task = None
+                return True
+            except (OSError, ConnectionError) as e:
+                with lock:
+                    lost.append(f"{addr[0]}:{addr[1]}: {e}")
+                    if task is not None:
+                        task.data = None
+                        pending.put(task)
+                        retried += 1
+                return False
+            except Exception as e:
+                with lock:
+                    failures.append(f"{addr[0]}:{addr[1]}: {type(e).__name__}: {e}")
+                return True
+
+    live = list(workers)
+    while not pending.empty() and not failures:
+        if not live:
+            raise ClusterError("нет доступных узлов: " + "; ".join(lost))
+        outcome = [True] * len(live)
+
+        def run(i: int) -> None:
+            outcome[i] = drive(live[i])
+
+        threads = [threading.Thread(target=run, args=(i,), daemon=True) for i in range(len(live))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        live = [addr for addr, ok in zip(live, outcome) if ok]
+
+    if failures:
+        raise ClusterError("; ".join(failures))
+    if len(results) != len(tasks):
+        raise ClusterError(f"получено {len(results)} итогов из {len(tasks)} заданий")
+    result = merge_partials(list(results.values()), cfg)
+    result.retried = retried
+    result.elapsed = time.perf_counter() - started
+    return result
+
+
+def session_record(sess: SessionFragment) -> dict:
+    return {
+        "id": sess.id,
+        "key_type": sess.key_type,
+        "key": sess.key,
+        "start": from_micros(sess.start_us).isoformat(),
+        "end": from_micros(sess.end_us).isoformat(),
+        "sources": sorted(sess.sources),
+        "classes": sorted(sess.classes),
+        "event_count": sess.events,
+    }
+
+
+def _bench(copies: int, workers: int, chunk_mb: float) -> None:
+    # Сравнение с однопроцессным разбором на размноженных демонстрационных логах.
+    import tempfile
+    from generator import generate_scenario_logs
+    from parsers import PARSERS
+    from classifier import classify_events
+    from correlator import build_sessions
+    from ingest import read_log_file
+
+    cfg = Config()
+    web, proxy, vpn = generate_scenario_logs()
+    with tempfile.TemporaryDirectory() as tmp:
+        files = []
+        for fmt, lines in (("web", web), ("proxy", proxy), ("vpn", vpn)):
+            path = os.path.join(tmp, f"{fmt}.log")
+            with open(path, "w", encoding="utf-8") as f:
+                for _ in range(copies):
+                    f.write("\n".join(lines) + "\n")
+            files.append((path, fmt))
+
+        started = time.perf_counter()
+        events = []
+        for path, fmt in files:
+            read_log_file(path, PARSERS[fmt], cfg, events)
+        classify_events(events, cfg)
+        sessions = build_sessions(events, cfg)
+        local_elapsed = time.perf_counter() - started
+
+        key = os.urandom(16).hex().encode("ascii")
+        procs, addrs = start_local_workers(workers, key)
+        try:
+            result = run_distributed(files, addrs, cfg, key, int(chunk_mb * 1024 * 1024))
+        finally:
+            stop_local_workers(procs)
+
+    from classifier import compute_class_stats
+    same = (
+        result.aggregates.total == len(events)
+        and result.aggregates.class_stats() == compute_class_stats(events)
+        and len(result.sessions) == len(sessions)
+        and sorted((s.key, s.events) for s in result.sessions)
+        == sorted((s.key, len(s.events)) for s in sessions)
+    )
+    print(f"событий {len(events)}, сессий {len(sessions)}; один процесс {local_elapsed:.2f} с, "
+          f"{workers} исполнителей {result.elapsed:.2f} с ({result.tasks} заданий); "
+          f"итоги {'совпадают' if same else 'РАЗЛИЧАЮТСЯ'}")
+
+
+def main() -> None:
+    import argparse
+    import json
+
+    ap = argparse.ArgumentParser(description="Распределённый разбор логов LogClass")
+    ap.add_argument("--key", help=f"общий ключ кластера (по умолчанию ${KEY_ENV})")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    worker = sub.add_parser("worker", help="запустить исполнитель")
+    worker.add_argument("--host", default="127.0.0.1")
+    worker.add_argument("--port", type=int, default=DEFAULT_PORT)
+    run = sub.add_parser("run", help="разобрать файлы на исполнителях")
+    run.add_argument("files", nargs="+", metavar="FORMAT=PATH")
+    run.add_argument("--workers", help="адреса исполнителей: host:port,host:port")
+    run.add_argument("--local", type=int, default=0, help="запустить N локальных исполнителей")
+    run.add_argument("--chunk-mb", type=float, default=CHUNK_BYTES / (1024 * 1024))
+    run.add_argument("--ship", action="store_true", help="передавать содержимое диапазонов узлам")
+    run.add_argument("--sessions-out", help="файл JSONL для сшитых сессий")
+    bench = sub.add_parser("bench", help="сравнение с однопроцессным разбором")
+    bench.add_argument("--copies", type=int, default=200)
+    bench.add_argument("--local", type=int, default=4)
+    bench.add_argument("--chunk-mb", type=float, default=1.0)
+    args = ap.parse_args()
+    key = cluster_key(args.key)
+
+    if args.cmd == "worker":
+        if not key:
+            ap.error(f"задайте ключ кластера: --key или ${KEY_ENV}")
+        server = WorkerServer(args.host, args.port, key)
+        host, port = server.server_address[:2]
+        print(f"listening {host}:{port}", flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+    elif args.cmd == "bench":
+        _bench(args.copies, args.local, args.chunk_mb)
+    else:
+        from config_manager import load_config
+        from parsers import PARSERS, load_parser_plugins
+
+        load_parser_plugins()
+        files = []
+        for item in args.files:
+            fmt, _, path = item.partition("=")
+            if fmt not in PARSERS or not path:
+                ap.error(f"ожидается ФОРМАТ=ПУТЬ, форматы: {', '.join(sorted(PARSERS))}")
+            files.append((path, fmt))
+        addrs = []
+        for item in (args.workers or "").split(","):
+            if item.strip():
+                host, _, port = item.strip().rpartition(":")
+                addrs.append((host or "127.0.0.1", int(port or DEFAULT_PORT)))
+        if not key:
+            if addrs:
+                ap.error(f"задайте ключ кластера: --key или ${KEY_ENV}")
+            # только локальные исполнители: ключ на один прогон
+            key = os.urandom(16).hex().encode("ascii")
+        procs = []
+        if args.local:
+            procs, local_addrs = start_local_workers(args.local, key)
+            addrs.extend(local_addrs)
+        if not addrs:
+            ap.error("укажите --workers или --local")
+        try:
+            result = run_distributed(
+                files, addrs, load_config(), key, int(args.chunk_mb * 1024 * 1024), args.ship
+            )
+        finally:
+            stop_local_workers(procs)
+        if args.sessions_out:
+            with open(args.sessions_out, "w", encoding="utf-8") as f:
+                for sess in result.sessions:
+                    f.write(json.dumps(session_record(sess), ensure_ascii=False) + "\n")
+        agg = result.aggregates
+        print(json.dumps({
+            "events": agg.total,
+            "classes": agg.class_stats(),
+            "sources": agg.source_stats(),
+            "skipped": result.stats.skipped,
+            "noise": result.stats.noise,
+            "sessions": len(result.sessions),
+            "distinct_users": round(agg.sketches.distinct("users").value) if agg.sketches else None,
+            "distinct_ips": round(agg.sketches.distinct("ips").value) if agg.sketches else None,
+            "tasks": result.tasks,
+            "retried": result.retried,
+            "corroboration_applied": result.corroboration_applied,
+            "elapsed": round(result.elapsed, 3),
+            "workers": {name: {"tasks": n, "busy_s": round(t, 3)} for name, (n, t) in result.per_worker.items()},
+        }, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    # классы сообщений должны принадлежать модулю distributed, а не __main__ (pickle)
+    from distributed import main
+    main()
@@ -35,26 +35,26 @@ def generate_scenario_logs() -> Tuple[List[str], List[str], List[str]]:
     # Proxy
     proxy_lines = [
         "{ts} 192.168.0.10 GET http://example.com/ 200 1024".format(
-            ts=(base_time + timedelta(minutes=2)).strftime("%Y-%m-%dT%H:%M:%S")
+            ts=(base_time + timedelta(minutes=2)).strftime("%Y-%m-%dT%H:%M:%S+01:00")
         ),
         "{ts} 192.168.0.10 GET http://example.com/topsecret/data 200 2048".format(
-            ts=(base_time + timedelta(minutes=2, seconds=10)).strftime("%Y-%m-%dT%H:%M:%S")
+            ts=(base_time + timedelta(minutes=2, seconds=10)).strftime("%Y-%m-%dT%H:%M:%S+01:00")
         ),
         "{ts} 192.168.0.11 GET http://files.example.com/archive.zip 200 250000".format(
-            ts=(base_time + timedelta(minutes=2, seconds=20)).strftime("%Y-%m-%dT%H:%M:%S")
+            ts=(base_time + timedelta(minutes=2, seconds=20)).strftime("%Y-%m-%dT%H:%M:%S+01:00")
         ),
     ]
 
     # VPN
     vpn_lines = [
         "{ts} user=john ip=198.51.100.23 assigned=10.8.0.2 action=login result=success".format(
-            ts=(base_time + timedelta(minutes=-5)).strftime("%Y-%m-%dT%H:%M:%S")
+            ts=(base_time + timedelta(minutes=-5)).strftime("%Y-%m-%dT%H:%M:%S+01:00")
         ),
         "{ts} user=alice ip=198.51.100.23 assigned=10.8.0.3 action=login result=failure".format(
-            ts=(base_time + timedelta(minutes=-4)).strftime("%Y-%m-%dT%H:%M:%S")
+            ts=(base_time + timedelta(minutes=-4)).strftime("%Y-%m-%dT%H:%M:%S+01:00")
         ),
         "{ts} user=alice ip=198.51.100.23 assigned=10.8.0.3 action=login result=success".format(
-            ts=(base_time + timedelta(minutes=-3, seconds=30)).strftime("%Y-%m-%dT%H:%M:%S")
+            ts=(base_time + timedelta(minutes=-3, seconds=30)).strftime("%Y-%m-%dT%H:%M:%S+01:00")
         ),
     ]
 
@@ -0,0 +1,164 @@
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+from models import LogEvent
+from config_manager import Config
+from dedup import LineDeduplicator, line_hash
+from custody import CustodyLog
+from rawstore import RawLineStore
+
+ParserFunc = Callable[[str, Config], Optional[LogEvent]]
+
+COMMENT_PREFIXES = (b"#",)
+DIGITS = b"0123456789"
+
+
+@dataclass
+class IngestStats:
+    # Итоги чтения одного файла.
+    added: int = 0
+    skipped: int = 0   # строки, не подходящие под формат (в т.ч. отсеянные префильтром)
+    noise: int = 0     # строки, отброшенные как шум (health-check, статика и т.п.)
+    duplicates: int = 0  # повторно загруженные строки
+
+    def merge(self, other: "IngestStats") -> None:
+        self.added += other.added
+        self.skipped += other.skipped
+        self.noise += other.noise
+        self.duplicates += other.duplicates
+
+
+@dataclass
+class Prefilter:
+    # Дешёвые проверки над байтами строки до декодирования и регулярных выражений.
+    required: Tuple[bytes, ...] = ()
+    starts_with_digit: bool = False
+    noise: Tuple[bytes, ...] = field(default_factory=tuple)
+
+    def check(self, line: bytes) -> int:
+        # 0 — строку нужно разбирать, 1 — заведомо не подходит, 2 — шум.
+        # шум проверяется раньше признаков формата: шумовая строка чужого
+        # формата тоже учитывается как шум, а не как пропущенная
+        if line.startswith(COMMENT_PREFIXES):
+            return 1
+        for token in self.noise:
+            if token in line:
+                return 2
+        if self.starts_with_digit and line[0] not in DIGITS:
+            return 1
+        for token in self.required:
+            if token not in line:
+                return 1
+        return 0
+
+
+def build_prefilter(parser: ParserFunc, cfg: Config) -> Prefilter:
+    # Префильтр для парсера: признаки формата берутся из его FormatSpec (если есть),
+    # шумовые шаблоны — из конфигурации.
+    spec = getattr(parser, "spec", None)
+    return Prefilter(
+        required=tuple(spec.required_bytes) if spec is not None else (),
+        starts_with_digit=bool(spec is not None and spec.starts_with_digit),
+        noise=tuple(p.encode("utf-8") for p in cfg.noise_patterns if p),
+    )
+
+
+def parser_source(parser: ParserFunc, default: str) -> str:
+    # Логический источник парсера (для FormatSpec — spec.source, иначе имя формата).
+    spec = getattr(parser, "spec", None)
+    if spec is not None:
+        return spec.source or spec.name
+    return default
+
+
+def iter_log_file(
+    path: str,
+    parser: ParserFunc,
+    cfg: Config,
+    dedup: Optional[LineDeduplicator] = None,
+    source: str = "",
+    stats: Optional[IngestStats] = None,
+    custody: Optional[CustodyLog] = None,
+    raw: Optional[RawLineStore] = None,
+) -> Iterator[LogEvent]:
+    # Чтение файла лога в двоичном режиме: пустые строки, комментарии, строки
+    # чужого формата и шум отсекаются по байтам, повторы уже загруженных строк
+    # (если передан dedup) — по хэшу, декодируются и разбираются только
+    # оставшиеся строки. События выдаются по одному в порядке файла,
+    # итоги накапливаются в stats.
+    # С custody в том же проходе считаются SHA-256 файла и хэши блоков
+    # (файл добавляется в журнал хранения), событие получает block_ref.
+    # С raw исходные строки событий сразу уходят в сжатое хранилище (raw_ref).
+    with open(path, "rb") as f:
+        if custody is None and raw is None:
+            yield from iter_log_lines(f, parser, cfg, dedup, source, stats)
+            return
+        lines: Iterable[bytes] = f
+        if custody is not None:
+            reader = custody.reader(path, parser_source(parser, source))
+            lines = reader.lines(f)
+        for ev in iter_log_lines(lines, parser, cfg, dedup, source, stats):
+            if custody is not None:
+                ev.block_ref = reader.ref  # блок строки, из которой только что разобрано событие
+            if raw is not None:
+                ev.raw_ref = raw.add(ev.raw_line)
+                ev.raw_line = None
+            yield ev
+
+
+def iter_log_lines(
+    lines: Iterable[bytes],
+    parser: ParserFunc,
+    cfg: Config,
+    dedup: Optional[LineDeduplicator] = None,
+    source: str = "",
+    stats: Optional[IngestStats] = None,
+) -> Iterator[LogEvent]:
+    # То же для готовой последовательности байтовых строк (файл, часть файла в памяти).
+    if stats is None:
+        stats = IngestStats()
+    prefilter = build_prefilter(parser, cfg)
+    check = prefilter.check
+    source = parser_source(parser, source)
+    # хэш строки запоминается только после того, как из неё получено событие:
+    # отброшенная парсером строка при следующей загрузке снова считается пропущенной
+    seen = dedup.seen if dedup is not None else None
+    for raw in lines:
+        raw = raw.strip()
+        if not raw:
+            continue
+        verdict = check(raw)
+        if verdict:
+            if verdict == 2:
+                stats.noise += 1
+            else:
+                stats.skipped += 1
+            continue
+        if seen is not None:
+            h = line_hash(source, raw)
+            if seen(h):
+                stats.duplicates += 1
+                continue
+        ev = parser(raw.decode("utf-8", "ignore"), cfg)
+        if ev is None:
+            stats.skipped += 1
+            continue
+        if seen is not None:
+            dedup.add(h)
+        stats.added += 1
+        yield ev
+
+
+def read_log_file(
+    path: str,
+    parser: ParserFunc,
+    cfg: Config,
+    events: List[LogEvent],
+    dedup: Optional[LineDeduplicator] = None,
+    source: str = "",
+    custody: Optional[CustodyLog] = None,
+    raw: Optional[RawLineStore] = None,
+) -> IngestStats:
+    # Прочитать файл целиком; разобранные события добавляются в events.
+    stats = IngestStats()
+    events.extend(iter_log_file(path, parser, cfg, dedup, source, stats, custody, raw))
+    return stats
@@ -0,0 +1,590 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+from typing import Callable, Dict, List, Optional, Tuple
+from models import LogEvent, details_type
+from config_manager import Config, config_from_dict
+from aggregates import EventAggregates
+from classifier import classify_events
+from correlator import SessionCorrelator, SessionSink
+
+# Сетевой приём логов: syslog по UDP/TCP и построчные логи по HTTP.
+#
+# Источник (ключ PARSERS) определяется тегом:
+#   syslog — тег программы в сообщении RFC 3164: '<13>Nov 10 13:55:36 gw vpn: <строка лога>'
+#            (допускается и короткая форма 'vpn: <строка лога>');
+#   HTTP   — путь запроса: 'POST /ingest/web' с телом из строк, разделённых '\n'.
+#
+# Строки собираются в пакеты по источнику, пакеты разбираются и
+# классифицируются в пуле процессов (на одном ядре и для парсеров, переданных
+# явно, — в пуле потоков), а корреляция в сессии выполняется непрерывно в
+# цикле событий. Процессы пула получают только (источник, строки): парсеры
+# и правила каждый процесс загружает и компилирует сам при старте, а события
+# возвращаются по столбцам — так их разбор в основном процессе дешевле. Очередь пакетов ограничена: TCP и HTTP
+# при переполнении ждут (противодавление через TCP), UDP-датаграммы
+# отбрасываются и учитываются в статистике. Пакет, на котором парсер или
+# классификация выбросили исключение, пропускается целиком (строки учитываются
+# как failed), приём продолжается.
+
+SYSLOG_RE = re.compile(
+    r"^(?:<\d{1,3}>)?"
+    r"(?:[A-Z][a-z]{2} [ \d]\d \d\d:\d\d:\d\d \S+ )?"
+    r"(?P<tag>[A-Za-z0-9_.-]+)(?:\[\d+\])?: ?"
+    r"(?P<msg>.*)$"
+)
+
+HTTP_PATH_PREFIX = "/ingest/"
+MAX_HTTP_BODY = 64 * 1024 * 1024
+
+
+@dataclass
+class ServiceStats:
+    received: int = 0     # строк принято со всех входов
+    parsed: int = 0       # событий после разбора
+    skipped: int = 0      # строк, не подошедших под формат
+    unrouted: int = 0     # строк с неизвестным тегом источника
+    dropped: int = 0      # UDP-строк, отброшенных при переполнении очереди
+    failed: int = 0       # строк в пакетах, на которых разбор или классификация упали
+    batches: int = 0
+    # события классифицируются пакетами по мере приёма — подтверждение другими
+    # источниками (бонус corroboration_bonus) к ним не применяется
+    corroboration_applied: bool = False
+    started_at: float = 0.0
+
+    @property
+    def lines_per_second(self) -> float:
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0.0
+        return self.received / elapsed if elapsed > 0 else 0.0
+
+
+def parse_batch(parser: Callable, lines: List[str], cfg: Config) -> List[LogEvent]:
+    # Разбор и классификация пакета строк одного источника.
+    events = []
+    for line in lines:
+        ev = parser(line, cfg)
+        if ev is not None:
+            events.append(ev)
+    classify_events(events, cfg)
+    return events
+
+
+# Процессы пула: парсеры и конфигурация загружаются один раз при старте процесса
+
+_worker_cfg: Optional[Config] = None
+_worker_parsers: Dict[str, Callable] = {}
+
+
+def _init_worker(cfg_data: dict) -> None:
+    global _worker_cfg, _worker_parsers
+    from parsers import PARSERS, load_parser_plugins
+    load_parser_plugins()
+    _worker_cfg = config_from_dict(cfg_data)
+    _worker_parsers = PARSERS
+
+
+def _parse_in_worker(source: str, lines: List[str]) -> tuple:
+    return _pack_events(parse_batch(_worker_parsers[source], lines, _worker_cfg))
+
+
+def _pack_events(events: List[LogEvent]) -> tuple:
+    # События пакета по столбцам; details — номер набора ключей и значения
+    # (dict — как есть). Списки строк и чисел pickle пишет без обхода объектов.
+    detail_keys: Dict[tuple, int] = {}
+    codes, values = [], []
+    for ev in events:
+        d = ev.details
+        keys = getattr(d, "_keys", None)
+        if keys is None:
+            codes.append(-1)
+            values.append(d)
+        else:
+            code = detail_keys.get(keys)
+            if code is None:
+                code = detail_keys[keys] = len(detail_keys)
+            codes.append(code)
+            values.append(tuple(tuple.__iter__(d)))
+    return (
+        [ev.source for ev in events], [ev.raw_line for ev in events], [ev.timestamp for ev in events],
+        [ev.ip for ev in events], [ev.user for ev in events], [ev.event_type for ev in events],
+        list(detail_keys), codes, values,
+        [ev.evidential_class for ev in events], [ev.notes for ev in events],
+        [ev.ts_us for ev in events], [ev.ip_int for ev in events],
+    )
+
+
+def _unpack_events(packed: tuple) -> List[LogEvent]:
+    (sources, raw_lines, timestamps, ips, users, event_types,
+     detail_keys, codes, values, classes, notes, ts_us, ip_ints) = packed
+    types = [details_type(keys) for keys in detail_keys]
+    return [
+        LogEvent(
+            sources[i], raw_lines[i], timestamps[i], ips[i], users[i], event_types[i],
+            types[codes[i]](values[i]) if codes[i] >= 0 else values[i],
+            classes[i], notes[i], None, ts_us[i], ip_ints[i],
+        )
+        for i in range(len(sources))
+    ]
+
+
+def split_syslog(message: str) -> Optional[Tuple[str, str]]:
+    # (тег, строка лога) из syslog-сообщения или None.
+    m = SYSLOG_RE.match(message)
+    if not m:
+        return None
+    return m.group("tag"), m.group("msg")
+
+
+class IngestService:
+    # Асинхронный сервис приёма. Готовые события передаются в on_events
+    # (вызывается в потоке цикла событий).
+
+    def __init__(
+        self,
+        cfg: Config,
+        parsers: Optional[Dict[str, Callable]] = None,
+        on_events: Optional[Callable[[List[LogEvent]], None]] = None,
+        session_sink: Optional[SessionSink] = None,
+        host: str = "127.0.0.1",
+        udp_port: Optional[int] = 5514,
+        tcp_port: Optional[int] = 5514,
+        http_port: Optional[int] = 8514,
+        batch_size: int = 2000,
+        flush_interval: float = 0.2,
+        queue_batches: int = 64,
+        workers: Optional[int] = None,
+        processes: Optional[bool] = None,
+    ):
+        # processes=None — пул процессов, если ядер больше одного и парсеры
+        # берутся из реестра (процесс пула загружает их сам)
+        cpus = os.cpu_count() or 1
+        if processes is None:
+            processes = parsers is None and cpus > 1
+        if workers is None:
+            workers = max(1, cpus - 1) if processes else 2
+        if parsers is None:
+            from parsers import PARSERS
+            parsers = PARSERS
+        self.cfg = cfg
+        self.parsers = parsers
+        self.on_events = on_events
+        self.host = host
+        self.udp_port = udp_port
+        self.tcp_port = tcp_port
+        self.http_port = http_port
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue_batches = queue_batches
+        self.workers = workers
+        self.processes = processes
+
+        self.stats = ServiceStats()
+        self.aggregates = EventAggregates()
+        # с session_sink завершённые сессии передаются наружу и не копятся в памяти
+        self.correlator = SessionCorrelator(cfg, sink=session_sink)
+        self._pending: Dict[str, List[str]] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._executor: Optional[Executor] = None
+        self._servers: list = []
+        self._transports: list = []
+        self._tasks: List[asyncio.Task] = []
+        self.bound: Dict[str, int] = {}
+
+    # Запуск и остановка
+
+    async def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.queue_batches)
+        if self.processes:
+            # spawn: дочерний процесс не наследует потоки и цикл событий
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker, initargs=(asdict(self.cfg),),
+            )
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="logclass-ingest")
+        self.stats.started_at = time.monotonic()
+
+        if self.udp_port is not None:
+            transport, _ = await loop.create_datagram_endpoint(
+                lambda: _SyslogUDP(self), local_addr=(self.host, self.udp_port)
+            )
+            self._transports.append(transport)
+            self.bound["udp"] = transport.get_extra_info("sockname")[1]
+        if self.tcp_port is not None:
+            server = await asyncio.start_server(self._handle_syslog_tcp, self.host, self.tcp_port)
+            self._servers.append(server)
+            self.bound["tcp"] = server.sockets[0].getsockname()[1]
+        if self.http_port is not None:
+            server = await asyncio.start_server(self._handle_http, self.host, self.http_port)
+            self._servers.append(server)
+            self.bound["http"] = server.sockets[0].getsockname()[1]
+
+        self._tasks.append(asyncio.create_task(self._flusher()))
+        self._tasks.append(asyncio.create_task(self._consumer()))
+
+    async def stop(self) -> None:
+        for transport in self._transports:
+            transport.close()
+        for server in self._servers:
+            server.close()
+            await server.wait_closed()
+        await self.flush()
+        if self._queue is not None:
+            await self._queue.join()
+        self.correlator.close()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        self._transports.clear()
+        self._servers.clear()
+        self._tasks.clear()
+
+    # Накопление пакетов
+
+    def _route(self, source: str, line: str) -> Optional[List[str]]:
+        # Добавить строку в пакет источника; вернуть пакет, если он заполнен.
+        self.stats.received += 1
+        if source not in self.parsers:
+            self.stats.unrouted += 1
+            return None
+        pending = self._pending.get(source)
+        if pending is None:
+            pending = self._pending[source] = []
+        pending.append(line)
+        if len(pending) >= self.batch_size:
+            self._pending[source] = []
+            return pending
+        return None
+
+    async def submit(self, source: str, line: str) -> None:
+        # Приём с противодавлением (TCP, HTTP): ждём места в очереди.
+        batch = self._route(source, line)
+        if batch is not None:
+            await self._queue.put((source, batch))
+
+    async def submit_many(self, source: str, lines: List[str]) -> None:
+        # Пакетный приём (HTTP): строки добавляются срезами без обхода по одной.
+        lines = [line for line in lines if line]
+        self.stats.received += len(lines)
+        if source not in self.parsers:
+            self.stats.unrouted += len(lines)
+            return
+        pending = self._pending.setdefault(source, [])
+        pos = 0
+        while pos < len(lines):
+            take = self.batch_size - len(pending)
+            pending.extend(lines[pos:pos + take])
+            pos += take
+            if len(pending) >= self.batch_size:
+                self._pending[source] = []
+                await self._queue.put((source, pending))
+                # пока ждали места в очереди, flush мог заменить self._pending
+                pending = self._pending.setdefault(source, [])
+
+    def submit_nowait(self, source: str, line: str) -> None:
+        # Приём без ожидания (UDP): при переполнении очереди пакет отбрасывается.
+        batch = self._route(source, line)
+        if batch is None:
+            return
+        try:
+            self._queue.put_nowait((source, batch))
+        except asyncio.QueueFull:
+            self.stats.dropped += len(batch)
+
+    async def flush(self) -> None:
+        pending, self._pending = self._pending, {}
+        for source, batch in pending.items():
+            if batch:
+                await self._queue.put((source, batch))
+
+    async def _flusher(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    # Обработка пакетов
+
+    def _process_batch(self, source: str, lines: List[str]) -> List[LogEvent]:
+        # Выполняется в пуле потоков: разбор и классификация пакета.
+        return parse_batch(self.parsers[source], lines, self.cfg)
+
+    async def _consumer(self) -> None:
+        loop = asyncio.get_running_loop()
+        in_flight: "asyncio.Queue" = asyncio.Queue(maxsize=self.workers)
+
+        async def dispatch():
+            while True:
+                source, lines = await self._queue.get()
+                if self.processes:
+                    fut = loop.run_in_executor(self._executor, _parse_in_worker, source, lines)
+                else:
+                    fut = loop.run_in_executor(self._executor, self._process_batch, source, lines)
+                await in_flight.put((fut, source, len(lines)))
+
+        dispatcher = asyncio.create_task(dispatch())
+        try:
+            # пакеты завершаются в порядке поступления — корреляция видит их последовательно
+            while True:
+                fut, source, count = await in_flight.get()
+                try:
+                    events = await fut
+                    if self.processes:
+                        events = _unpack_events(events)
+                except Exception as e:
+                    self.stats.failed += count
+                    print(f"пакет {source} ({count} строк) пропущен: {type(e).__name__}: {e}", file=sys.stderr)
+                    continue
+                finally:
+                    self._queue.task_done()
+                self.stats.batches += 1
+                self.stats.parsed += len(events)
+                self.stats.skipped += count - len(events)
+                add_session = self.correlator.add
+                add_aggregate = self.aggregates.add
+                for ev in events:
+                    add_session(ev)
+                    add_aggregate(ev)
+                if self.on_events is not None and events:
+                    self.on_events(events)
+        finally:
+            dispatcher.cancel()
+
+    # Входы
+
+    async def _handle_syslog_tcp(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                raw = await reader.readline()
+                if not raw:
+                    break
+                routed = split_syslog(raw.decode("utf-8", "ignore").rstrip("\r\n"))
+                if routed is None:
+                    self.stats.received += 1
+                    self.stats.unrouted += 1
+                    continue
+                await self.submit(*routed)
+        finally:
+            writer.close()
+
+    async def _handle_http(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, path, _version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self._http_reply(writer, 400, {"error": "bad request line"})
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                length = headers.get("content-length")
+                body = b""
+                if length is not None:
+                    if not length.isdigit() or int(length) > MAX_HTTP_BODY:
+                        await self._http_reply(writer, 413, {"error": "body too large"})
+                        break
+                    body = await reader.readexactly(int(length))
+
+                if method != "POST" or not path.startswith(HTTP_PATH_PREFIX):
+                    await self._http_reply(writer, 404, {"error": "use POST /ingest/<source>"})
+                elif length is None:
+                    await self._http_reply(writer, 411, {"error": "Content-Length required"})
+                else:
+                    source = path[len(HTTP_PATH_PREFIX):].strip("/")
+                    if source not in self.parsers:
+                        await self._http_reply(writer, 404, {"error": f"unknown source: {source}"})
+                    else:
+                        lines = body.decode("utf-8", "ignore").splitlines()
+                        await self.submit_many(source, lines)
+                        await self._http_reply(writer, 202, {"accepted": len(lines)})
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _http_reply(writer: asyncio.StreamWriter, status: int, payload: dict) -> None:
+        reasons = {202: "Accepted", 400: "Bad Request", 404: "Not Found", 411: "Length Required",
+                   413: "Payload Too Large"}
+        body = json.dumps(payload).encode("utf-8")
+        writer.write(
+            f"HTTP/1.1 {status} {reasons.get(status, '')}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode("latin-1")
+            + body
+        )
+        await writer.drain()
+
+
+class _SyslogUDP(asyncio.DatagramProtocol):
+    def __init__(self, service: IngestService):
+        self.service = service
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        for message in data.decode("utf-8", "ignore").splitlines():
+            routed = split_syslog(message)
+            if routed is None:
+                self.service.stats.received += 1
+                self.service.stats.unrouted += 1
+                continue
+            self.service.submit_nowait(*routed)
+
+
+class JsonlSessionSink:
+    # Приёмник завершённых сессий: по строке JSON на сессию.
+
+    def __init__(self, path: str):
+        self._file = open(path, "a", encoding="utf-8")
+
+    def __call__(self, sess) -> None:
+        record = {
+            "id": sess.id,
+            "key_type": sess.key_type,
+            "key": sess.key,
+            "start": sess.start_time.isoformat() if sess.start_time else None,
+            "end": sess.end_time.isoformat() if sess.end_time else None,
+            "sources": sorted(sess.sources),
+            "classes": sorted(sess.classes),
+            "events": [ev.raw_line for ev in sess.events],
+        }
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def close(self) -> None:
+        self._file.close()
+
+
+# Локальный отправитель для проверки и замеров
+
+async def send_tcp_syslog(host: str, port: int, source: str, lines: List[str]) -> None:
+    _, writer = await asyncio.open_connection(host, port)
+    chunk = []
+    for line in lines:
+        chunk.append(f"<14>{source}: {line}\n")
+        if len(chunk) >= 1000:
+            writer.write("".join(chunk).encode("utf-8"))
+            await writer.drain()
+            chunk = []
+    if chunk:
+        writer.write("".join(chunk).encode("utf-8"))
+    await writer.drain()
+    writer.close()
+    await writer.wait_closed()
+
+
+async def send_http(host: str, port: int, source: str, lines: List[str], chunk_lines: int = 5000) -> None:
+    reader, writer = await asyncio.open_connection(host, port)
+    for start in range(0, len(lines), chunk_lines):
+        body = ("\n".join(lines[start:start + chunk_lines]) + "\n").encode("utf-8")
+        writer.write(
+            f"POST {HTTP_PATH_PREFIX}{source} HTTP/1.1\r\nHost: {host}\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body
+        )
+        await writer.drain()
+        status = await reader.readline()
+        length = 0
+        while True:
+            header = await reader.readline()
+            if header in (b"\r\n", b""):
+                break
+            if header.lower().startswith(b"content-length:"):
+                length = int(header.split(b":")[1])
+        await reader.readexactly(length)
+        if b" 202 " not in status:
+            raise RuntimeError(status.decode("latin-1").strip())
+    writer.close()
+    await writer.wait_closed()
+
+
+async def _bench(total: int, transport: str, workers: Optional[int] = None,
+                 processes: Optional[bool] = None) -> ServiceStats:
+    from generator import generate_scenario_logs
+    web, _proxy, _vpn = generate_scenario_logs()
+    lines = (web * (total // len(web) + 1))[:total]
+    service = IngestService(Config(), udp_port=None, tcp_port=0, http_port=0,
+                            workers=workers, processes=processes)
+    await service.start()
+    started = time.monotonic()
+    cpu_started = time.process_time()
+    if transport == "http":
+        await send_http("127.0.0.1", service.bound["http"], "web", lines)
+    else:
+        await send_tcp_syslog("127.0.0.1", service.bound["tcp"], "web", lines)
+    while service.stats.received < total:
+        await asyncio.sleep(0.01)
+    await service.stop()
+    elapsed = time.monotonic() - started
+    # время ЦП основного процесса (приём, корреляция и отправитель; без процессов пула):
+    # при достаточном числе ядер для пула пропускная способность упирается в него
+    cpu = time.process_time() - cpu_started
+    mode = f"процессов {service.workers}" if service.processes else f"потоков {service.workers}"
+    print(f"{transport}, {mode}: {total} строк за {elapsed:.2f} с — {total / elapsed:,.0f} строк/с; "
+          f"ЦП основного процесса {cpu:.2f} с (до {total / cpu:,.0f} строк/с); "
+          f"{json.dumps(asdict(service.stats), ensure_ascii=False)}")
+    return service.stats
+
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Сетевой приём логов LogClass")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    serve = sub.add_parser("serve", help="запустить приём")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--udp-port", type=int, default=5514)
+    serve.add_argument("--tcp-port", type=int, default=5514)
+    serve.add_argument("--http-port", type=int, default=8514)
+    serve.add_argument("--sessions-out", help="файл JSONL для завершённых сессий (потоковый режим)")
+    bench = sub.add_parser("bench", help="замер пропускной способности с локальным отправителем")
+    bench.add_argument("--lines", type=int, default=200_000)
+    bench.add_argument("--transport", choices=("tcp", "http"), default="http")
+    bench.add_argument("--workers", type=int, help="процессов (потоков) разбора")
+    bench.add_argument("--pool", choices=("auto", "processes", "threads"), default="auto",
+                       help="пул разбора (auto — процессы, если ядер больше одного)")
+    args = ap.parse_args()
+
+    if args.cmd == "bench":
+        asyncio.run(_bench(args.lines, args.transport, args.workers,
+                          {"auto": None, "processes": True, "threads": False}[args.pool]))
+    else:
+        async def _serve():
+            from config_manager import load_config
+            sink = JsonlSessionSink(args.sessions_out) if args.sessions_out else None
+            service = IngestService(
+                load_config(), host=args.host, session_sink=sink,
+                udp_port=args.udp_port, tcp_port=args.tcp_port, http_port=args.http_port,
+            )
+            await service.start()
+            print(f"Приём запущен: {service.bound}; подтверждение другими источниками не применяется")
+            try:
+                while True:
+                    await asyncio.sleep(5)
+                    s = service.stats
+                    c = service.correlator
+                    print(f"принято {s.received}, событий {s.parsed}, активных сессий {c.active_count}, "
+                          f"завершено {c.finalized}, опоздавших {c.late}, отброшено {s.dropped}, "
+                          f"с ошибкой {s.failed}, "
+                          f"{s.lines_per_second:,.0f} строк/с")
+            finally:
+                await service.stop()
+                if sink is not None:
+                    sink.close()
+        try:
+            asyncio.run(_serve())
+        except KeyboardInterrupt:
+            pass
@@ -1,19 +1,32 @@
 import os
-from typing import List
+import time
+from typing import List, Optional
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 from models import LogEvent, Session
+from aggregates import EventAggregates
+from sketches import EventSketches
 from config_manager import load_config, save_config, Config
-from parsers import PARSERS
 from classifier import classify_events
+from rule_engine import recompile_rules, compiled_rules
+from query import EventIndex, EventQuery, parse_query
+from dedup import LineDeduplicator, line_hash
+from timeutil import resolve_zone, from_micros
 from correlator import build_sessions
-from reports import (
-    export_events_csv,
-    export_summary_markdown,
-    plot_class_distribution,
-    plot_source_distribution,
-)
-from generator import generate_scenario_logs
+from actors import Actor, resolve_actors
+from corroboration import Corroboration, corroborate
+from netinfo import reload_ip_ranges
+from custody import CustodyLog
+from rawstore import RawLineStore
+from textindex import TrigramIndex
+
+# Тяжёлые модули (parsers, reports с matplotlib, generator) импортируются
+# при первом использовании, чтобы окно появлялось сразу после запуска.
+
+# строк хронологии сессии на одной странице
+TIMELINE_PAGE_SIZE = 200
+# сессии длиннее этого порога открываются свёрнутыми по минутам
+TIMELINE_COLLAPSE_EVENTS = 1000
 
 class SettingsWindow(tk.Toplevel):
  #Окно настроек правил анализа и классификации.
@@ -42,6 +55,10 @@ class SettingsWindow(tk.Toplevel):
         self.entry_auth = tk.Entry(kw_frame, width=80)
         self.entry_auth.pack(fill=tk.X, padx=2, pady=2)
         self.entry_auth.insert(0, ", ".join(cfg.auth_keywords))
+        ttk.Label(kw_frame, text="Шумовые строки — отбрасываются до разбора (через запятую):").pack(anchor=tk.W)
+        self.entry_noise = tk.Entry(kw_frame, width=80)
+        self.entry_noise.pack(fill=tk.X, padx=2, pady=2)
+        self.entry_noise.insert(0, ", ".join(cfg.noise_patterns))
 
         # Параметры анализа
         params_frame = ttk.LabelFrame(main_frame, text="Параметры анализа")
@@ -58,12 +75,55 @@ class SettingsWindow(tk.Toplevel):
         self.entry_session_window = tk.Entry(row2, width=15)
         self.entry_session_window.pack(side=tk.LEFT)
         self.entry_session_window.insert(0, str(cfg.session_window_minutes))
+        row_actor = ttk.Frame(params_frame)
+        row_actor.pack(fill=tk.X, pady=2)
+        ttk.Label(row_actor, text="Окно связывания участников (минут):", width=40).pack(side=tk.LEFT, anchor=tk.W)
+        self.entry_actor_window = tk.Entry(row_actor, width=15)
+        self.entry_actor_window.pack(side=tk.LEFT)
+        self.entry_actor_window.insert(0, str(cfg.actor_window_minutes))
+        row_corr = ttk.Frame(params_frame)
+        row_corr.pack(fill=tk.X, pady=2)
+        ttk.Label(row_corr, text="Окно подтверждения другими источниками (минут):", width=40).pack(
+            side=tk.LEFT, anchor=tk.W
+        )
+        self.entry_corroboration_window = tk.Entry(row_corr, width=15)
+        self.entry_corroboration_window.pack(side=tk.LEFT)
+        self.entry_corroboration_window.insert(0, str(cfg.corroboration_window_minutes))
+        row_prefix = ttk.Frame(params_frame)
+        row_prefix.pack(fill=tk.X, pady=2)
+        ttk.Label(row_prefix, text="Сессии по подсети: префикс IPv4 / IPv6:", width=40).pack(side=tk.LEFT, anchor=tk.W)
+        self.entry_prefix_v4 = tk.Entry(row_prefix, width=6)
+        self.entry_prefix_v4.pack(side=tk.LEFT)
+        self.entry_prefix_v4.insert(0, str(cfg.session_prefix_v4))
+        self.entry_prefix_v6 = tk.Entry(row_prefix, width=6)
+        self.entry_prefix_v6.pack(side=tk.LEFT, padx=5)
+        self.entry_prefix_v6.insert(0, str(cfg.session_prefix_v6))
+        row_ranges = ttk.Frame(params_frame)
+        row_ranges.pack(fill=tk.X, pady=2)
+        ttk.Label(row_ranges, text="Справочник сетей (CSV: cidr,site,owner,nat,tag):", width=40).pack(
+            side=tk.LEFT, anchor=tk.W
+        )
+        self.entry_ip_ranges = tk.Entry(row_ranges, width=40)
+        self.entry_ip_ranges.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.entry_ip_ranges.insert(0, cfg.ip_ranges_file)
+
+        # Часовые пояса и смещения времени
+        row3 = ttk.Frame(params_frame)
+        row3.pack(fill=tk.X, pady=2)
+        ttk.Label(row3, text="Часовой пояс строк без зоны (UTC, local, +03:00):", width=40).pack(
+            side=tk.LEFT, anchor=tk.W
+        )
+        self.entry_default_zone = tk.Entry(row3, width=15)
+        self.entry_default_zone.pack(side=tk.LEFT)
+        self.entry_default_zone.insert(0, cfg.default_time_zone)
 
-        # Смещения времени
         offsets_frame = ttk.Frame(params_frame)
         offsets_frame.pack(fill=tk.X, pady=2)
-        ttk.Label(offsets_frame, text="Смещения времени (минуты):").pack(anchor=tk.W)
+        ttk.Label(offsets_frame, text="Смещения времени (минуты) и часовые поясы источников (пусто — общий):").pack(
+            anchor=tk.W
+        )
         self.offset_entries = {}
+        self.zone_entries = {}
         for src in ("web", "proxy", "vpn"):
             row = ttk.Frame(offsets_frame)
             row.pack(fill=tk.X, pady=1)
@@ -72,6 +132,10 @@ class SettingsWindow(tk.Toplevel):
             e.pack(side=tk.LEFT)
             e.insert(0, str(cfg.time_offsets_minutes.get(src, 0)))
             self.offset_entries[src] = e
+            z = tk.Entry(row, width=20)
+            z.pack(side=tk.LEFT, padx=5)
+            z.insert(0, cfg.time_zones.get(src, ""))
+            self.zone_entries[src] = z
 
         # Весовые коэффициенты
         weights_frame = ttk.LabelFrame(main_frame, text="Весовые коэффициенты классификации")
@@ -105,6 +169,9 @@ class SettingsWindow(tk.Toplevel):
         self.entry_penalty_no_time = make_weight_row(
             weights_frame, "Штраф за отсутствие однозначного времени события:", "penalty_no_time"
         )
+        self.entry_corroboration_bonus = make_weight_row(
+            weights_frame, "Бонус за подтверждение другим источником:", "corroboration_bonus"
+        )
 
         # Юридические описания классов
         desc_frame = ttk.LabelFrame(main_frame, text="Юридические описания классов значимости")
@@ -125,20 +192,32 @@ class SettingsWindow(tk.Toplevel):
         btn_frame.pack(fill=tk.X, pady=5)
         ttk.Button(btn_frame, text="Сохранить", command=self.on_save).pack(side=tk.RIGHT, padx=5)
         ttk.Button(btn_frame, text="Отмена", command=self.destroy).pack(side=tk.RIGHT)
+        ttk.Button(btn_frame, text="Что если…", command=self.on_whatif).pack(side=tk.LEFT)
 
-    def on_save(self):
+    def _read_form(self) -> Optional[dict]:
+        # Значения формы; None (с сообщением об ошибке), если числа введены неверно.
         try:
             # Ключевые слова
             sens_list = [s.strip() for s in self.entry_sensitive.get().split(",") if s.strip()]
             auth_list = [s.strip() for s in self.entry_auth.get().split(",") if s.strip()]
+            noise_list = [s.strip() for s in self.entry_noise.get().split(",") if s.strip()]
 
             # Параметры анализа
             threshold = int(self.entry_threshold.get())
             session_window = int(self.entry_session_window.get())
+            actor_window = int(self.entry_actor_window.get())
+            corroboration_window = int(self.entry_corroboration_window.get())
+            prefix_v4 = int(self.entry_prefix_v4.get())
+            prefix_v6 = int(self.entry_prefix_v6.get())
+            if not (0 <= prefix_v4 <= 32 and 0 <= prefix_v6 <= 128):
+                raise ValueError("prefix")
+            ip_ranges_file = self.entry_ip_ranges.get().strip()
 
             offsets = {}
             for src, entry in self.offset_entries.items():
                 offsets[src] = int(entry.get())
+            default_zone = self.entry_default_zone.get().strip() or "UTC"
+            zones = {src: z.get().strip() for src, z in self.zone_entries.items() if z.get().strip()}
 
             # Весовые коэффициенты
             weight_user = int(self.entry_weight_user.get())
@@ -147,6 +226,7 @@ class SettingsWindow(tk.Toplevel):
             weight_auth = int(self.entry_weight_auth.get())
             weight_sensitive = int(self.entry_weight_sensitive.get())
             penalty_no_time = int(self.entry_penalty_no_time.get())
+            corroboration_bonus = int(self.entry_corroboration_bonus.get())
 
             # Описания классов
             class_descriptions = {}
@@ -155,24 +235,103 @@ class SettingsWindow(tk.Toplevel):
                 class_descriptions[cls] = val
 
         except ValueError:
-            messagebox.showerror("Ошибка", "Некорректные числовые значения в настройках.")
+            messagebox.showerror("Ошибка", "Некорректные числовые значения в настройках.", parent=self)
+            return None
+        for zone in [default_zone, *zones.values()]:
+            try:
+                resolve_zone(zone)
+            except ValueError as e:
+                messagebox.showerror("Ошибка", str(e), parent=self)
+                return None
+        return dict(
+            sens_list=sens_list, auth_list=auth_list, noise_list=noise_list,
+            threshold=threshold, session_window=session_window, offsets=offsets,
+            actor_window=actor_window, corroboration_window=corroboration_window,
+            prefix_v4=prefix_v4, prefix_v6=prefix_v6, ip_ranges_file=ip_ranges_file,
+            default_zone=default_zone, zones=zones,
+            weight_user=weight_user, weight_ip=weight_ip, weight_vpn=weight_vpn,
+            weight_auth=weight_auth, weight_sensitive=weight_sensitive,
+            penalty_no_time=penalty_no_time, corroboration_bonus=corroboration_bonus,
+            class_descriptions=class_descriptions,
+        )
+
+    @staticmethod
+    def _apply_form(cfg: Config, values: dict) -> None:
+        cfg.sensitive_keywords = values["sens_list"]
+        cfg.auth_keywords = values["auth_list"]
+        cfg.noise_patterns = values["noise_list"]
+        cfg.file_transfer_threshold = values["threshold"]
+        cfg.session_window_minutes = values["session_window"]
+        cfg.actor_window_minutes = values["actor_window"]
+        cfg.corroboration_window_minutes = values["corroboration_window"]
+        cfg.session_prefix_v4 = values["prefix_v4"]
+        cfg.session_prefix_v6 = values["prefix_v6"]
+        cfg.ip_ranges_file = values["ip_ranges_file"]
+        cfg.time_offsets_minutes = values["offsets"]
+        cfg.default_time_zone = values["default_zone"]
+        cfg.time_zones = values["zones"]
+        w = cfg.scoring
+        w.weight_user = values["weight_user"]
+        w.weight_ip = values["weight_ip"]
+        w.weight_vpn_source = values["weight_vpn"]
+        w.weight_auth_event = values["weight_auth"]
+        w.weight_sensitive_event = values["weight_sensitive"]
+        w.penalty_no_time = values["penalty_no_time"]
+        w.corroboration_bonus = values["corroboration_bonus"]
+        cfg.class_descriptions = values["class_descriptions"]
+
+    def on_whatif(self):
+        # Сравнить форму с текущими настройками на загруженных событиях, ничего не меняя.
+        values = self._read_form()
+        if values is None:
+            return
+        app = self.app
+        if not app.events:
+            messagebox.showinfo("Что если", "Нет загруженных событий для сравнения.", parent=self)
+            return
+        import copy
+        from whatif import evaluate_configs, format_whatif_report
+
+        candidate = copy.deepcopy(app.config)
+        self._apply_form(candidate, values)
+        recompile_rules(candidate)
+        results, elapsed = evaluate_configs(
+            app.events, {"Настройки из формы": candidate}, app.config, app.corroboration
+        )
+        report = format_whatif_report(results, app.aggregates.class_counts, len(app.events), elapsed)
+        if candidate.session_window_minutes != app.config.session_window_minutes or \
+                candidate.time_offsets_minutes != app.config.time_offsets_minutes or \
+                candidate.default_time_zone != app.config.default_time_zone or \
+                candidate.time_zones != app.config.time_zones or \
+                candidate.session_prefix_v4 != app.config.session_prefix_v4 or \
+                candidate.session_prefix_v6 != app.config.session_prefix_v6 or \
+                candidate.ip_ranges_file != app.config.ip_ranges_file or \
+                candidate.corroboration_window_minutes != app.config.corroboration_window_minutes:
+            report += (
+                "\nОкно сессии, группировка IP, часовые поясы, смещения времени и окно подтверждения "
+                "в сравнении не учитываются (нужна пересборка сессий и подтверждений)."
+            )
+
+        win = tk.Toplevel(self)
+        win.title("Что если: сравнение настроек")
+        text = tk.Text(win, width=80, height=30, wrap="word")
+        text.pack(fill=tk.BOTH, expand=True)
+        text.configure(font=("Courier New", 9))
+        text.insert("1.0", report)
+        text.configure(state=tk.DISABLED)
+
+    def on_save(self):
+        values = self._read_form()
+        if values is None:
             return
 
         # Применяем изменения к конфигу приложения
+        from whatif import EVENT_TYPE_FIELDS, retype_events
+
         cfg = self.app.config
-        cfg.sensitive_keywords = sens_list
-        cfg.auth_keywords = auth_list
-        cfg.file_transfer_threshold = threshold
-        cfg.session_window_minutes = session_window
-        cfg.time_offsets_minutes = offsets
-        w = cfg.scoring
-        w.weight_user = weight_user
-        w.weight_ip = weight_ip
-        w.weight_vpn_source = weight_vpn
-        w.weight_auth_event = weight_auth
-        w.weight_sensitive_event = weight_sensitive
-        w.penalty_no_time = penalty_no_time
-        cfg.class_descriptions = class_descriptions
+        before = {name: getattr(cfg, name) for name in EVENT_TYPE_FIELDS}
+        self._apply_form(cfg, values)
+        reload_ip_ranges(cfg)  # справочник сетей перечитывается из файла
 
         # Сохраняем в файл и пересчитываем классификацию
         try:
@@ -181,26 +340,152 @@ class SettingsWindow(tk.Toplevel):
             messagebox.showerror("Ошибка", f"Не удалось сохранить конфигурацию:\n{e}")
             return
 
-        classify_events(self.app.events, cfg)
+        # типы событий зависят только от ключевых слов и порога передачи файла
+        if any(getattr(cfg, name) != value for name, value in before.items()):
+            retype_events(self.app.events, cfg)
+        recompile_rules(cfg)
+        self.app._reclassify()
         self.app._rebuild_sessions()
 
         messagebox.showinfo("Настройки", "Настройки сохранены и применены.")
         self.destroy()
 
 
+class TriageWindow(tk.Toplevel):
+    # Быстрая оценка больших файлов по выборке до полной загрузки.
+    def __init__(self, master: tk.Tk, app: "LogClassifierGUI"):
+        super().__init__(master)
+        self.app = app
+        self.files: List[tuple] = []   # (путь, формат)
+        self._reports = None
+        self.title("Быстрая оценка")
+        self._build_ui()
+
+    def _build_ui(self):
+        from parsers import available_formats
+        frame = ttk.Frame(self)
+        frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+
+        row = ttk.Frame(frame)
+        row.pack(fill=tk.X, pady=2)
+        ttk.Label(row, text="Формат:").pack(side=tk.LEFT)
+        formats = available_formats()
+        self.format_var = tk.StringVar(value="web" if "web" in formats else formats[0])
+        ttk.Combobox(row, textvariable=self.format_var, values=formats, width=16, state="readonly").pack(
+            side=tk.LEFT, padx=2
+        )
+        ttk.Button(row, text="Добавить файлы…", command=self.add_files).pack(side=tk.LEFT, padx=5)
+        ttk.Label(row, text="Доля каждого файла, %:").pack(side=tk.LEFT, padx=(10, 2))
+        self.entry_fraction = tk.Entry(row, width=8)
+        self.entry_fraction.pack(side=tk.LEFT)
+        self.entry_fraction.insert(0, f"{100 * self.app.config.triage_fraction:g}")
+        self.btn_start = ttk.Button(row, text="Оценить", command=self.start)
+        self.btn_start.pack(side=tk.LEFT, padx=5)
+
+        self.list_files = tk.Listbox(frame, height=4)
+        self.list_files.pack(fill=tk.X, pady=2)
+        self.text = tk.Text(frame, wrap="none", width=110, height=32)
+        self.text.pack(fill=tk.BOTH, expand=True)
+        self.text.configure(font=("Courier New", 9))
+
+    def add_files(self):
+        fmt = self.format_var.get()
+        paths = filedialog.askopenfilenames(
+            parent=self,
+            title=f"Файлы для оценки ({fmt})",
+            filetypes=[("Log files", "*.log *.txt"), ("All files", "*.*")],
+        )
+        for path in paths:
+            self.files.append((path, fmt))
+            self.list_files.insert(tk.END, f"{fmt}: {path}")
+
+    def start(self):
+        if not self.files:
+            messagebox.showwarning("Быстрая оценка", "Добавьте файлы для оценки.", parent=self)
+            return
+        try:
+            fraction = float(self.entry_fraction.get().replace(",", ".")) / 100
+            if not 0 < fraction <= 1:
+                raise ValueError
+        except ValueError:
+            messagebox.showerror("Быстрая оценка", "Доля должна быть числом от 0 до 100.", parent=self)
+            return
+        from parsers import PARSERS
+        from triage import triage_files
+        files = [(path, PARSERS[fmt], fmt) for path, fmt in self.files]
+        self._reports = triage_files(files, self.app.config, fraction)
+        self.btn_start.configure(state=tk.DISABLED)
+        self.after(1, self._step)
+
+    def _step(self):
+        # один раунд выборки за вызов: окно остаётся отзывчивым, оценка уточняется на глазах
+        from triage import format_report
+        try:
+            report = next(self._reports)
+        except StopIteration:
+            report = None
+        except Exception as e:
+            self.btn_start.configure(state=tk.NORMAL)
+            messagebox.showerror("Быстрая оценка", f"Не удалось прочитать файлы:\n{e}", parent=self)
+            return
+        if report is not None:
+            self.text.delete("1.0", tk.END)
+            self.text.insert(tk.END, format_report(report))
+        if report is None or report.done:
+            self.btn_start.configure(state=tk.NORMAL)
+            return
+        self.after(1, self._step)
+
+
 class LogClassifierGUI:
     def __init__(self, master: tk.Tk):
         self.master = master
         master.title("Классификатор цифровых следов в логах")
 
-        self.config: Config = load_config()
+        # rules.json читается после первой отрисовки окна (см. _load_initial_config)
+        self.config: Config = Config()
         self.events: List[LogEvent] = []
         self.sessions: List[Session] = []
+        self.actors: List[Actor] = []
+        # подтверждение событий другими источниками (бонус к баллам при классификации)
+        self.corroboration = Corroboration()
+        # журнал хранения: хэши загруженных файлов и их блоков
+        self.custody = CustodyLog()
+        # исходные строки событий, сжатые блоками (у событий — только raw_ref),
+        # с триграммным индексом для поиска text= / re=
+        self.raw_lines = self._new_raw_store()
+        self.aggregates = EventAggregates()
+        self.event_index = EventIndex(self.events, self.raw_lines)
+        # повторно загружаемые строки (тот же файл, пересекающиеся ротации) отбрасываются
+        self.deduplicator = LineDeduplicator()
+        self._dedup_stale = False
+        # журнал загрузок (сохраняется в файле дела)
+        self.load_history: List[dict] = []
+        # индексы событий — результат поиска (None — показываются все события)
+        self.query_result: Optional[List[int]] = None
+        # хронология выбранной сессии: сессия, свёртки по минутам, текущая страница
+        self.timeline_session: Optional[Session] = None
+        self.timeline_groups = None
+        self.session_page = 0
 
         self.class_filter_var = tk.StringVar(value="Все")
 
         self._build_ui()
         self._rebuild_sessions()
+        master.after_idle(self._load_initial_config)
+
+    def _new_raw_store(self) -> RawLineStore:
+        return RawLineStore(index=TrigramIndex() if self.config.text_index else None)
+
+    def _load_initial_config(self):
+        self.config = load_config()
+        if not len(self.raw_lines):
+            self.raw_lines = self._new_raw_store()
+            self.event_index = EventIndex(self.events, self.raw_lines)
+        self._warn_rule_errors()
+        if self.events:
+            self._reclassify()
+            self._rebuild_sessions()
 
     def _build_ui(self):
         # Верхняя панель
@@ -212,12 +497,28 @@ class LogClassifierGUI:
         ttk.Button(top, text="Proxy", command=lambda: self.load_log_file("proxy")).pack(side=tk.LEFT, padx=2)
         ttk.Button(top, text="VPN", command=lambda: self.load_log_file("vpn")).pack(side=tk.LEFT, padx=2)
 
+        # Дополнительные форматы (в т.ч. из плагинов) — список заполняется при открытии
+        self.format_var = tk.StringVar(value="Формат…")
+        self.format_combo = ttk.Combobox(
+            top,
+            textvariable=self.format_var,
+            width=16,
+            state="readonly",
+            postcommand=self._fill_formats,
+        )
+        self.format_combo.pack(side=tk.LEFT, padx=2)
+        self.format_combo.bind("<<ComboboxSelected>>", lambda e: self.load_log_file(self.format_var.get()))
+
+        ttk.Button(top, text="Быстрая оценка…", command=self.open_triage).pack(side=tk.LEFT, padx=2)
+
         ttk.Button(top, text="Сгенерировать учебные логи", command=self.generate_demo_logs).pack(
             side=tk.LEFT, padx=10
         )
 
         # настройки и перезагрузка конфига
         ttk.Button(top, text="Перезагрузить конфиг", command=self.reload_config).pack(side=tk.RIGHT)
+        ttk.Button(top, text="Сохранить дело", command=self.save_case_file).pack(side=tk.RIGHT, padx=5)
+        ttk.Button(top, text="Открыть дело", command=self.open_case_file).pack(side=tk.RIGHT)
         ttk.Button(top, text="Настройки", command=self.open_settings).pack(side=tk.RIGHT, padx=5)
 
         # Фильтр по классу
@@ -246,25 +547,43 @@ class LogClassifierGUI:
         notebook.add(self.sessions_frame, text="Сессии")
         self._build_sessions_tab()
 
+        # Вкладка участников
+        self.actors_frame = ttk.Frame(notebook)
+        notebook.add(self.actors_frame, text="Участники")
+        self._build_actors_tab()
+
         # Нижняя панель
         bottom = ttk.Frame(self.master)
         bottom.pack(side=tk.BOTTOM, fill=tk.X, padx=5, pady=5)
         self.stats_label = ttk.Label(bottom, text="Событий: 0")
         self.stats_label.pack(side=tk.LEFT)
         ttk.Button(bottom, text="Показать слабые следы", command=self.show_weak_traces).pack(side=tk.LEFT, padx=5)
+        ttk.Button(bottom, text="Сводки (оценки)", command=self.show_sketches).pack(side=tk.LEFT, padx=5)
         ttk.Button(bottom, text="Экспорт CSV", command=self.export_csv).pack(side=tk.LEFT, padx=5)
         ttk.Button(bottom, text="Экспорт отчёта (MD)", command=self.export_md).pack(side=tk.LEFT, padx=5)
-        ttk.Button(bottom, text="График по классам", command=lambda: plot_class_distribution(self.events)).pack(
-            side=tk.RIGHT, padx=5
-        )
-        ttk.Button(bottom, text="График по источникам", command=lambda: plot_source_distribution(self.events)).pack(
-            side=tk.RIGHT, padx=5
-        )
+        ttk.Button(bottom, text="График по классам", command=self.plot_classes).pack(side=tk.RIGHT, padx=5)
+        ttk.Button(bottom, text="График по источникам", command=self.plot_sources).pack(side=tk.RIGHT, padx=5)
+        ttk.Button(bottom, text="Таймлайн", command=self.plot_timeline).pack(side=tk.RIGHT, padx=5)
 
     # Вкладка событий
 
     def _build_events_tab(self):
         frame = self.events_frame
+
+        # Строка поиска: user=alice ip=198.51.100.23 (или ip=10.1.0.0/16) session=3 from=13:50 to=14:10,
+        # text=upload.php re=curl/7\.\d+ — по исходным строкам (триграммный индекс)
+        search_frame = ttk.Frame(frame)
+        search_frame.pack(side=tk.TOP, fill=tk.X, pady=(0, 3))
+        ttk.Label(search_frame, text="Поиск:").pack(side=tk.LEFT)
+        self.search_var = tk.StringVar()
+        search_entry = ttk.Entry(search_frame, textvariable=self.search_var)
+        search_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=2)
+        search_entry.bind("<Return>", lambda e: self.run_search())
+        ttk.Button(search_frame, text="Найти", command=self.run_search).pack(side=tk.LEFT, padx=2)
+        ttk.Button(search_frame, text="Сбросить", command=self.clear_search).pack(side=tk.LEFT, padx=2)
+        self.search_status = ttk.Label(search_frame, text="")
+        self.search_status.pack(side=tk.LEFT, padx=5)
+
         table_frame = ttk.Frame(frame)
         table_frame.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
         columns = ("time", "source", "event", "user", "ip", "class")
@@ -275,7 +594,7 @@ class LogClassifierGUI:
             selectmode="browse",
         )
         for col, text, width, anchor in [
-            ("time", "Время", 150, tk.W),
+            ("time", "Время (UTC)", 150, tk.W),
             ("source", "Источник", 80, tk.W),
             ("event", "Событие", 140, tk.W),
             ("user", "Пользователь", 120, tk.W),
@@ -331,23 +650,123 @@ class LogClassifierGUI:
         # Детали сессии
         details_label = ttk.Label(frame, text="Подробности сессии:")
         details_label.pack(side=tk.TOP, anchor=tk.W)
-        self.text_session_details = tk.Text(frame, height=10, wrap="word")
+        self.text_session_details = tk.Text(frame, height=5, wrap="word")
         self.text_session_details.pack(side=tk.TOP, fill=tk.BOTH, expand=False)
         self.text_session_details.configure(font=("Courier New", 9))
 
+        # Хронология сессии: в таблицу выводится только текущая страница
+        # событий или свёртки по минутам, а не вся цепочка сразу
+        nav = ttk.Frame(frame)
+        nav.pack(side=tk.TOP, fill=tk.X, pady=2)
+        ttk.Label(nav, text="Хронология:").pack(side=tk.LEFT)
+        self.session_view_var = tk.StringVar(value="events")
+        ttk.Radiobutton(
+            nav, text="События", variable=self.session_view_var, value="events",
+            command=lambda: self._show_session_page(0),
+        ).pack(side=tk.LEFT, padx=2)
+        ttk.Radiobutton(
+            nav, text="По минутам", variable=self.session_view_var, value="minutes",
+            command=lambda: self._show_session_page(0),
+        ).pack(side=tk.LEFT, padx=2)
+        ttk.Button(nav, text="◀", width=3, command=lambda: self._show_session_page(self.session_page - 1)).pack(
+            side=tk.LEFT, padx=(10, 2)
+        )
+        ttk.Button(nav, text="▶", width=3, command=lambda: self._show_session_page(self.session_page + 1)).pack(
+            side=tk.LEFT, padx=2
+        )
+        self.session_page_label = ttk.Label(nav, text="")
+        self.session_page_label.pack(side=tk.LEFT, padx=5)
+
+        timeline_frame = ttk.Frame(frame)
+        timeline_frame.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+        self.tree_session_events = ttk.Treeview(
+            timeline_frame,
+            columns=("time", "source", "event_type", "subject", "class"),
+            show="headings",
+            selectmode="browse",
+            height=10,
+        )
+        for col, width, anchor in [
+            ("time", 150, tk.W),
+            ("source", 80, tk.W),
+            ("event_type", 140, tk.W),
+            ("subject", 260, tk.W),
+            ("class", 120, tk.W),
+        ]:
+            self.tree_session_events.column(col, width=width, anchor=anchor)
+        vsb = ttk.Scrollbar(timeline_frame, orient="vertical", command=self.tree_session_events.yview)
+        self.tree_session_events.configure(yscrollcommand=vsb.set)
+        self.tree_session_events.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        vsb.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree_session_events.bind("<<TreeviewSelect>>", self.on_timeline_select)
+
+    # Вкладка участников
+    def _build_actors_tab(self):
+        frame = self.actors_frame
+        table_frame = ttk.Frame(frame)
+        table_frame.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+
+        columns = ("id", "users", "ips", "count", "period", "sources", "classes")
+        self.tree_actors = ttk.Treeview(
+            table_frame,
+            columns=columns,
+            show="headings",
+            selectmode="browse",
+        )
+        for col, text, width, anchor in [
+            ("id", "ID", 50, tk.CENTER),
+            ("users", "Пользователи", 160, tk.W),
+            ("ips", "IP-адреса", 220, tk.W),
+            ("count", "Событий", 70, tk.CENTER),
+            ("period", "Период (UTC)", 230, tk.W),
+            ("sources", "Источники", 110, tk.W),
+            ("classes", "Классы", 80, tk.W),
+        ]:
+            self.tree_actors.heading(col, text=text)
+            self.tree_actors.column(col, width=width, anchor=anchor)
+
+        vsb = ttk.Scrollbar(table_frame, orient="vertical", command=self.tree_actors.yview)
+        self.tree_actors.configure(yscrollcommand=vsb.set)
+        self.tree_actors.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        vsb.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree_actors.bind("<<TreeviewSelect>>", self.on_actor_select)
+
+        details_label = ttk.Label(frame, text="Подробности участника:")
+        details_label.pack(side=tk.TOP, anchor=tk.W)
+        self.text_actor_details = tk.Text(frame, height=10, wrap="word")
+        self.text_actor_details.pack(side=tk.TOP, fill=tk.BOTH, expand=False)
+        self.text_actor_details.configure(font=("Courier New", 9))
+
     # Пересчёт сессий и таблиц
 
+    def _reclassify(self):
+        # Подтверждения другими источниками, затем классификация (с бонусом за
+        # подтверждение) и сбор статистики за один проход по событиям
+        self.corroboration = corroborate(self.events, self.config)
+        self.aggregates = EventAggregates(sketches=EventSketches())
+        classify_events(self.events, self.config, self.aggregates, self.corroboration)
+
     def _rebuild_sessions(self):
         self.sessions = build_sessions(self.events, self.config)
+        self._refresh_views()
+
+    def _refresh_views(self):
+        self.actors = resolve_actors(self.events, self.config)
+        self.event_index = EventIndex(self.events, self.raw_lines)
+        self.query_result = None
+        self.search_status.config(text="")
         self.refresh_event_view()
         self.refresh_sessions_view()
+        self.refresh_actors_view()
 
     def refresh_event_view(self):
         for item in self.tree_events.get_children():
             self.tree_events.delete(item)
 
         selected_class = self.class_filter_var.get()
-        for idx, ev in enumerate(self.events):
+        indices = self.query_result if self.query_result is not None else range(len(self.events))
+        for idx in indices:
+            ev = self.events[idx]
             if selected_class != "Все" and ev.evidential_class != selected_class:
                 continue
             time_str = ev.timestamp.strftime("%Y-%m-%d %H:%M:%S") if ev.timestamp else "—"
@@ -366,10 +785,7 @@ class LogClassifierGUI:
             )
 
         total = len(self.events)
-        counts = {"A": 0, "B": 0, "C": 0, "D": 0}
-        for ev in self.events:
-            if ev.evidential_class in counts:
-                counts[ev.evidential_class] += 1
+        counts = self.aggregates.class_counts
         stats_text = (
             f"Событий всего: {total}  |  "
             f"A: {counts['A']}  B: {counts['B']}  "
@@ -379,9 +795,34 @@ class LogClassifierGUI:
 
         self.text_event_details.delete("1.0", tk.END)
 
+    def run_search(self):
+        text = self.search_var.get().strip()
+        if not text:
+            self.clear_search()
+            return
+        try:
+            q = parse_query(text, self.event_index.first_time)
+        except ValueError as e:
+            messagebox.showerror("Поиск", f"Некорректный запрос:\n{e}")
+            return
+        started = time.perf_counter()
+        self.query_result = self.event_index.query(q)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.search_status.config(text=f"Найдено: {len(self.query_result)} ({elapsed_ms:.1f} мс)")
+        self.refresh_event_view()
+
+    def clear_search(self):
+        self.search_var.set("")
+        self.query_result = None
+        self.search_status.config(text="")
+        self.refresh_event_view()
+
     def refresh_sessions_view(self):
         for item in self.tree_sessions.get_children():
             self.tree_sessions.delete(item)
+        self.timeline_session = None
+        self.timeline_groups = None
+        self._clear_timeline()
 
         for sess in self.sessions:
             self.tree_sessions.insert(
@@ -400,6 +841,30 @@ class LogClassifierGUI:
 
         self.text_session_details.delete("1.0", tk.END)
 
+    def refresh_actors_view(self):
+        for item in self.tree_actors.get_children():
+            self.tree_actors.delete(item)
+
+        for actor in self.actors:
+            start, end = actor.start_time, actor.end_time
+            period = f"{start:%Y-%m-%d %H:%M} — {end:%Y-%m-%d %H:%M}" if start and end else "—"
+            self.tree_actors.insert(
+                "",
+                "end",
+                iid=str(actor.id),
+                values=(
+                    actor.id,
+                    ", ".join(actor.users) or "—",
+                    ", ".join(actor.ips[:5]) + (f" … (+{len(actor.ips) - 5})" if len(actor.ips) > 5 else ""),
+                    len(actor.events),
+                    period,
+                    ", ".join(actor.sources),
+                    ", ".join(actor.classes),
+                ),
+            )
+
+        self.text_actor_details.delete("1.0", tk.END)
+
     # Обработчики выбора
 
     def on_event_select(self, event):
@@ -415,11 +880,14 @@ class LogClassifierGUI:
         lines.append(f"Источник: {ev.source}")
         lines.append(f"Тип события: {ev.event_type}")
         if ev.timestamp:
-            lines.append(f"Время: {ev.timestamp.isoformat(sep=' ')}")
+            lines.append(f"Время (UTC): {ev.timestamp.isoformat(sep=' ')}")
         else:
             lines.append("Время: неизвестно")
         lines.append(f"Пользователь: {ev.user or '—'}")
         lines.append(f"IP-адрес: {ev.ip or '—'}")
+        network = self._describe_network(ev.ip_int)
+        if network:
+            lines.append(f"Сеть: {network}")
         lines.append(f"Класс значимости: {ev.evidential_class}")
 
         class_desc = self.config.class_descriptions.get(ev.evidential_class, "")
@@ -428,6 +896,13 @@ class LogClassifierGUI:
 
         lines.append(f"Пояснение к классификации: {ev.notes or '—'}")
         lines.append(f"ID сессии: {ev.session_id if ev.session_id is not None else '—'}")
+        record = self.custody.record(ev.block_ref)
+        if record is not None:
+            offset, length = record.block_span(ev.block_ref[1])
+            lines.append(
+                f"Исходный файл: {record.path} (SHA-256 {record.sha256}), "
+                f"блок {ev.block_ref[1]}: смещение {offset}, длина {length}"
+            )
 
         if ev.details:
             lines.append("\nДополнительные поля:")
@@ -435,7 +910,7 @@ class LogClassifierGUI:
                 lines.append(f"  {k}: {v}")
 
         lines.append("\nИсходная строка лога:")
-        lines.append(ev.raw_line)
+        lines.append(self.raw_lines.line(ev))
 
         self.text_event_details.delete("1.0", tk.END)
         self.text_event_details.insert(tk.END, "\n".join(lines))
@@ -449,33 +924,151 @@ class LogClassifierGUI:
         if not sess:
             return
 
+        # период, источники и классы — из кэша сессии (Session.meta)
         lines = []
         lines.append(f"Сессия ID: {sess.id}")
         lines.append(f"Ключ: {sess.key} (тип: {sess.key_type})")
-        if sess.start_time and sess.end_time:
-            lines.append(
-                f"Период: {sess.start_time.isoformat(sep=' ')} — {sess.end_time.isoformat(sep=' ')}"
-            )
+        if sess.key_type != "user":
+            first = sess.events[0] if sess.events else None
+            network = self._describe_network(first.ip_int) if first is not None else None
+            if network:
+                lines.append(f"Сеть: {network}")
+        start, end = sess.start_time, sess.end_time
+        if start and end:
+            lines.append(f"Период: {start.isoformat(sep=' ')} — {end.isoformat(sep=' ')}")
         lines.append(f"Источники: {', '.join(sess.sources)}")
         lines.append(f"Классы событий: {', '.join(sess.classes)}")
         lines.append(f"Количество событий: {len(sess.events)}")
-        lines.append("\nСобытия сессии:")
-        for ev in sess.events:
+        if self.corroboration.masks and len(self.corroboration.masks) == len(self.events):
+            indices = self.event_index.query(EventQuery(session_id=sess.id))
+            confirmed = self.corroboration.sources_of(self.corroboration.mask_of(indices))
+            lines.append(f"Подтверждена источниками: {', '.join(confirmed) or '—'}")
+
+        self.text_session_details.delete("1.0", tk.END)
+        self.text_session_details.insert(tk.END, "\n".join(lines))
+
+        self.timeline_session = sess
+        self.timeline_groups = None
+        # длинные цепочки (NAT, сканеры) открываются свёрнутыми по минутам
+        self.session_view_var.set("minutes" if len(sess.events) > TIMELINE_COLLAPSE_EVENTS else "events")
+        self._show_session_page(0)
+
+    def _clear_timeline(self):
+        self.tree_session_events.delete(*self.tree_session_events.get_children())
+        self.session_page = 0
+        self.session_page_label.config(text="")
+
+    def _show_session_page(self, page: int):
+        sess = self.timeline_session
+        tree = self.tree_session_events
+        if sess is None:
+            return
+        by_minute = self.session_view_var.get() == "minutes"
+        if by_minute and self.timeline_groups is None:
+            from aggregates import minute_groups
+            self.timeline_groups = minute_groups(sess.events)
+        rows = self.timeline_groups if by_minute else sess.events
+        pages = max(1, -(-len(rows) // TIMELINE_PAGE_SIZE))
+        page = min(max(page, 0), pages - 1)
+        self.session_page = page
+        start = page * TIMELINE_PAGE_SIZE
+        chunk = rows[start:start + TIMELINE_PAGE_SIZE]
+
+        tree.delete(*tree.get_children())
+        headings = ("Минута (UTC)", "Источник", "Тип события", "Событий", "Классы") if by_minute else (
+            "Время (UTC)", "Источник", "Тип события", "Пользователь / IP", "Класс")
+        for col, text in zip(tree["columns"], headings):
+            tree.heading(col, text=text)
+        if by_minute:
+            for n, g in enumerate(chunk, start):
+                minute = from_micros(g.minute_us).strftime("%Y-%m-%d %H:%M") if g.minute_us is not None else "—"
+                classes = ", ".join(f"{c or '—'}: {k}" for c, k in sorted(g.classes.items()))
+                tree.insert("", "end", iid=f"g{n}", values=(minute, g.source, g.event_type, g.count, classes))
+        else:
+            for n, ev in enumerate(chunk, start):
+                t = ev.timestamp.strftime("%Y-%m-%d %H:%M:%S") if ev.timestamp else "—"
+                subject = f"{ev.user or '—'} / {ev.ip or '—'}"
+                tree.insert("", "end", iid=str(n), values=(t, ev.source, ev.event_type, subject, ev.evidential_class))
+        unit = "групп" if by_minute else "событий"
+        last = start + len(chunk)
+        self.session_page_label.config(
+            text=f"стр. {page + 1} из {pages} ({unit} {start + 1 if chunk else 0}–{last} из {len(rows)})"
+        )
+
+    def on_timeline_select(self, event):
+        # Свёрнутая строка раскрывается: переход к странице событий с первым событием группы.
+        selection = self.tree_session_events.selection()
+        if not selection or not selection[0].startswith("g") or self.timeline_groups is None:
+            return
+        index = self.timeline_groups[int(selection[0][1:])].first_index
+        self.session_view_var.set("events")
+        self._show_session_page(index // TIMELINE_PAGE_SIZE)
+        self.tree_session_events.selection_set(str(index))
+        self.tree_session_events.see(str(index))
+
+    def _describe_network(self, ip_int: Optional[int]) -> Optional[str]:
+        # Запись справочника сетей для адреса (площадка, владелец, NAT, метка актива).
+        if ip_int is None:
+            return None
+        from netinfo import ip_ranges
+        ranges = ip_ranges(self.config)
+        rng = ranges.lookup(ip_int) if ranges is not None else None
+        return rng.describe() if rng is not None else None
+
+    def on_actor_select(self, event):
+        selection = self.tree_actors.selection()
+        if not selection:
+            return
+        actor_id = int(selection[0])
+        if not 1 <= actor_id <= len(self.actors):
+            return
+        actor = self.actors[actor_id - 1]
+
+        lines = []
+        from netinfo import ip_to_int
+        lines.append(f"Участник ID: {actor.id}")
+        lines.append(f"Пользователи: {', '.join(actor.users) or '—'}")
+        lines.append(f"IP-адреса: {', '.join(actor.ips) or '—'}")
+        for ip in actor.ips:
+            network = self._describe_network(ip_to_int(ip))
+            if network:
+                lines.append(f"  {ip}: {network}")
+        if actor.start_time and actor.end_time:
+            lines.append(
+                f"Период (UTC): {actor.start_time.isoformat(sep=' ')} — {actor.end_time.isoformat(sep=' ')}"
+            )
+        lines.append(f"Источники: {', '.join(actor.sources)}")
+        lines.append(f"Классы событий: {', '.join(actor.classes)}")
+        sessions = sorted({ev.session_id for ev in actor.events if ev.session_id is not None})
+        lines.append(f"Сессии: {', '.join(map(str, sessions)) or '—'}")
+        lines.append(f"Количество событий: {len(actor.events)}")
+        lines.append("\nСобытия участника:")
+        for ev in actor.events[:500]:
             t = ev.timestamp.strftime("%Y-%m-%d %H:%M:%S") if ev.timestamp else "—"
             lines.append(
                 f"- {t} {ev.source} {ev.event_type} "
                 f"(user={ev.user}, ip={ev.ip}, класс={ev.evidential_class})"
             )
+        if len(actor.events) > 500:
+            lines.append(f"… и ещё {len(actor.events) - 500}")
 
-        self.text_session_details.delete("1.0", tk.END)
-        self.text_session_details.insert(tk.END, "\n".join(lines))
+        self.text_actor_details.delete("1.0", tk.END)
+        self.text_actor_details.insert(tk.END, "\n".join(lines))
 
     # Действия
     def open_settings(self):
         SettingsWindow(self.master, self)
 
+    def open_triage(self):
+        TriageWindow(self.master, self)
+
+    def _fill_formats(self):
+        from parsers import available_formats
+        self.format_combo["values"] = available_formats()
+
     def load_log_file(self, source_name: str):
-        from parsers import PARSERS  # на случай горячей замены парсеров
+        from parsers import PARSERS, load_parser_plugins  # на случай горячей замены парсеров
+        load_parser_plugins()
         parser = PARSERS.get(source_name)
         if parser is None:
             messagebox.showerror("Ошибка", f"Неизвестный источник: {source_name}")
@@ -487,36 +1080,45 @@ class LogClassifierGUI:
         )
         if not path:
             return
-        added, skipped = 0, 0
+        from ingest import read_log_file
+        self._ensure_dedup()
         try:
-            with open(path, "r", encoding="utf-8", errors="ignore") as f:
-                for line in f:
-                    line = line.strip()
-                    if not line:
-                        continue
-                    ev = parser(line, self.config)
-                    if ev is None:
-                        skipped += 1
-                        continue
-                    self.events.append(ev)
-                    added += 1
+            stats = read_log_file(
+                path, parser, self.config, self.events, self.deduplicator, source_name, self.custody,
+                self.raw_lines,
+            )
         except Exception as e:
             messagebox.showerror("Ошибка", f"Не удалось прочитать файл:\n{e}")
             return
-
-        classify_events(self.events, self.config)
+        record = self.custody[-1]
+
+        self.load_history.append({
+            "source": source_name,
+            "path": path,
+            "added": stats.added,
+            "skipped": stats.skipped,
+            "noise": stats.noise,
+            "duplicates": stats.duplicates,
+            "sha256": record.sha256,
+            "merkle_root": record.root,
+        })
+        self._reclassify()
         self._rebuild_sessions()
         messagebox.showinfo(
             "Загрузка завершена",
             f"Источник: {source_name}\n"
-            f"Добавлено событий: {added}\n"
-            f"Пропущено строк: {skipped}",
+            f"Добавлено событий: {stats.added}\n"
+            f"Пропущено строк: {stats.skipped}\n"
+            f"Отброшено как шум: {stats.noise}\n"
+            f"Отброшено повторов: {stats.duplicates}\n"
+            f"SHA-256 файла: {record.sha256}",
         )
 
     def generate_demo_logs(self):
         directory = filedialog.askdirectory(
             title="Выберите папку для сохранения учебных логов (можно отменить, чтобы загрузить только в память)"
         )
+        from generator import generate_scenario_logs
         web_lines, proxy_lines, vpn_lines = generate_scenario_logs()
 
         def write_if_dir(fname: str, lines: List[str]):
@@ -531,33 +1133,138 @@ class LogClassifierGUI:
         write_if_dir("vpn_demo.log", vpn_lines)
 
         from parsers import PARSERS
-        for line in web_lines:
-            ev = PARSERS["web"](line, self.config)
-            if ev:
-                self.events.append(ev)
-        for line in proxy_lines:
-            ev = PARSERS["proxy"](line, self.config)
-            if ev:
-                self.events.append(ev)
-        for line in vpn_lines:
-            ev = PARSERS["vpn"](line, self.config)
-            if ev:
-                self.events.append(ev)
-
-        classify_events(self.events, self.config)
+        self._ensure_dedup()
+        duplicates = 0
+        for source, lines in (("web", web_lines), ("proxy", proxy_lines), ("vpn", vpn_lines)):
+            for line in lines:
+                h = line_hash(source, line.encode("utf-8"))
+                if self.deduplicator.seen(h):
+                    duplicates += 1
+                    continue
+                ev = PARSERS[source](line, self.config)
+                if ev:
+                    self.deduplicator.add(h)
+                    self.raw_lines.pack((ev,))
+                    self.events.append(ev)
+
+        self.load_history.append({"source": "demo", "path": directory or "", "duplicates": duplicates})
+        self._reclassify()
         self._rebuild_sessions()
 
         msg = "Учебные логи сгенерированы и загружены в программу."
+        if duplicates:
+            msg += f" Повторных строк отброшено: {duplicates}."
         if directory:
             msg += f" Также сохранены файлы в папке: {directory}"
         messagebox.showinfo("Готово", msg)
 
+    def _ensure_dedup(self):
+        # После открытия дела фильтр повторов восстанавливается по строкам событий
+        # при первой загрузке нового файла, а не во время открытия.
+        if not self._dedup_stale:
+            return
+        self.deduplicator = LineDeduplicator()
+        for ev in self.events:
+            self.deduplicator.is_duplicate(ev.source, self.raw_lines.line(ev).encode("utf-8"))
+        self._dedup_stale = False
+
+    def save_case_file(self):
+        if not self.events:
+            messagebox.showwarning("Дело", "Нет данных для сохранения.")
+            return
+        from case_store import CASE_EXTENSION, save_case
+        path = filedialog.asksaveasfilename(
+            title="Сохранить дело",
+            defaultextension=CASE_EXTENSION,
+            filetypes=[("LogClass case", f"*{CASE_EXTENSION}"), ("All files", "*.*")],
+        )
+        if not path:
+            return
+        instrumentation = {
+            "loads": self.load_history,
+            "duplicates_dropped": self.deduplicator.stats.total,
+        }
+        try:
+            save_case(
+                path, self.events, self.sessions, self.config, instrumentation,
+                custody=self.custody, raw=self.raw_lines,
+            )
+        except Exception as e:
+            messagebox.showerror("Ошибка", f"Не удалось сохранить дело:\n{e}")
+            return
+        messagebox.showinfo("Дело", f"Дело сохранено: {path}")
+
+    def open_case_file(self):
+        from case_store import CASE_EXTENSION, load_case
+        path = filedialog.askopenfilename(
+            title="Открыть дело",
+            filetypes=[("LogClass case", f"*{CASE_EXTENSION}"), ("All files", "*.*")],
+        )
+        if not path:
+            return
+        try:
+            raw_lines = self._new_raw_store()
+            events, sessions, cfg, meta, custody = load_case(path, raw_lines)
+        except Exception as e:
+            messagebox.showerror("Ошибка", f"Не удалось открыть дело:\n{e}")
+            return
+
+        # классы и сессии берутся из дела как есть, без повторной классификации
+        self.events = events
+        self.sessions = sessions
+        self.config = cfg
+        self.custody = custody
+        self.raw_lines = raw_lines
+        self.load_history = list(meta.get("instrumentation", {}).get("loads", []))
+        self._dedup_stale = True
+        from aggregates import compute_aggregates
+        self.aggregates = compute_aggregates(self.events, sketches=True)
+        self.corroboration = corroborate(self.events, self.config)
+        self._refresh_views()
+        messagebox.showinfo(
+            "Дело",
+            f"Дело открыто: {path}\n"
+            f"Событий: {len(self.events)}, сессий: {len(self.sessions)}\n"
+            f"Сохранено: {meta.get('saved_at', '—')}",
+        )
+
+    def _warn_rule_errors(self):
+        errors = compiled_rules(self.config).errors
+        if errors:
+            messagebox.showwarning(
+                "Правила классификации",
+                "Некорректные правила в rules.json пропущены:\n" + "\n".join(errors),
+            )
+        if self.config.ip_ranges_file:
+            from netinfo import ip_ranges
+            errors = ip_ranges(self.config).errors
+            if errors:
+                messagebox.showwarning(
+                    "Справочник сетей",
+                    "Строки справочника сетей пропущены:\n" + "\n".join(errors[:20]),
+                )
+
     def reload_config(self):
         self.config = load_config()
-        classify_events(self.events, self.config)
+        self._warn_rule_errors()
+        self._reclassify()
         self._rebuild_sessions()
         messagebox.showinfo("Конфигурация", "Конфигурация правил перезагружена из rules.json.")
 
+    def show_sketches(self):
+        sketches = self.aggregates.sketches
+        if sketches is None or not sketches.total:
+            messagebox.showinfo("Сводки", "Нет данных: загрузите логи.")
+            return
+        from reports import sketch_summary_markdown
+        win = tk.Toplevel(self.master)
+        win.title("Оценки по вероятностным сводкам")
+        text = tk.Text(win, wrap="none", width=110, height=40)
+        text.pack(fill=tk.BOTH, expand=True)
+        text.configure(font=("Courier New", 9))
+        text.insert(tk.END, sketch_summary_markdown(sketches))
+        text.configure(state=tk.DISABLED)
+
     def show_weak_traces(self):
         weak_events = [e for e in self.events if e.evidential_class in ("C", "D")]
         if not weak_events:
@@ -578,9 +1285,39 @@ class LogClassifierGUI:
             )
             if class_desc:
                 line += f" | Класс {ev.evidential_class}: {class_desc}"
-            line += "\n"
+            # события идут в порядке загрузки, поэтому блоки хранилища распаковываются по разу
+            line += f"\n    {self.raw_lines.line(ev)}\n"
             text.insert(tk.END, line)
 
+    def plot_classes(self):
+        from reports import plot_class_distribution
+        self.show_figure(plot_class_distribution(self.aggregates), "График по классам")
+
+    def plot_sources(self):
+        from reports import plot_source_distribution
+        self.show_figure(plot_source_distribution(self.aggregates), "График по источникам")
+
+    def plot_timeline(self):
+        from reports import plot_class_timeline
+        fig = plot_class_timeline(self.aggregates, max_points=self.master.winfo_width())
+        self.show_figure(fig, "События в минуту по классам")
+
+    def show_figure(self, fig, title: str):
+        # Встраивание графика в отдельное окно Tk (без блокирующего plt.show()).
+        if fig is None:
+            messagebox.showinfo(title, "Нет данных для построения графика.")
+            return
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
+
+        win = tk.Toplevel(self.master)
+        win.title(title)
+        canvas = FigureCanvasTkAgg(fig, master=win)
+        toolbar = NavigationToolbar2Tk(canvas, win, pack_toolbar=False)
+        toolbar.update()
+        toolbar.pack(side=tk.BOTTOM, fill=tk.X)
+        canvas.get_tk_widget().pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+        canvas.draw_idle()
+
     def export_csv(self):
         if not self.events:
             messagebox.showwarning("Экспорт", "Нет событий для экспорта.")
@@ -592,12 +1329,16 @@ class LogClassifierGUI:
         )
         if not path:
             return
+        from reports import export_events_csv
         try:
-            export_events_csv(self.events, path)
+            proofs = export_events_csv(self.events, path, self.custody, self.raw_lines)
         except Exception as e:
             messagebox.showerror("Ошибка", f"Не удалось сохранить CSV:\n{e}")
             return
-        messagebox.showinfo("Экспорт", f"CSV-файл сохранён: {path}")
+        message = f"CSV-файл сохранён: {path}"
+        if proofs:
+            message += f"\nДоказательства включения блоков: {proofs}"
+        messagebox.showinfo("Экспорт", message)
 
     def export_md(self):
         if not self.events:
@@ -610,8 +1351,11 @@ class LogClassifierGUI:
         )
         if not path:
             return
+        from reports import export_summary_markdown
         try:
-            export_summary_markdown(self.events, self.sessions, path)
+            export_summary_markdown(
+                self.events, self.sessions, path, self.aggregates, self.actors, self.custody, self.corroboration
+            )
         except Exception as e:
             messagebox.showerror("Ошибка", f"Не удалось сохранить отчёт:\n{e}")
             return
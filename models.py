@@ -1,21 +1,124 @@
+from collections.abc import Mapping
 from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Optional, Dict, List
+from itertools import islice
+from typing import Optional, Dict, List, Tuple
+from netinfo import ip_to_int
+from timeutil import from_micros, to_micros
+
+
+class EventDetails(tuple, Mapping):
+    # Подробности события без отдельного словаря на каждое событие: значения
+    # хранятся кортежем, а таблица ключей — в классе, общем для всех событий
+    # одного формата (см. details_type). Читается как dict (get, [], in, items);
+    # обычный словарь строится только по запросу (to_dict).
+    __slots__ = ()
+    _keys: Tuple[str, ...] = ()
+    _index: Dict[str, int] = {}
+
+    def __getitem__(self, key: str) -> Optional[str]:
+        return tuple.__getitem__(self, self._index[key])
+
+    def get(self, key: str, default=None):
+        i = self._index.get(key)
+        return default if i is None else tuple.__getitem__(self, i)
+
+    def __contains__(self, key) -> bool:
+        return key in self._index
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def keys(self):
+        return self._keys
+
+    def values(self):
+        return tuple(tuple.__iter__(self))
+
+    def items(self):
+        return list(zip(self._keys, tuple.__iter__(self)))
+
+    def to_dict(self) -> Dict[str, Optional[str]]:
+        return dict(zip(self._keys, tuple.__iter__(self)))
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Mapping):
+            return NotImplemented
+        return self.to_dict() == dict(other.items())
+
+    def __ne__(self, other) -> bool:
+        eq = self.__eq__(other)
+        return eq if eq is NotImplemented else not eq
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return repr(self.to_dict())
+
+    def __reduce__(self):
+        return _restore_details, (self._keys, tuple(tuple.__iter__(self)))
+
+
+_DETAILS_TYPES: Dict[Tuple[str, ...], type] = {}
+
+
+def details_type(keys: Tuple[str, ...]) -> type:
+    # Класс подробностей для набора ключей; один на набор, чтобы события
+    # разных парсеров с одинаковыми ключами были однотипны.
+    keys = tuple(keys)
+    cls = _DETAILS_TYPES.get(keys)
+    if cls is None:
+        cls = type("EventDetails", (EventDetails,), {
+            "__slots__": (),
+            "_keys": keys,
+            "_index": {key: i for i, key in enumerate(keys)},
+        })
+        _DETAILS_TYPES[keys] = cls
+    return cls
+
+
+def _restore_details(keys: Tuple[str, ...], values: Tuple[Optional[str], ...]) -> EventDetails:
+    return details_type(keys)(values)
 
 
 @dataclass
 class LogEvent:
     # Нормализованное событие лога.
     source: str                 # 'web', 'proxy', 'vpn'
-    raw_line: str
-    timestamp: Optional[datetime]
+    raw_line: Optional[str]     # None — строка перенесена в хранилище строк (raw_ref), см. rawstore
+    timestamp: Optional[datetime]  # UTC, без tzinfo
     ip: Optional[str]
     user: Optional[str]
     event_type: str             # строковый тип: AUTH_SUCCESS, ACCESS_SENSITIVE
-    details: Dict[str, str] = field(default_factory=dict)
+    details: Mapping = field(default_factory=dict)  # dict или EventDetails
     evidential_class: str = ""  # 'A', 'B', 'C', 'D'
     notes: str = ""             # пояснение к классификации
     session_id: Optional[int] = None  # ID сессии, если применимо
+    ts_us: Optional[int] = None  # время в микросекундах от эпохи UTC (для сравнений)
+    ip_int: Optional[int] = None  # IP в 128-битном пространстве (IPv4 — ::ffff:a.b.c.d), см. netinfo
+    block_ref: Optional[Tuple[int, int]] = None  # (файл в журнале хранения, блок), см. custody
+    raw_ref: Optional[int] = None  # номер исходной строки в RawLineStore
+
+    def __post_init__(self):
+        # парсеры передают ts_us и ip_int сами; для событий, собранных вручную, —
+        # по timestamp (UTC) и строке IP
+        if self.ts_us is None and self.timestamp is not None:
+            self.ts_us = to_micros(self.timestamp)
+        if self.ip_int is None and self.ip:
+            self.ip_int = ip_to_int(self.ip)
+
+class SessionMeta:
+    # Сводка по событиям сессии; пересчитывается только по добавленным событиям.
+    # Сессий бывают сотни тысяч, поэтому без __dict__ и лишних контейнеров.
+    __slots__ = ("count", "first_us", "last_us", "sources", "classes")
+
+    def __init__(self):
+        self.count = 0                          # сколько событий учтено
+        self.first_us: Optional[int] = None
+        self.last_us: Optional[int] = None
+        self.sources: Tuple[str, ...] = ()
+        self.classes: Tuple[str, ...] = ()
+
 
 @dataclass
 class Session:
@@ -24,21 +127,52 @@ class Session:
     key: str          # значение ключа (user или ip)
     key_type: str     # 'user' или 'ip'
     events: List[LogEvent] = field(default_factory=list)
+    _meta: Optional[SessionMeta] = field(default=None, init=False, repr=False, compare=False)
+
+    @property
+    def meta(self) -> SessionMeta:
+        # События сессии только добавляются (correlator, загрузка дела), поэтому
+        # кэш дополняется по новым событиям; при другой правке — invalidate().
+        meta = self._meta
+        events = self.events
+        if meta is None or meta.count > len(events):
+            meta = self._meta = SessionMeta()
+        if meta.count < len(events):
+            first, last = meta.first_us, meta.last_us
+            sources, classes = set(meta.sources), set(meta.classes)
+            for ev in islice(events, meta.count, None):
+                ts = ev.ts_us
+                if ts is not None:
+                    if first is None or ts < first:
+                        first = ts
+                    if last is None or ts > last:
+                        last = ts
+                sources.add(ev.source)
+                if ev.evidential_class:
+                    classes.add(ev.evidential_class)
+            meta.count = len(events)
+            meta.first_us, meta.last_us = first, last
+            meta.sources = tuple(sorted(sources))
+            meta.classes = tuple(sorted(classes))
+        return meta
+
+    def invalidate(self) -> None:
+        self._meta = None
 
     @property
     def start_time(self) -> Optional[datetime]:
-        times = [e.timestamp for e in self.events if e.timestamp]
-        return min(times) if times else None
+        first = self.meta.first_us
+        return from_micros(first) if first is not None else None
 
     @property
     def end_time(self) -> Optional[datetime]:
-        times = [e.timestamp for e in self.events if e.timestamp]
-        return max(times) if times else None
+        last = self.meta.last_us
+        return from_micros(last) if last is not None else None
 
     @property
     def sources(self) -> List[str]:
-        return sorted({e.source for e in self.events})
+        return list(self.meta.sources)
 
     @property
     def classes(self) -> List[str]:
-        return sorted({e.evidential_class for e in self.events if e.evidential_class})
+        return list(self.meta.classes)
@@ -0,0 +1,210 @@
+import csv
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+from config_cache import ConfigCache
+
+# IP-адреса как целые числа и справочник сетей.
+#
+# Адреса IPv4 и IPv6 переводятся в одно 128-битное пространство: IPv4
+# хранится как IPv4-mapped адрес (::ffff:a.b.c.d), поэтому сравнение,
+# маскирование по префиксу и поиск сети одинаковы для обеих версий.
+#
+# Справочник сетей загружается из CSV (cidr,site,owner,nat,tag): для адреса
+# находится самая длинная подходящая сеть — площадка, владелец, признак
+# NAT-пула и метка актива. Поиск — по одной хэш-таблице на каждую длину
+# префикса, встречающуюся в справочнике (от длинных к коротким), перед ним
+# стоит LRU-кэш: адреса в логах повторяются, и повторный поиск — одно
+# обращение к кэшу.
+
+V4_MAPPED = 0xFFFF << 32
+V4_MAPPED_HIGH = 0xFFFF  # ip >> 32 для IPv4-mapped адреса
+IP_BITS = 128
+
+IP_CACHE_SIZE = 1 << 20
+RANGE_CACHE_SIZE = 1 << 16
+
+NAT_TRUE = ("1", "yes", "y", "true", "да", "nat")
+
+_MISSING = object()
+IP_INT_CACHE: Dict[str, Optional[int]] = {}
+
+
+def _parse_ip(text: str) -> Optional[int]:
+    if ":" not in text:
+        parts = text.split(".")
+        if len(parts) != 4:
+            return None
+        value = 0
+        for part in parts:
+            if not part.isdigit() or len(part) > 3 or (len(part) > 1 and part[0] == "0"):
+                return None
+            octet = int(part)
+            if octet > 255:
+                return None
+            value = (value << 8) | octet
+        return V4_MAPPED | value
+    import ipaddress
+    try:
+        return int(ipaddress.IPv6Address(text.split("%", 1)[0]))
+    except ValueError:
+        return None
+
+
+def ip_to_int(text: str) -> Optional[int]:
+    # Адрес в 128-битном пространстве или None, если строка не IP-адрес.
+    # Результаты кэшируются (адреса в логах повторяются); кэш ограничен по размеру.
+    value = IP_INT_CACHE.get(text, _MISSING)
+    if value is _MISSING:
+        value = _parse_ip(text)
+        if len(IP_INT_CACHE) >= IP_CACHE_SIZE:
+            IP_INT_CACHE.clear()
+        IP_INT_CACHE[text] = value
+    return value
+
+
+def is_v4(value: int) -> bool:
+    return value >> 32 == V4_MAPPED_HIGH
+
+
+def int_to_ip(value: int) -> str:
+    if is_v4(value):
+        return ".".join(str((value >> shift) & 0xFF) for shift in (24, 16, 8, 0))
+    import ipaddress
+    return str(ipaddress.IPv6Address(value))
+
+
+def prefix_mask(prefix: int) -> int:
+    # Маска первых prefix бит 128-битного адреса.
+    return ((1 << IP_BITS) - 1) ^ ((1 << (IP_BITS - prefix)) - 1)
+
+
+def network_name(network: int, prefix: int) -> str:
+    # 'a.b.c.d/n' или 'x::/n' по сети в 128-битном пространстве.
+    if is_v4(network) and prefix >= 96:
+        return f"{int_to_ip(network)}/{prefix - 96}"
+    return f"{int_to_ip(network)}/{prefix}"
+
+
+def parse_cidr(text: str) -> Tuple[int, int]:
+    # (сеть, длина префикса) в 128-битном пространстве; ValueError для некорректной записи.
+    import ipaddress
+    net = ipaddress.ip_network(text.strip(), strict=False)
+    if net.version == 4:
+        return V4_MAPPED | int(net.network_address), 96 + net.prefixlen
+    return int(net.network_address), net.prefixlen
+
+
+def cidr_bounds(text: str) -> Tuple[int, int]:
+    # Первый и последний адрес сети (включительно) в 128-битном пространстве.
+    network, prefix = parse_cidr(text)
+    return network, network | ((1 << (IP_BITS - prefix)) - 1)
+
+
+@dataclass(frozen=True)
+class NetRange:
+    # Запись справочника сетей.
+    cidr: str
+    network: int          # в 128-битном пространстве
+    prefix: int           # длина префикса в 128-битном пространстве
+    site: str = ""
+    owner: str = ""
+    nat: bool = False     # NAT-пул / общая подсеть: все адреса — один участник
+    tag: str = ""         # метка актива
+
+    @property
+    def key(self) -> Tuple[int, int]:
+        return self.network, self.prefix
+
+    def describe(self) -> str:
+        parts = [p for p in (self.site, self.owner, self.tag) if p]
+        if self.nat:
+            parts.append("NAT")
+        return f"{self.cidr}" + (f" — {', '.join(parts)}" if parts else "")
+
+
+class PrefixTable:
+    # Поиск самой длинной подходящей сети для адреса.
+
+    def __init__(self, cache_size: int = RANGE_CACHE_SIZE):
+        # длина префикса -> {старшие биты сети: запись}
+        self._levels: Dict[int, Dict[int, NetRange]] = {}
+        self._lengths: Tuple[int, ...] = ()
+        self.path = ""
+        self.errors: List[str] = []
+        self.lookup = lru_cache(maxsize=cache_size)(self._lookup)
+
+    def __len__(self) -> int:
+        return sum(len(level) for level in self._levels.values())
+
+    def add(self, rng: NetRange) -> None:
+        level = self._levels.get(rng.prefix)
+        if level is None:
+            level = self._levels[rng.prefix] = {}
+            self._lengths = tuple(sorted(self._levels, reverse=True))
+        level[rng.network >> (IP_BITS - rng.prefix)] = rng
+        self.lookup.cache_clear()
+
+    def _lookup(self, ip: int) -> Optional[NetRange]:
+        levels = self._levels
+        for prefix in self._lengths:
+            rng = levels[prefix].get(ip >> (IP_BITS - prefix))
+            if rng is not None:
+                return rng
+        return None
+
+    def lookup_ip(self, text: Optional[str]) -> Optional[NetRange]:
+        value = ip_to_int(text) if text else None
+        return self.lookup(value) if value is not None else None
+
+
+def load_ranges_csv(path: str, cache_size: int = RANGE_CACHE_SIZE) -> PrefixTable:
+    # Справочник из CSV: cidr,site,owner,nat,tag (заголовок и строки '#' пропускаются).
+    # Некорректные строки пропускаются и перечисляются в table.errors.
+    table = PrefixTable(cache_size)
+    table.path = path
+    try:
+        with open(path, newline="", encoding="utf-8") as f:
+            for lineno, row in enumerate(csv.reader(f), 1):
+                if not row or not row[0].strip() or row[0].lstrip().startswith("#"):
+                    continue
+                if lineno == 1 and row[0].strip().lower() == "cidr":
+                    continue
+                cells = [c.strip() for c in row] + [""] * (5 - len(row))
+                try:
+                    network, prefix = parse_cidr(cells[0])
+                except ValueError as e:
+                    table.errors.append(f"{path}:{lineno}: {e}")
+                    continue
+                table.add(NetRange(
+                    cidr=network_name(network, prefix),
+                    network=network,
+                    prefix=prefix,
+                    site=cells[1],
+                    owner=cells[2],
+                    nat=cells[3].lower() in NAT_TRUE,
+                    tag=cells[4],
+                ))
+    except OSError as e:
+        table.errors.append(f"{path}: {e}")
+    return table
+
+
+# справочник сетей по объекту конфигурации (см. config_cache)
+_RANGES: ConfigCache[PrefixTable] = ConfigCache()
+
+
+def ip_ranges(cfg) -> Optional[PrefixTable]:
+    # Справочник сетей конфигурации (загружается при первом обращении); None — не задан.
+    path = cfg.ip_ranges_file
+    if not path:
+        return None
+    table = _RANGES.get(cfg)
+    if table is None or table.path != path:
+        table = _RANGES.set(cfg, load_ranges_csv(path))
+    return table
+
+
+def reload_ip_ranges(cfg) -> None:
+    # Перечитать справочник сетей из файла при следующем обращении.
+    _RANGES.discard(cfg)
@@ -1,24 +1,68 @@
 import re
-from datetime import datetime, timedelta
-from typing import Optional, Dict, Callable
-from models import LogEvent
+import sys
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+from models import LogEvent, details_type
+from netinfo import IP_INT_CACHE, ip_to_int
+from timeutil import EPOCH_ORDINAL, US_PER_SECOND, ZONE_CACHE, fixed_zone, resolve_zone
 from config_manager import Config
 
+MONTHS = {
+    "Jan": 1, "Feb": 2, "Mar": 3, "Apr": 4, "May": 5, "Jun": 6,
+    "Jul": 7, "Aug": 8, "Sep": 9, "Oct": 10, "Nov": 11, "Dec": 12,
+}
+
+
 def parse_apache_time(time_str: str) -> Optional[datetime]:
-    # Преобразовать время из Apache-логов вида '10/Nov/2025:13:55:36 +0100'.
+    # Преобразовать время из Apache-логов вида '10/Nov/2025:13:55:36 +0100'
+    # (с зоной из строки, если она указана).
+    # Быстрый путь — разбор по позициям, strptime только для нестандартных строк.
     try:
-        pure = time_str.split()[0]
-        return datetime.strptime(pure, "%d/%b/%Y:%H:%M:%S")
+        s = time_str
+        if len(s) >= 20 and s[2] == "/" and s[6] == "/" and s[11] == ":":
+            zone = fixed_zone(s[21:]) if len(s) > 21 and s[20] == " " else None
+            return datetime(
+                int(s[7:11]), MONTHS[s[3:6]], int(s[0:2]),
+                int(s[12:14]), int(s[15:17]), int(s[18:20]), tzinfo=zone,
+            )
+        if " " in time_str:
+            return datetime.strptime(time_str, "%d/%b/%Y:%H:%M:%S %z")
+        return datetime.strptime(time_str, "%d/%b/%Y:%H:%M:%S")
     except Exception:
         return None
 
 def parse_iso_time(time_str: str) -> Optional[datetime]:
-    # Формат: '2025-11-10T13:56:01'.
+    # Формат: '2025-11-10T13:56:01', допускается зона: '+01:00' или 'Z'.
+    try:
+        if time_str[-1:] in ("Z", "z"):
+            time_str = time_str[:-1] + "+00:00"
+        return datetime.fromisoformat(time_str)
+    except Exception:
+        return None
+
+def parse_epoch_time(time_str: str) -> Optional[datetime]:
+    # Формат Squid: секунды от эпохи UTC с миллисекундами, '1762782961.123'.
     try:
-        return datetime.strptime(time_str, "%Y-%m-%dT%H:%M:%S")
+        return datetime.fromtimestamp(float(time_str), timezone.utc)
     except Exception:
         return None
 
+# Именованные форматы времени; любое другое значение считается форматом strptime
+TIME_PARSERS: Dict[str, Callable[[str], Optional[datetime]]] = {
+    "apache": parse_apache_time,
+    "iso": parse_iso_time,
+    "epoch": parse_epoch_time,
+}
+
+def _strptime_parser(fmt: str) -> Callable[[str], Optional[datetime]]:
+    def parse(time_str: str) -> Optional[datetime]:
+        try:
+            return datetime.strptime(time_str, fmt)
+        except Exception:
+            return None
+    return parse
+
 # Регулярные выражения для логов
 apache_pattern = re.compile(
     r'(?P<ip>\S+) \S+ (?P<user>\S+) '
@@ -27,11 +71,25 @@ apache_pattern = re.compile(
     r'(?P<status>\d{3}) (?P<size>\S+)'
 )
 
+nginx_combined_pattern = re.compile(
+    r'(?P<ip>\S+) \S+ (?P<user>\S+) '
+    r'\[(?P<time>[^\]]+)\] '
+    r'"(?P<method>\S+) (?P<url>\S+) \S+" '
+    r'(?P<status>\d{3}) (?P<size>\S+) '
+    r'"(?P<referer>[^"]*)" "(?P<user_agent>[^"]*)"'
+)
+
 proxy_pattern = re.compile(
     r'(?P<time>\S+) (?P<ip>\S+) (?P<method>\S+) '
     r'(?P<url>\S+) (?P<status>\d{3}) (?P<size>\d+)'
 )
 
+squid_pattern = re.compile(
+    r'(?P<time>\d+\.\d+)\s+(?P<elapsed>\d+) (?P<ip>\S+) '
+    r'(?P<result_code>[^/\s]+)/(?P<status>\d{3}) (?P<size>\d+) '
+    r'(?P<method>\S+) (?P<url>\S+) (?P<user>\S+) (?P<hierarchy>\S+) (?P<content_type>\S+)'
+)
+
 vpn_pattern = re.compile(
     r'(?P<time>\S+) '
     r'user=(?P<user>\S+) '
@@ -41,169 +99,462 @@ vpn_pattern = re.compile(
     r'result=(?P<result>\S+)'
 )
 
-# Web-лог
-def determine_web_event_type(url: str, status: int, size: int, user: Optional[str], cfg: Config) -> str:
-    lower_url = url.lower()
-    for kw in cfg.auth_keywords:
-        if kw in lower_url:
-            if status in (200, 302, 303):
-                return "AUTH_SUCCESS"
-            elif status in (401, 403):
-                return "AUTH_FAILURE"
-            else:
-                return "AUTH_ATTEMPT"
-
-    for kw in cfg.sensitive_keywords:
-        if kw in lower_url:
-            return "ACCESS_SENSITIVE"
-
-    if size >= cfg.file_transfer_threshold:
-        return "FILE_TRANSFER"
+# Декларативное описание формата лога.
+#
+# Формат компилируется в специализированную функцию разбора: поля берутся
+# из m.groups() по позициям (без groupdict), целые поля преобразуются один раз,
+# а в details попадают исходные подстроки без обратного str().
+#
+# Правила типа события (event_types) проверяются по порядку, срабатывает первое.
+# Условия правила (when) объединяются по И:
+#   "fields": {"action": "login", "status": [401, 403]}  — равенство / вхождение
+#   "url_keywords": "auth" | "sensitive"                 — ключевые слова из Config
+#   "size_over_threshold": true                           — size >= file_transfer_threshold
+#   "has": ["user"]                                       — поле присутствует
+@dataclass
+class FormatSpec:
+    name: str                         # имя формата в реестре (кнопка/плагин)
+    pattern: Union[str, "re.Pattern"]
+    source: str = ""                  # логический источник ('web', 'proxy', 'vpn'); по умолчанию = name
+    time_field: str = "time"
+    time_format: str = "iso"          # 'apache', 'iso', 'epoch' или формат strptime
+    ip_field: Optional[str] = "ip"
+    user_field: Optional[str] = "user"
+    int_fields: Tuple[str, ...] = ()
+    # значения, которые означают «поле отсутствует» (например, '-' в Apache)
+    null_values: Dict[str, Tuple[str, ...]] = field(default_factory=dict)
+    # ключ в details -> имя поля
+    details: Dict[str, str] = field(default_factory=dict)
+    # поля с малым числом различных значений: строки интернируются, и все события
+    # ссылаются на один объект (ip_field и user_field интернируются всегда)
+    intern_fields: Tuple[str, ...] = ()
+    url_field: str = "url"
+    size_field: str = "size"
+    event_types: List[Dict[str, Any]] = field(default_factory=list)
+    default_event_type: str = "EVENT"
+    # признаки для байтового префильтра (см. ingest.py): подстроки, без которых
+    # строка заведомо не подходит под шаблон, и требование начинаться с цифры
+    required_bytes: Tuple[bytes, ...] = ()
+    starts_with_digit: bool = False
 
-    if user and user != "-":
-        return "ACCESS_AUTHENTICATED"
 
-    return "ACCESS_OTHER"
+ParserFunc = Callable[[str, Config], Optional[LogEvent]]
 
-def parse_web_log_line(line: str, cfg: Config) -> Optional[LogEvent]:
-    m = apache_pattern.match(line)
-    if not m:
-        return None
+URL_KEYWORD_LISTS = {
+    "auth": "auth_keywords",
+    "sensitive": "sensitive_keywords",
+}
 
-    data = m.groupdict()
-    ip = data.get("ip")
-    user = data.get("user")
-    if user == "-":
-        user = None
 
-    ts = parse_apache_time(data.get("time", ""))
-    if ts is not None:
-        offset_min = cfg.time_offsets_minutes.get("web", 0)
-        ts = ts + timedelta(minutes=offset_min)
+def _field_var(fname: str) -> str:
+    return f"f_{fname}"
+
+
+def _event_type_code(spec: FormatSpec, need: Callable[[Optional[str], str], None],
+                     const: Callable[[Any], str]) -> List[str]:
+    # Код выбора типа события по правилам spec.event_types: ожидает поля
+    # в переменных f_<поле> (целые — ещё и в i_<поле>) и cfg, результат — в et.
+    var = _field_var
+
+    def typed(fname: str) -> str:
+        return f"i_{fname}" if fname in spec.int_fields else var(fname)
+
+    lines: List[str] = []
+    # флаги ключевых слов в URL вычисляются один раз, если они нужны правилам
+    kw_kinds = []
+    for rule in spec.event_types:
+        kind = rule.get("when", {}).get("url_keywords")
+        if kind and kind not in kw_kinds:
+            if kind not in URL_KEYWORD_LISTS:
+                raise ValueError(f"{spec.name}: неизвестный список ключевых слов '{kind}'")
+            kw_kinds.append(kind)
+    if kw_kinds:
+        need(spec.url_field, "URL")
+        lines.append(f"    url_l = ({var(spec.url_field)} or '').lower()")
+        for kind in kw_kinds:
+            lines.append(f"    kw_{kind} = False")
+            lines.append(f"    for kw in cfg.{URL_KEYWORD_LISTS[kind]}:")
+            lines.append("        if kw in url_l:")
+            lines.append(f"            kw_{kind} = True")
+            lines.append("            break")
+
+    keyword = "if"
+    for rule in spec.event_types:
+        when = rule.get("when", {})
+        conds = []
+        for fname, expected in when.get("fields", {}).items():
+            need(fname, "event_types")
+            values = expected if isinstance(expected, (list, tuple)) else [expected]
+            if fname in spec.int_fields:
+                values = [int(v) for v in values]
+            else:
+                values = [str(v) for v in values]
+            if len(values) == 1:
+                conds.append(f"{typed(fname)} == {values[0]!r}")
+            else:
+                conds.append(f"{typed(fname)} in {const(frozenset(values))}")
+        if when.get("url_keywords"):
+            conds.append(f"kw_{when['url_keywords']}")
+        if when.get("size_over_threshold"):
+            need(spec.size_field, "size")
+            conds.append(f"{typed(spec.size_field)} >= cfg.file_transfer_threshold")
+        for fname in when.get("has", []):
+            need(fname, "has")
+            conds.append(var(fname))
+        expr = " and ".join(conds) or "True"
+        lines.append(f"    {keyword} {expr}:")
+        lines.append(f"        et = {rule['type']!r}")
+        keyword = "elif"
+    if spec.event_types:
+        lines.append("    else:")
+        lines.append(f"        et = {spec.default_event_type!r}")
+    else:
+        lines.append(f"    et = {spec.default_event_type!r}")
+
+    return lines
+
+
+def compile_format(spec: FormatSpec) -> ParserFunc:
+    # Сборка специализированного парсера из декларативного описания.
+    regex = re.compile(spec.pattern) if isinstance(spec.pattern, str) else spec.pattern
+    source = spec.source or spec.name
+    groups = sorted(regex.groupindex.items(), key=lambda item: item[1])
+    group_names = [name for name, _ in groups]
+    if len(group_names) != regex.groups:
+        raise ValueError(f"{spec.name}: все группы шаблона должны быть именованными")
+
+    def need(fname: Optional[str], what: str) -> None:
+        if fname and fname not in regex.groupindex:
+            raise ValueError(f"{spec.name}: поле '{fname}' ({what}) отсутствует в шаблоне")
+
+    need(spec.time_field, "время")
+    need(spec.ip_field, "IP")
+    need(spec.user_field, "пользователь")
+    for fname in spec.int_fields:
+        need(fname, "целое")
+    for fname in spec.details.values():
+        need(fname, "details")
+
+    consts: Dict[str, Any] = {
+        "_match": regex.match,
+        "_LogEvent": LogEvent,
+        "_intern": sys.intern,
+        "IP_INT_CACHE": IP_INT_CACHE,
+        "_ip_to_int": ip_to_int,
+        "_timedelta": timedelta,
+        "ZONE_CACHE": ZONE_CACHE,
+        "_resolve_zone": resolve_zone,
+        "_parse_time": TIME_PARSERS.get(spec.time_format) or _strptime_parser(spec.time_format),
+    }
 
-    status = int(data.get("status", "0"))
-    size_str = data.get("size", "0")
-    try:
-        size = int(size_str) if size_str.isdigit() else 0
-    except Exception:
-        size = 0
+    def const(value: Any) -> str:
+        name = f"_k{len(consts)}"
+        consts[name] = value
+        return name
+
+    var = _field_var
+
+    lines = [
+        "def parse(line, cfg):",
+        "    m = _match(line)",
+        "    if m is None:",
+        "        return None",
+    ]
+    if len(group_names) == 1:
+        lines.append(f"    {var(group_names[0])} = m.group(1)")
+    else:
+        lines.append(f"    {', '.join(var(n) for n in group_names)} = m.groups()")
+
+    for fname, nulls in spec.null_values.items():
+        need(fname, "null_values")
+        nulls = tuple(nulls)
+        test = f"== {nulls[0]!r}" if len(nulls) == 1 else f"in {const(frozenset(nulls))}"
+        lines.append(f"    if {var(fname)} {test}:")
+        lines.append(f"        {var(fname)} = None")
+
+    # целые поля: i_<поле> — число, f_<поле> — строка для details ('0' для нечисловых)
+    for fname in spec.int_fields:
+        lines.append(f"    if {var(fname)} and {var(fname)}.isdigit():")
+        lines.append(f"        i_{fname} = int({var(fname)})")
+        lines.append("    else:")
+        lines.append(f"        i_{fname} = 0")
+        lines.append(f"        {var(fname)} = '0'")
+
+    interned = [f for f in (spec.ip_field, spec.user_field) if f] + list(spec.intern_fields)
+    for fname in dict.fromkeys(interned):
+        need(fname, "intern_fields")
+        if fname in spec.int_fields:  # после разбора целых полей строка есть всегда
+            lines.append(f"    {var(fname)} = _intern({var(fname)})")
+        else:
+            lines.append(f"    if {var(fname)} is not None:")
+            lines.append(f"        {var(fname)} = _intern({var(fname)})")
+
+    # IP — сразу и целым числом (кэш netinfo: адреса повторяются)
+    if spec.ip_field:
+        lines.append(f"    if {var(spec.ip_field)} is not None:")
+        lines.append(f"        ipn = IP_INT_CACHE.get({var(spec.ip_field)})")
+        lines.append("        if ipn is None:")
+        lines.append(f"            ipn = _ip_to_int({var(spec.ip_field)})")
+        lines.append("    else:")
+        lines.append("        ipn = None")
+    ipn_expr = "ipn" if spec.ip_field else "None"
+
+    # время приводится к UTC (как timeutil.normalize_time, но без вызова функции
+    # на каждую строку): зона из строки или часовой пояс источника, плюс поправка часов
+    lines.append(f"    ts = _parse_time({var(spec.time_field)} or '')")
+    lines.append("    if ts is not None:")
+    lines.append("        off = ts.utcoffset()")
+    lines.append("        if off is None:")
+    lines.append(f"            zn = cfg.time_zones.get({source!r}) or cfg.default_time_zone")
+    lines.append("            off = (ZONE_CACHE.get(zn) or _resolve_zone(zn)).utcoffset(ts)")
+    lines.append("        else:")
+    lines.append("            ts = ts.replace(tzinfo=None)")
+    lines.append(f"        skew = cfg.time_offsets_minutes.get({source!r}, 0)")
+    lines.append("        if skew:")
+    lines.append("            off = off - _timedelta(minutes=skew)")
+    lines.append("        if off:")
+    lines.append("            ts = ts - off")
+    lines.append(
+        f"        us = ((ts.toordinal() - {EPOCH_ORDINAL}) * 86400 + ts.hour * 3600 + ts.minute * 60"
+        f" + ts.second) * {US_PER_SECOND} + ts.microsecond"
+    )
+    lines.append("    else:")
+    lines.append("        us = None")
+
+    lines.extend(_event_type_code(spec, need, const))
+
+    # details — общая таблица ключей и кортеж значений вместо словаря на событие
+    details_cls = const(details_type(tuple(spec.details)))
+    values = "".join(f"{var(fname)}, " for fname in spec.details.values())
+    details = f"{details_cls}(({values}))"
+    ip_expr = var(spec.ip_field) if spec.ip_field else "None"
+    user_expr = var(spec.user_field) if spec.user_field else "None"
+    lines.append(
+        f"    return _LogEvent({source!r}, line.rstrip('\\n'), ts, {ip_expr}, {user_expr}, et, {details}, "
+        f"'', '', None, us, {ipn_expr})"
+    )
 
-    url = data.get("url", "-")
+    namespace = dict(consts)
+    code = "\n".join(lines)
+    exec(compile(code, f"<format:{spec.name}>", "exec"), namespace)
+    parser = namespace["parse"]
+    parser.__name__ = f"parse_{re.sub(r'[^0-9A-Za-z_]', '_', spec.name)}_log_line"
+    parser.spec = spec
+    return parser
+
+
+EventTyper = Callable[[LogEvent, Config], str]
+
+
+def compile_event_typer(spec: FormatSpec) -> Optional[EventTyper]:
+    # Повторное определение типа события по уже разобранному событию (без
+    # исходной строки): нужные правилам поля берутся из user/ip и details.
+    # None — если правила ссылаются на поле, которого в событии нет.
+    used: List[str] = []
+
+    def need(fname: Optional[str], what: str) -> None:
+        if fname and fname not in used:
+            used.append(fname)
+
+    consts: Dict[str, Any] = {}
+
+    def const(value: Any) -> str:
+        name = f"_k{len(consts)}"
+        consts[name] = value
+        return name
+
+    body = _event_type_code(spec, need, const)
+    detail_keys = {fname: key for key, fname in spec.details.items()}
+    lines = ["def retype(ev, cfg):", "    d = ev.details"]
+    for fname in used:
+        if fname == spec.user_field:
+            lines.append(f"    {_field_var(fname)} = ev.user")
+        elif fname == spec.ip_field:
+            lines.append(f"    {_field_var(fname)} = ev.ip")
+        elif fname in detail_keys:
+            lines.append(f"    {_field_var(fname)} = d.get({detail_keys[fname]!r})")
+        else:
+            return None
+        if fname in spec.int_fields:
+            v = _field_var(fname)
+            lines.append(f"    i_{fname} = int({v}) if {v} and {v}.isdigit() else 0")
+    lines.extend(body)
+    lines.append("    return et")
+
+    namespace = dict(consts)
+    exec(compile("\n".join(lines), f"<retype:{spec.name}>", "exec"), namespace)
+    return namespace["retype"]
+
+
+def event_typers() -> Dict[str, EventTyper]:
+    # Функции повторного определения типа по источнику событий (первый
+    # зарегистрированный формат источника; парсеры без FormatSpec пропускаются).
+    typers: Dict[str, EventTyper] = {}
+    for parser in PARSERS.values():
+        spec = getattr(parser, "spec", None)
+        if spec is None or (spec.source or spec.name) in typers:
+            continue
+        typer = compile_event_typer(spec)
+        if typer is not None:
+            typers[spec.source or spec.name] = typer
+    return typers
+
+
+WEB_EVENT_TYPES = [
+    {"type": "AUTH_SUCCESS", "when": {"url_keywords": "auth", "fields": {"status": [200, 302, 303]}}},
+    {"type": "AUTH_FAILURE", "when": {"url_keywords": "auth", "fields": {"status": [401, 403]}}},
+    {"type": "AUTH_ATTEMPT", "when": {"url_keywords": "auth"}},
+    {"type": "ACCESS_SENSITIVE", "when": {"url_keywords": "sensitive"}},
+    {"type": "FILE_TRANSFER", "when": {"size_over_threshold": True}},
+    {"type": "ACCESS_AUTHENTICATED", "when": {"has": ["user"]}},
+]
+
+PROXY_EVENT_TYPES = [
+    {"type": "ACCESS_SENSITIVE", "when": {"url_keywords": "sensitive"}},
+    {"type": "FILE_TRANSFER", "when": {"size_over_threshold": True}},
+]
+
+HTTP_DETAILS = {"method": "method", "url": "url", "status": "status", "size": "size"}
+HTTP_INTERNED = ("method", "status")
+
+WEB_FORMAT = FormatSpec(
+    name="web",
+    pattern=apache_pattern,
+    time_format="apache",
+    int_fields=("status", "size"),
+    null_values={"user": ("-",)},
+    details=HTTP_DETAILS,
+    intern_fields=HTTP_INTERNED,
+    event_types=WEB_EVENT_TYPES,
+    default_event_type="ACCESS_OTHER",
+    required_bytes=(b" [", b'] "'),
+)
 
-    event_type = determine_web_event_type(url, status, size, user, cfg)
+NGINX_COMBINED_FORMAT = FormatSpec(
+    name="nginx_combined",
+    source="web",
+    pattern=nginx_combined_pattern,
+    time_format="apache",
+    int_fields=("status", "size"),
+    null_values={"user": ("-",)},
+    details=dict(HTTP_DETAILS, referer="referer", user_agent="user_agent"),
+    intern_fields=HTTP_INTERNED + ("user_agent",),
+    event_types=WEB_EVENT_TYPES,
+    default_event_type="ACCESS_OTHER",
+    required_bytes=(b" [", b'] "', b'" "'),
+)
 
-    details = {
-        "method": data.get("method", ""),
-        "url": url,
-        "status": str(status),
-        "size": str(size),
-    }
+PROXY_FORMAT = FormatSpec(
+    name="proxy",
+    pattern=proxy_pattern,
+    time_format="iso",
+    user_field=None,
+    int_fields=("status", "size"),
+    details=HTTP_DETAILS,
+    intern_fields=HTTP_INTERNED,
+    event_types=PROXY_EVENT_TYPES,
+    default_event_type="PROXY_ACCESS",
+    starts_with_digit=True,
+)
 
-    return LogEvent(
-        source="web",
-        raw_line=line.rstrip("\n"),
-        timestamp=ts,
-        ip=ip,
-        user=user,
-        event_type=event_type,
-        details=details,
-    )
+SQUID_FORMAT = FormatSpec(
+    name="squid",
+    source="proxy",
+    pattern=squid_pattern,
+    time_format="epoch",
+    int_fields=("status", "size"),
+    null_values={"user": ("-",)},
+    details=dict(HTTP_DETAILS, result_code="result_code", hierarchy="hierarchy"),
+    intern_fields=HTTP_INTERNED + ("result_code", "hierarchy"),
+    event_types=PROXY_EVENT_TYPES,
+    default_event_type="PROXY_ACCESS",
+    required_bytes=(b"/",),
+    starts_with_digit=True,
+)
 
+VPN_FORMAT = FormatSpec(
+    name="vpn",
+    pattern=vpn_pattern,
+    time_format="iso",
+    details={"assigned_ip": "assigned", "action": "action", "result": "result"},
+    intern_fields=("assigned", "action", "result"),
+    event_types=[
+        {"type": "AUTH_SUCCESS", "when": {"fields": {"action": "login", "result": "success"}}},
+        {"type": "AUTH_FAILURE", "when": {"fields": {"action": "login"}}},
+    ],
+    default_event_type="VPN_EVENT",
+    required_bytes=(b" user=", b" action="),
+    starts_with_digit=True,
+)
 
-# Proxy-лог
-def determine_proxy_event_type(url: str, status: int, size: int, cfg: Config) -> str:
-    lower_url = url.lower()
-    for kw in cfg.sensitive_keywords:
-        if kw in lower_url:
-            return "ACCESS_SENSITIVE"
+parse_web_log_line = compile_format(WEB_FORMAT)
+parse_proxy_log_line = compile_format(PROXY_FORMAT)
+parse_vpn_log_line = compile_format(VPN_FORMAT)
 
-    if size >= cfg.file_transfer_threshold:
-        return "FILE_TRANSFER"
 
-    return "PROXY_ACCESS"
+# Реестр парсеров (плагинная архитектура)
+PARSERS: Dict[str, ParserFunc] = {
+    "web": parse_web_log_line,
+    "proxy": parse_proxy_log_line,
+    "vpn": parse_vpn_log_line,
+    "nginx_combined": compile_format(NGINX_COMBINED_FORMAT),
+    "squid": compile_format(SQUID_FORMAT),
+}
 
-def parse_proxy_log_line(line: str, cfg: Config) -> Optional[LogEvent]:
-    m = proxy_pattern.match(line)
-    if not m:
-        return None
+# Группа entry points, через которую сторонние пакеты добавляют форматы.
+# Объект entry point — FormatSpec, список FormatSpec или функция-парсер.
+PLUGIN_GROUP = "logclass.parsers"
 
-    data = m.groupdict()
-    ts = parse_iso_time(data.get("time", ""))
-    if ts is not None:
-        offset_min = cfg.time_offsets_minutes.get("proxy", 0)
-        ts = ts + timedelta(minutes=offset_min)
-
-    ip = data.get("ip")
-    url = data.get("url", "")
-    status = int(data.get("status", "0"))
-    size = int(data.get("size", "0"))
-    event_type = determine_proxy_event_type(url, status, size, cfg)
-
-    details = {
-        "method": data.get("method", ""),
-        "url": url,
-        "status": str(status),
-        "size": str(size),
-    }
+_plugins_loaded = False
+PLUGIN_ERRORS: List[str] = []
 
-    return LogEvent(
-        source="proxy",
-        raw_line=line.rstrip("\n"),
-        timestamp=ts,
-        ip=ip,
-        user=None,
-        event_type=event_type,
-        details=details,
-    )
 
+def register_parser(name: str, parser: ParserFunc) -> None:
+    PARSERS[name] = parser
 
-# VPN-лог
-def parse_vpn_log_line(line: str, cfg: Config) -> Optional[LogEvent]:
-    m = vpn_pattern.match(line)
-    if not m:
-        return None
 
-    data = m.groupdict()
-    ts = parse_iso_time(data.get("time", ""))
-    if ts is not None:
-        offset_min = cfg.time_offsets_minutes.get("vpn", 0)
-        ts = ts + timedelta(minutes=offset_min)
-
-    user = data.get("user")
-    ip = data.get("ip")
-    assigned = data.get("assigned")
-    action = data.get("action")
-    result = data.get("result")
-
-    if action == "login":
-        if result == "success":
-            event_type = "AUTH_SUCCESS"
-        else:
-            event_type = "AUTH_FAILURE"
-    else:
-        event_type = "VPN_EVENT"
+def register_format(spec: FormatSpec) -> ParserFunc:
+    parser = compile_format(spec)
+    PARSERS[spec.name] = parser
+    return parser
 
-    details = {
-        "assigned_ip": assigned,
-        "action": action,
-        "result": result,
-    }
 
-    return LogEvent(
-        source="vpn",
-        raw_line=line.rstrip("\n"),
-        timestamp=ts,
-        ip=ip,
-        user=user,
-        event_type=event_type,
-        details=details,
-    )
+def _iter_entry_points():
+    from importlib import metadata
+    eps = metadata.entry_points()
+    if hasattr(eps, "select"):
+        return eps.select(group=PLUGIN_GROUP)
+    return eps.get(PLUGIN_GROUP, [])
 
 
-# Реестр парсеров (плагинная архитектура)
-ParserFunc = Callable[[str, Config], Optional[LogEvent]]
-PARSERS: Dict[str, ParserFunc] = {
-    "web": parse_web_log_line,
-    "proxy": parse_proxy_log_line,
-    "vpn": parse_vpn_log_line,
-}
+def load_parser_plugins() -> List[str]:
+    # Однократная загрузка форматов из entry points; возвращает список ошибок.
+    global _plugins_loaded
+    if _plugins_loaded:
+        return PLUGIN_ERRORS
+    _plugins_loaded = True
+    try:
+        entry_points = list(_iter_entry_points())
+    except Exception as e:
+        PLUGIN_ERRORS.append(f"entry points: {e}")
+        return PLUGIN_ERRORS
+
+    for ep in entry_points:
+        try:
+            obj = ep.load()
+            items = obj if isinstance(obj, (list, tuple)) else [obj]
+            for item in items:
+                if isinstance(item, FormatSpec):
+                    register_format(item)
+                elif callable(item):
+                    register_parser(ep.name, item)
+                else:
+                    raise TypeError("ожидается FormatSpec или функция-парсер")
+        except Exception as e:
+            PLUGIN_ERRORS.append(f"{ep.name}: {e}")
+    return PLUGIN_ERRORS
+
+
+def available_formats() -> List[str]:
+    load_parser_plugins()
+    return sorted(PARSERS)
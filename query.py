@@ -0,0 +1,324 @@
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass, replace
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Pattern, Tuple
+from models import LogEvent
+from netinfo import cidr_bounds
+from rawstore import RawLineStore
+
+
+@dataclass
+class EventQuery:
+    # Запрос к загруженным событиям; все заданные условия объединяются по И.
+    user: Optional[str] = None
+    ip: Optional[str] = None
+    network: Optional[Tuple[int, int]] = None  # подсеть 'ip=10.1.0.0/16': границы ip_int включительно
+    session_id: Optional[int] = None
+    start: Optional[datetime] = None   # включительно
+    end: Optional[datetime] = None     # включительно
+    text: Optional[str] = None         # подстрока исходной строки (без учёта регистра ASCII)
+    regex: Optional[Pattern] = None    # регулярное выражение по исходной строке
+
+    @property
+    def has_time_range(self) -> bool:
+        return self.start is not None or self.end is not None
+
+    @property
+    def has_text(self) -> bool:
+        return self.text is not None or self.regex is not None
+
+
+class _Postings:
+    # События одного ключа, упорядоченные по времени: параллельные массивы
+    # временных меток и индексов событий + события без времени.
+    __slots__ = ("times", "idx", "untimed")
+
+    def __init__(self):
+        self.times: List[datetime] = []
+        self.idx = array("l")
+        self.untimed = array("l")
+
+
+class EventIndex:
+    # Отсортированный индекс по времени и инвертированные индексы user / IP / сессия.
+    # Строится за O(n log n), запросы выполняются бинарным поиском по нужному списку.
+
+    def __init__(self, events: List[LogEvent], raw: Optional[RawLineStore] = None):
+        self.events = events
+        self.raw = raw  # хранилище исходных строк (с триграммным индексом) для text= / re=
+        order = sorted(
+            (i for i, ev in enumerate(events) if ev.timestamp is not None),
+            key=lambda i: events[i].timestamp,
+        )
+        self.times: List[datetime] = [events[i].timestamp for i in order]
+        self.order = array("l", order)
+        self.untimed = array("l", (i for i, ev in enumerate(events) if ev.timestamp is None))
+
+        self.by_user: Dict[str, _Postings] = {}
+        self.by_ip: Dict[str, _Postings] = {}
+        self.by_session: Dict[int, _Postings] = {}
+        for i in order:
+            ev = events[i]
+            ts = ev.timestamp
+            for key, table in ((ev.user, self.by_user), (ev.ip, self.by_ip), (ev.session_id, self.by_session)):
+                if key is None:
+                    continue
+                postings = table.get(key)
+                if postings is None:
+                    postings = table[key] = _Postings()
+                postings.times.append(ts)
+                postings.idx.append(i)
+        for i in self.untimed:
+            ev = events[i]
+            for key, table in ((ev.user, self.by_user), (ev.ip, self.by_ip), (ev.session_id, self.by_session)):
+                if key is None:
+                    continue
+                postings = table.get(key)
+                if postings is None:
+                    postings = table[key] = _Postings()
+                postings.untimed.append(i)
+        # адреса по возрастанию ip_int — строится при первом запросе по подсети
+        self._ip_keys: Optional[List[int]] = None
+        self._ip_idx: Optional[array] = None
+        # номер строки в хранилище -> индекс события и события с неупакованной
+        # строкой — строятся при первом полнотекстовом запросе
+        self._by_ref: Optional[array] = None
+        self._unpacked: Optional[List[int]] = None
+
+    def _ip_sorted(self) -> Tuple[List[int], array]:
+        if self._ip_keys is None:
+            events = self.events
+            pairs = sorted((ev.ip_int, i) for i, ev in enumerate(events) if ev.ip_int is not None)
+            self._ip_keys = [value for value, _ in pairs]
+            self._ip_idx = array("l", (i for _, i in pairs))
+        return self._ip_keys, self._ip_idx
+
+    def _query_network(self, q: EventQuery) -> List[int]:
+        # Подсеть — диапазон ip_int: бинарный поиск по адресам, остальные условия по событию.
+        keys, idx = self._ip_sorted()
+        lo, hi = q.network
+        events = self.events
+        result = []
+        for i in idx[bisect_left(keys, lo):bisect_right(keys, hi)]:
+            ev = events[i]
+            ts = ev.timestamp
+            if ts is None:
+                if q.has_time_range:
+                    continue
+            elif (q.start is not None and ts < q.start) or (q.end is not None and ts > q.end):
+                continue
+            if (q.user is None or ev.user == q.user) and (q.ip is None or ev.ip == q.ip) \
+                    and (q.session_id is None or ev.session_id == q.session_id):
+                result.append(i)
+        result.sort(key=lambda i: (events[i].ts_us is None, events[i].ts_us or 0))
+        return result
+
+    def _text_hits(self, q: EventQuery) -> List[int]:
+        # События, исходная строка которых подходит под text / regex.
+        events = self.events
+        if self._by_ref is None:
+            size = max((ev.raw_ref for ev in events if ev.raw_ref is not None), default=-1) + 1
+            by_ref = array("l", [-1]) * size
+            for i, ev in enumerate(events):
+                if ev.raw_ref is not None:
+                    by_ref[ev.raw_ref] = i
+            self._by_ref = by_ref
+            self._unpacked = [i for i, ev in enumerate(events) if ev.raw_line is not None]
+        hits: List[int] = []
+        if self.raw is not None:
+            by_ref = self._by_ref
+            refs = self.raw.search(q.text) if q.text is not None else self.raw.search_regex(q.regex)
+            hits = [by_ref[r] for r in refs if r < len(by_ref) and by_ref[r] >= 0]
+            if q.text is not None and q.regex is not None:
+                hits = [i for i in hits if q.regex.search(self.raw.line(events[i]))]
+        needle = q.text.encode("utf-8").lower() if q.text is not None else None
+        for i in self._unpacked:
+            line = events[i].raw_line
+            if (needle is None or needle in line.encode("utf-8").lower()) \
+                    and (q.regex is None or q.regex.search(line)):
+                hits.append(i)
+        return hits
+
+    def _query_text(self, q: EventQuery) -> List[int]:
+        # Полнотекстовое условие: кандидаты из триграммного индекса, проверенные
+        # по строкам; остальные условия — обычным запросом, результат в порядке времени.
+        hits = self._text_hits(q)
+        rest = replace(q, text=None, regex=None)
+        if rest == EventQuery():
+            events = self.events
+            hits.sort(key=lambda i: (events[i].ts_us is None, events[i].ts_us or 0, i))
+            return hits
+        wanted = set(hits)
+        return [i for i in self.query(rest) if i in wanted]
+
+    @property
+    def first_time(self) -> Optional[datetime]:
+        return self.times[0] if self.times else None
+
+    @staticmethod
+    def _slice(times: List[datetime], start: Optional[datetime], end: Optional[datetime]) -> Tuple[int, int]:
+        lo = bisect_left(times, start) if start is not None else 0
+        hi = bisect_right(times, end) if end is not None else len(times)
+        return lo, hi
+
+    def query(self, q: EventQuery) -> List[int]:
+        # Индексы событий, удовлетворяющих запросу, в порядке времени.
+        # События без времени попадают в результат, только если не задан интервал.
+        if q.has_text:
+            return self._query_text(q)
+        if q.network is not None:
+            return self._query_network(q)
+        candidates: List[_Postings] = []
+        for key, table in ((q.user, self.by_user), (q.ip, self.by_ip), (q.session_id, self.by_session)):
+            if key is None:
+                continue
+            postings = table.get(key)
+            if postings is None:
+                return []
+            candidates.append(postings)
+
+        if not candidates:
+            lo, hi = self._slice(self.times, q.start, q.end)
+            result = list(self.order[lo:hi])
+            if not q.has_time_range:
+                result.extend(self.untimed)
+            return result
+
+        # самый короткий список ключа, остальные условия проверяются по событию
+        base = min(candidates, key=lambda p: len(p.idx) + len(p.untimed))
+        lo, hi = self._slice(base.times, q.start, q.end)
+        result = list(base.idx[lo:hi])
+        if not q.has_time_range:
+            result.extend(base.untimed)
+        if len(candidates) > 1:
+            events = self.events
+            result = [
+                i for i in result
+                if (q.user is None or events[i].user == q.user)
+                and (q.ip is None or events[i].ip == q.ip)
+                and (q.session_id is None or events[i].session_id == q.session_id)
+            ]
+        return result
+
+
+IP_LIKE = re.compile(r"^[0-9a-fA-F.:]+(?:/\d{1,3})?$")
+
+# формат -> длительность периода, который он задаёт (для верхней границы 'to=')
+TIME_FORMATS = (
+    ("%Y-%m-%d %H:%M:%S", timedelta(seconds=1)),
+    ("%Y-%m-%dT%H:%M:%S", timedelta(seconds=1)),
+    ("%Y-%m-%d %H:%M", timedelta(minutes=1)),
+    ("%Y-%m-%d", timedelta(days=1)),
+)
+CLOCK_FORMATS = (
+    ("%H:%M:%S", timedelta(seconds=1)),
+    ("%H:%M", timedelta(minutes=1)),
+)
+
+
+DATE_TOKEN = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+CLOCK_TOKEN = re.compile(r"^\d{1,2}:\d{2}(?::\d{2})?$")
+
+
+def _split_when(value: str) -> Tuple[str, List[str]]:
+    # Время занимает не больше двух токенов — дату и часы ('2025-11-10 14:10');
+    # остальное после него — голые значения ('from=13:50 alice').
+    tokens = value.split()
+    if len(tokens) > 1 and DATE_TOKEN.match(tokens[0]) and CLOCK_TOKEN.match(tokens[1]):
+        return " ".join(tokens[:2]), tokens[2:]
+    return (tokens[0] if tokens else ""), tokens[1:]
+
+
+def _parse_when(value: str, default_day: Optional[datetime], upper: bool = False) -> datetime:
+    # Для верхней границы возвращается конец указанного периода ('to=14:10' — до 14:10:59.999999).
+    value = value.strip()
+    parsed = None
+    for fmt, period in TIME_FORMATS:
+        try:
+            parsed = datetime.strptime(value, fmt), period
+            break
+        except ValueError:
+            pass
+    if parsed is None:
+        for fmt, period in CLOCK_FORMATS:
+            try:
+                clock = datetime.strptime(value, fmt).time()
+            except ValueError:
+                continue
+            day = default_day.date() if default_day else datetime.now().date()
+            parsed = datetime.combine(day, clock), period
+            break
+    if parsed is None:
+        raise ValueError(f"не удалось разобрать время: {value}")
+    dt, period = parsed
+    if upper:
+        dt = dt + period - timedelta(microseconds=1)
+    return dt
+
+
+def _set_ip(q: EventQuery, value: str) -> None:
+    # Адрес или подсеть ('10.1.0.0/16', '2001:db8::/32').
+    if "/" in value:
+        try:
+            q.network = cidr_bounds(value)
+        except ValueError:
+            raise ValueError(f"некорректная подсеть: {value}")
+    else:
+        q.ip = value
+
+
+def parse_query(text: str, default_day: Optional[datetime] = None) -> EventQuery:
+    # Разбор строки поиска вида
+    #   'user=alice from=13:50 to=14:10', 'ip=198.51.100.23', 'ip=10.1.0.0/16', 'session=3',
+    #   'text=/upload.php', 're=curl/7\.\d+' (по исходной строке),
+    #   '198.51.100.23' (голое значение — IP или пользователь; и после времени: 'from=13:50 alice').
+    # Время без даты относится к дню default_day (обычно — первое событие).
+    q = EventQuery()
+    # значения времени могут содержать пробел ('2025-11-10 13:50'), поэтому
+    # токены разбираются по ключам, а не просто split()
+    parts = re.split(r"\s+(?=(?:user|ip|session|from|to|text|re)=)", text.strip())
+    for part in parts:
+        if not part:
+            continue
+        key, sep, value = part.partition("=")
+        key = key.strip().lower()
+        value = value.strip()
+        bare = part.split() if not sep else []
+        if sep and key in ("user", "ip", "session") and " " in value:
+            value, *bare = value.split()
+        elif sep and key in ("from", "to"):
+            value, bare = _split_when(value)
+        for token in bare:
+            if IP_LIKE.match(token) and any(ch.isdigit() for ch in token):
+                _set_ip(q, token)
+            else:
+                q.user = token
+        if not sep:
+            continue
+        if key == "user":
+            q.user = value
+        elif key == "ip":
+            _set_ip(q, value)
+        elif key == "session":
+            try:
+                q.session_id = int(value)
+            except ValueError:
+                raise ValueError(f"некорректный номер сессии: {value}")
+        elif key == "from":
+            q.start = _parse_when(value, default_day)
+        elif key == "to":
+            q.end = _parse_when(value, default_day, upper=True)
+        elif key == "text":
+            if not value:
+                raise ValueError("пустая строка для text=")
+            q.text = value
+        elif key == "re":
+            try:
+                q.regex = re.compile(value)
+            except re.error as e:
+                raise ValueError(f"некорректное регулярное выражение: {e}")
+        else:
+            raise ValueError(f"неизвестное условие: {key}")
+    return q
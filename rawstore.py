@@ -0,0 +1,192 @@
+import zlib
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from itertools import accumulate
+from typing import Iterable, List, Optional, Pattern, Tuple
+
+from models import LogEvent
+from textindex import TrigramIndex, required_literals
+
+# Хранилище исходных строк событий.
+#
+# Строка лога нужна целиком только для показа события, экспорта и отчёта, а как
+# str на каждое событие занимает в памяти больше самих логов. Строки
+# складываются подряд в блоки ~BLOCK_BYTES (UTF-8), заполненный блок сжимается
+# zlib; для блока хранятся номер первой строки и смещения строк в распакованных
+# байтах. Событие держит только номер строки (LogEvent.raw_ref, raw_line = None).
+# Чтение строки: двоичный поиск блока, распаковка (последние CACHE_BLOCKS
+# распакованных блоков лежат в LRU-кэше) и срез по смещениям.
+# С index заполненный блок ещё и попадает в триграммный индекс (textindex), по
+# которому search / search_regex находят строки, не просматривая все блоки.
+# Блоки из файла дела (adopt) принимаются сжатыми как есть и попадают в индекс
+# только при первом поиске.
+
+BLOCK_BYTES = 64 * 1024
+CACHE_BLOCKS = 16
+COMPRESS_LEVEL = 6
+
+
+class RawLineStore:
+    def __init__(self, block_bytes: int = BLOCK_BYTES, cache_blocks: int = CACHE_BLOCKS,
+                 level: int = COMPRESS_LEVEL, index: Optional[TrigramIndex] = None):
+        self.block_bytes = block_bytes
+        self.index = index
+        self.cache_blocks = max(1, cache_blocks)
+        self.level = level
+        self.blocks: List[bytes] = []     # сжатые блоки
+        self.offsets: List[array] = []    # для каждого блока: начала строк и конец последней
+        self.first = array("q")           # номер первой строки каждого блока
+        self.raw_bytes = 0                # объём строк до сжатия
+        self._pending: List[bytes] = []   # строки незаполненного блока (не сжаты)
+        self._pending_bytes = 0
+        self._count = 0
+        self._indexed = 0                 # сколько блоков (по порядку) попало в индекс
+        self._cache: "OrderedDict[int, bytes]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def add(self, line: str) -> int:
+        # Добавить строку; возвращает её номер в хранилище.
+        data = line.encode("utf-8")
+        self._pending.append(data)
+        self._pending_bytes += len(data)
+        self.raw_bytes += len(data)
+        ref = self._count
+        self._count += 1
+        if self._pending_bytes >= self.block_bytes:
+            self._seal()
+        return ref
+
+    def _seal(self) -> None:
+        lines = self._pending
+        self.first.append(self._count - len(lines))
+        self.offsets.append(array("I", accumulate(map(len, lines), initial=0)))
+        data = b"".join(lines)
+        if self.index is not None and self._indexed == len(self.blocks):
+            self.index.add_block(len(self.blocks), data)
+            self._indexed += 1
+        self.blocks.append(zlib.compress(data, self.level))
+        self._pending = []
+        self._pending_bytes = 0
+
+    def _block(self, n: int) -> bytes:
+        cache = self._cache
+        data = cache.get(n)
+        if data is None:
+            data = cache[n] = zlib.decompress(self.blocks[n])
+            if len(cache) > self.cache_blocks:
+                cache.popitem(last=False)
+        else:
+            cache.move_to_end(n)
+        return data
+
+    def get(self, ref: int) -> str:
+        if not 0 <= ref < self._count:
+            raise IndexError(f"нет строки {ref} в хранилище")
+        pending_start = self._count - len(self._pending)
+        if ref >= pending_start:
+            return self._pending[ref - pending_start].decode("utf-8")
+        n = bisect_right(self.first, ref) - 1
+        offsets = self.offsets[n]
+        i = ref - self.first[n]
+        return self._block(n)[offsets[i]:offsets[i + 1]].decode("utf-8")
+
+    def _scan_block(self, n: int) -> bytes:
+        # Распакованный блок для поиска: без записи в кэш, чтобы просмотр многих
+        # блоков не вытеснял блоки, с которыми работает пользователь.
+        data = self._cache.get(n)
+        return data if data is not None else zlib.decompress(self.blocks[n])
+
+    def _candidates(self, literals: List[bytes]) -> List[int]:
+        if self.index is None:
+            return list(range(len(self.blocks)))
+        # индекс дополняется блоками, принятыми через adopt (по возрастанию номеров)
+        while self._indexed < len(self.blocks):
+            self.index.add_block(self._indexed, self._scan_block(self._indexed))
+            self._indexed += 1
+        return self.index.candidates(literals, len(self.blocks))
+
+    def search(self, text: str) -> List[int]:
+        # Номера строк, содержащих text (без учёта регистра ASCII), по возрастанию.
+        needle = text.encode("utf-8").lower()
+        size = len(needle)
+        hits: List[int] = []
+        for n in self._candidates([needle]):
+            data = self._scan_block(n).lower()
+            offsets, first = self.offsets[n], self.first[n]
+            pos = data.find(needle)
+            while pos >= 0:
+                # строки в блоке идут без разделителей: вхождение на стыке не считается
+                i = bisect_right(offsets, pos) - 1
+                end = offsets[i + 1]
+                if pos + size <= end:
+                    hits.append(first + i)
+                pos = data.find(needle, end)
+        pending_start = self._count - len(self._pending)
+        hits.extend(pending_start + j for j, line in enumerate(self._pending) if needle in line.lower())
+        return hits
+
+    def search_regex(self, pattern: Pattern) -> List[int]:
+        # Номера строк, в которых есть совпадение с pattern, по возрастанию.
+        literals = [lit.encode("utf-8").lower() for lit in required_literals(pattern)]
+        search = pattern.search
+        hits: List[int] = []
+        for n in self._candidates(literals):
+            data = self._scan_block(n)
+            lower = data.lower()
+            if not all(lit in lower for lit in literals):
+                continue
+            offsets, first = self.offsets[n], self.first[n]
+            hits.extend(
+                first + i for i in range(len(offsets) - 1)
+                if search(data[offsets[i]:offsets[i + 1]].decode("utf-8"))
+            )
+        pending_start = self._count - len(self._pending)
+        hits.extend(pending_start + j for j, line in enumerate(self._pending) if search(line.decode("utf-8")))
+        return hits
+
+    def snapshot(self) -> Tuple[List[bytes], List[array], array, List[bytes], int]:
+        # Сжатые блоки, смещения, номера первых строк, несжатый хвост и объём
+        # строк до сжатия — для сохранения дела; обратная операция — adopt.
+        return self.blocks, self.offsets, self.first, self._pending, self.raw_bytes
+
+    def adopt(self, blocks: List[bytes], offsets: List[array], first: array,
+              pending: List[bytes], raw_bytes: int) -> None:
+        # Принять готовые сжатые блоки (из файла дела) в пустое хранилище;
+        # номера строк сохраняются. pending — строки незаполненного блока.
+        if self._count:
+            raise ValueError("блоки можно принять только в пустое хранилище")
+        if not (len(blocks) == len(offsets) == len(first)):
+            raise ValueError("число блоков, смещений и номеров строк не совпадает")
+        self.blocks = list(blocks)
+        self.offsets = list(offsets)
+        self.first = array("q", first)
+        sealed = first[-1] + len(offsets[-1]) - 1 if blocks else 0
+        self._pending = list(pending)
+        self._pending_bytes = sum(map(len, pending))
+        self._count = sealed + len(pending)
+        self.raw_bytes = raw_bytes
+        self._cache.clear()
+
+    def line(self, ev: LogEvent) -> str:
+        # Исходная строка события: из хранилища или из самого события, если оно не упаковано.
+        return ev.raw_line if ev.raw_line is not None else self.get(ev.raw_ref)
+
+    def pack(self, events: Iterable[LogEvent]) -> None:
+        # Перенести строки событий в хранилище (события получают raw_ref).
+        add = self.add
+        for ev in events:
+            if ev.raw_line is not None:
+                ev.raw_ref = add(ev.raw_line)
+                ev.raw_line = None
+
+    @property
+    def stored_bytes(self) -> int:
+        # Память под строки: сжатые блоки, смещения и несжатый хвост (без индекса).
+        return (
+            sum(map(len, self.blocks))
+            + sum(len(o) * o.itemsize for o in self.offsets)
+            + self._pending_bytes
+        )
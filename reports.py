@@ -1,20 +1,43 @@
-from typing import List
+from typing import List, Optional
 import csv
-import matplotlib.pyplot as plt
+import os
+from collections import Counter
+from actors import Actor
+from corroboration import Corroboration
+from custody import CustodyLog, write_proofs_csv
+from rule_engine import SENSITIVE_EVENT_TYPES
+from sketches import Z_95, EventSketches, SketchEstimate
 from models import LogEvent, Session
-from classifier import compute_class_stats, compute_source_stats
+from rawstore import RawLineStore
+from aggregates import EventAggregates, compute_aggregates, timeline_by_class
 
-def export_events_csv(events: List[LogEvent], path: str) -> None:
-    # Экспорт событий в CSV.
+def proofs_path(path: str) -> str:
+    return os.path.splitext(path)[0] + ".proofs.csv"
+
+
+def export_events_csv(
+    events: List[LogEvent],
+    path: str,
+    custody: Optional[CustodyLog] = None,
+    raw: Optional[RawLineStore] = None,
+) -> Optional[str]:
+    # Экспорт событий в CSV. С журналом хранения у событий добавляются хэш файла,
+    # корень дерева Меркла и номер блока, а доказательства включения блоков
+    # пишутся рядом в <имя>.proofs.csv (возвращается его путь).
+    # Упакованные исходные строки берутся из хранилища raw.
     fields = [
         "timestamp", "source", "event_type",
         "user", "ip", "evidential_class", "notes", "raw_line"
     ]
+    with_custody = custody is not None and len(custody) > 0
+    if with_custody:
+        fields += ["file_sha256", "merkle_root", "block"]
+        roots = [rec.root for rec in custody]
     with open(path, "w", encoding="utf-8", newline="") as f:
         writer = csv.DictWriter(f, fieldnames=fields, delimiter=";")
         writer.writeheader()
         for ev in events:
-            writer.writerow({
+            row = {
                 "timestamp": ev.timestamp.isoformat(sep=" ") if ev.timestamp else "",
                 "source": ev.source,
                 "event_type": ev.event_type,
@@ -22,28 +45,61 @@ def export_events_csv(events: List[LogEvent], path: str) -> None:
                 "ip": ev.ip or "",
                 "evidential_class": ev.evidential_class,
                 "notes": ev.notes,
-                "raw_line": ev.raw_line,
-            })
+                "raw_line": raw.line(ev) if raw is not None else ev.raw_line,
+            }
+            if with_custody:
+                rec = custody.record(ev.block_ref)
+                if rec is not None:
+                    row["file_sha256"] = rec.sha256
+                    row["merkle_root"] = roots[ev.block_ref[0]]
+                    row["block"] = ev.block_ref[1]
+            writer.writerow(row)
+    if not with_custody:
+        return None
+    out = proofs_path(path)
+    write_proofs_csv(custody, (ev.block_ref for ev in events if ev.block_ref is not None), out)
+    return out
 
-def export_summary_markdown(events: List[LogEvent], sessions: List[Session], path: str) -> None:
+def export_summary_markdown(
+    events: List[LogEvent],
+    sessions: List[Session],
+    path: str,
+    aggregates: Optional[EventAggregates] = None,
+    actors: Optional[List[Actor]] = None,
+    custody: Optional[CustodyLog] = None,
+    corroboration: Optional[Corroboration] = None,
+) -> None:
     # Экспорт сводного отчёта в Markdown
-    class_stats = compute_class_stats(events)
-    source_stats = compute_source_stats(events)
+    if aggregates is None:
+        aggregates = compute_aggregates(events)
+    class_stats = aggregates.class_counts
+    source_stats = aggregates.source_counts
+    event_type_stats = aggregates.event_type_counts
 
     with open(path, "w", encoding="utf-8") as f:
         f.write("# Сводный отчёт по цифровым следам\n\n")
+        if custody is not None and len(custody):
+            _write_custody_section(f, custody, events)
         f.write("## Статистика по классам значимости\n\n")
         f.write("| Класс | Количество |\n")
         f.write("|-------|------------|\n")
         for cls in sorted(class_stats.keys()):
             f.write(f"| {cls} | {class_stats[cls]} |\n")
         f.write("\n")
+        if corroboration is not None and corroboration.masks:
+            _write_corroboration_section(f, corroboration, events)
         f.write("## Статистика по источникам логов\n\n")
         f.write("| Источник | Количество событий |\n")
         f.write("|----------|--------------------|\n")
         for src in sorted(source_stats.keys()):
             f.write(f"| {src} | {source_stats[src]} |\n")
         f.write("\n")
+        f.write("## Статистика по типам событий\n\n")
+        f.write("| Тип события | Количество |\n")
+        f.write("|-------------|------------|\n")
+        for et, cnt in event_type_stats.most_common():
+            f.write(f"| {et} | {cnt} |\n")
+        f.write("\n")
         f.write("## Сессии пользователей / IP\n\n")
         f.write("| ID | Ключ | Тип ключа | Кол-во событий | Источники | Классы |\n")
         f.write("|----|------|-----------|----------------|-----------|--------|\n")
@@ -53,46 +109,237 @@ def export_summary_markdown(events: List[LogEvent], sessions: List[Session], pat
                 f"{len(s.events)} | {', '.join(s.sources)} | {', '.join(s.classes)} |\n"
             )
         f.write("\n")
+        if actors is not None:
+            _write_actors_section(f, actors)
+        if aggregates.sketches is not None:
+            f.write(sketch_summary_markdown(aggregates.sketches))
         f.write("## Примеры слабых следов (классы C и D)\n\n")
-        count = 0
-        for ev in events:
-            if ev.evidential_class in ("C", "D"):
-                f.write(
-                    f"- [{ev.evidential_class}] {ev.timestamp} {ev.source} {ev.event_type} "
-                    f"(user={ev.user}, ip={ev.ip}) — {ev.notes}\n"
-                )
-                count += 1
-                if count >= 20:
-                    break
-        if count == 0:
+        for ev in aggregates.weak_traces:
+            f.write(
+                f"- [{ev.evidential_class}] {ev.timestamp} {ev.source} {ev.event_type} "
+                f"(user={ev.user}, ip={ev.ip}) — {ev.notes}\n"
+            )
+        if not aggregates.weak_traces:
             f.write("_Слабых следов не обнаружено._\n")
+        elif aggregates.weak_total > len(aggregates.weak_traces):
+            f.write(f"\n_Показано {len(aggregates.weak_traces)} из {aggregates.weak_total}._\n")
+
+CUSTODY_REPORT_PROOFS = 20
+
+
+def _write_custody_section(f, custody: CustodyLog, events: List[LogEvent]) -> None:
+    f.write("## Целостность исходных файлов\n\n")
+    f.write("| Файл | Источник | Размер, байт | Строк | Блоков | SHA-256 | Корень дерева Меркла |\n")
+    f.write("|------|----------|--------------|-------|--------|---------|----------------------|\n")
+    for rec in custody:
+        status = "" if rec.complete else " (прочитан не полностью)"
+        f.write(
+            f"| {rec.path}{status} | {rec.source} | {rec.size} | {rec.lines} | {rec.blocks} | "
+            f"`{rec.sha256}` | `{rec.root}` |\n"
+        )
+    f.write(
+        "\nФайл разбит на блоки по границам строк; лист дерева — SHA-256(0x00 ‖ байты блока), "
+        "узел — SHA-256(0x01 ‖ левый ‖ правый). Строка события доказывается байтами её блока "
+        "(смещение и длина) и путём до корня; доказательства всех блоков с событиями сохраняются "
+        "при экспорте CSV (`<имя>.proofs.csv`) и проверяются командой `python custody.py verify`.\n\n"
+    )
+    # доказательства для блоков с событиями класса A — самыми значимыми следами
+    refs = []
+    seen = set()
+    for ev in events:
+        ref = ev.block_ref
+        if ev.evidential_class == "A" and ref is not None and ref not in seen:
+            rec = custody.record(ref)
+            if rec is not None and rec.complete:
+                seen.add(ref)
+                refs.append(ref)
+    if not refs:
+        return
+    f.write("### Доказательства включения (блоки с событиями класса A)\n\n")
+    for ref in refs[:CUSTODY_REPORT_PROOFS]:
+        proof = custody.block_proof(ref)
+        f.write(
+            f"- `{os.path.basename(proof['file'])}` блок {proof['block']} "
+            f"(смещение {proof['offset']}, длина {proof['length']}), лист `{proof['leaf']}`, "
+            f"путь: `{proof['proof'] or '—'}`\n"
+        )
+    if len(refs) > CUSTODY_REPORT_PROOFS:
+        f.write(f"\n_Показано {CUSTODY_REPORT_PROOFS} из {len(refs)} блоков; все — в экспорте CSV._\n")
+    f.write("\n")
+
+
+SKETCH_HOURS_LIMIT = 24
+SKETCH_TOP_N = 20
+
+
+def _fmt_estimate(est: SketchEstimate) -> str:
+    return f"{est.value:.0f} [{est.low:.0f} — {est.high:.0f}]"
+
+
+def sketch_summary_markdown(sketches: EventSketches) -> str:
+    # Оценки по вероятностным сводкам (раздел отчёта и окно «Сводки» в GUI).
+    sensitive = tuple(SENSITIVE_EVENT_TYPES)
+    lines = ["## Оценки по вероятностным сводкам", ""]
+    lines.append(
+        f"_Число различных значений — HyperLogLog (95% интервал ±{100 * Z_95 * sketches.relative_error:.1f}%), "
+        "частоты — Count-Min и Space-Saving: в скобках нижняя (гарантированная) и верхняя границы._"
+    )
+    lines += ["", "### Различные пользователи и IP-адреса", ""]
+    lines.append("| Срез | Пользователей | IP-адресов |")
+    lines.append("|------|---------------|------------|")
+    rows = [("Все события", {})]
+    rows += [(f"Источник {src}", {"source": src}) for src in sketches.distinct_by("users", "source")]
+    rows += [(f"Класс {cls}", {"cls": cls}) for cls in sketches.distinct_by("users", "class") if cls]
+    rows.append(("Чувствительные события", {"event_type": sensitive}))
+    for title, flt in rows:
+        lines.append(
+            f"| {title} | {_fmt_estimate(sketches.distinct('users', **flt))} | "
+            f"{_fmt_estimate(sketches.distinct('ips', **flt))} |"
+        )
+
+    by_hour = sketches.distinct_by("ips", "hour", event_type=sensitive)
+    if by_hour:
+        busiest = sorted(by_hour, key=lambda h: -by_hour[h].value)[:SKETCH_HOURS_LIMIT]
+        lines += ["", "### Различные IP-адреса с чувствительными событиями по часам", ""]
+        lines.append("| Час (UTC) | IP-адресов | Пользователей |")
+        lines.append("|-----------|------------|---------------|")
+        for hour in sorted(busiest):
+            users = sketches.distinct("users", event_type=sensitive, hour=hour)
+            lines.append(
+                f"| {sketches.hour_start(hour):%Y-%m-%d %H:00} | {_fmt_estimate(by_hour[hour])} | "
+                f"{_fmt_estimate(users)} |"
+            )
+        if len(by_hour) > len(busiest):
+            lines.append(f"\n_Показаны {len(busiest)} часов с наибольшим числом адресов из {len(by_hour)}._")
 
-def plot_class_distribution(events: List[LogEvent]) -> None:
+    for stream, title, column in (
+        ("sensitive_users", "Пользователи по числу чувствительных событий", "Пользователь"),
+        ("sensitive_ips", "IP-адреса по числу чувствительных событий", "IP-адрес"),
+        ("users", "Самые активные пользователи", "Пользователь"),
+        ("ips", "Самые активные IP-адреса", "IP-адрес"),
+    ):
+        top = sketches.top(stream, SKETCH_TOP_N)
+        if not top:
+            continue
+        lines += ["", f"### {title}", ""]
+        lines.append(f"| {column} | Событий (оценка) |")
+        lines.append("|------|------------------|")
+        for item, est in top:
+            lines.append(f"| {item} | {_fmt_estimate(est)} |")
+        bound, confidence = sketches.frequency_error(stream)
+        lines.append(f"\n_Count-Min: переоценка не больше {bound:.0f} с вероятностью {100 * confidence:.0f}%._")
+    lines += ["", ""]
+    return "\n".join(lines)
+
+
+ACTORS_REPORT_LIMIT = 100
+
+
+def _write_actors_section(f, actors: List[Actor]) -> None:
+    # Участники, объединяющие несколько пользователей / адресов (одиночные адреса не показываются).
+    linked = [a for a in actors if a.identities > 1]
+    f.write("## Участники (связанные пользователи и IP-адреса)\n\n")
+    if not linked:
+        f.write("_Связанных пользователей и адресов не обнаружено._\n\n")
+        return
+    f.write("| ID | Пользователи | IP-адреса | Кол-во событий | Период (UTC) | Источники | Классы |\n")
+    f.write("|----|--------------|-----------|----------------|--------------|-----------|--------|\n")
+    for a in linked[:ACTORS_REPORT_LIMIT]:
+        start, end = a.start_time, a.end_time
+        period = f"{start:%Y-%m-%d %H:%M} — {end:%Y-%m-%d %H:%M}" if start and end else "—"
+        f.write(
+            f"| {a.id} | {', '.join(a.users) or '—'} | {', '.join(a.ips)} | {len(a.events)} | "
+            f"{period} | {', '.join(a.sources)} | {', '.join(a.classes)} |\n"
+        )
+    if len(linked) > ACTORS_REPORT_LIMIT:
+        f.write(f"\n_Показано {ACTORS_REPORT_LIMIT} из {len(linked)}._\n")
+    f.write("\n")
+
+
+def _write_corroboration_section(f, corroboration: Corroboration, events: List[LogEvent]) -> None:
+    # Сколько событий каждого источника подтверждено другими источниками (и какими).
+    f.write("## Подтверждение другими источниками\n\n")
+    f.write(
+        f"Окно сопоставления — {corroboration.window_minutes} мин; события связываются по пользователю "
+        "и IP-адресу (включая выданный VPN адрес).\n\n"
+    )
+    total = Counter()
+    by_mask = Counter()
+    for ev, mask in zip(events, corroboration.masks):
+        total[ev.source] += 1
+        if mask:
+            by_mask[ev.source, mask] += 1
+    by_other = Counter()
+    for (src, mask), count in by_mask.items():
+        by_other[src, None] += count
+        for other in corroboration.sources_of(mask):
+            by_other[src, other] += count
+    sources = corroboration.sources
+    f.write("| Источник | Событий | Подтверждено | " + " | ".join(f"в т.ч. {s}" for s in sources) + " |\n")
+    f.write("|----------|---------|--------------|" + "|".join("---" for _ in sources) + "|\n")
+    for src in sorted(total):
+        cells = " | ".join(str(by_other[src, other]) if other != src else "—" for other in sources)
+        f.write(f"| {src} | {total[src]} | {by_other[src, None]} | {cells} |\n")
+    f.write(f"\nСессий с подтверждёнными событиями: {len(corroboration.session_ids(events))}.\n\n")
+
+
+# Графики строятся как matplotlib.figure.Figure без pyplot: окно не блокируется,
+# а сам matplotlib импортируется только при первом построении графика.
+
+def _new_figure(figsize=(6.4, 4.0)):
+    from matplotlib.figure import Figure
+    return Figure(figsize=figsize, tight_layout=True)
+
+
+def plot_class_distribution(aggregates: EventAggregates):
     # График распределения событий по классам
-    stats = compute_class_stats(events)
+    stats = aggregates.class_counts
     if not stats:
-        return
+        return None
     classes = sorted(stats.keys())
     values = [stats[c] for c in classes]
-    plt.figure()
-    plt.bar(classes, values)
-    plt.xlabel("Класс значимости")
-    plt.ylabel("Количество событий")
-    plt.title("Распределение событий по классам значимости")
-    plt.tight_layout()
-    plt.show()
-
-def plot_source_distribution(events: List[LogEvent]) -> None:
+    fig = _new_figure()
+    ax = fig.add_subplot()
+    ax.bar(classes, values)
+    ax.set_xlabel("Класс значимости")
+    ax.set_ylabel("Количество событий")
+    ax.set_title("Распределение событий по классам значимости")
+    return fig
+
+
+def plot_source_distribution(aggregates: EventAggregates):
     # График распределения событий по источникам логов
-    stats = compute_source_stats(events)
+    stats = aggregates.source_counts
     if not stats:
-        return
+        return None
     sources = sorted(stats.keys())
     values = [stats[s] for s in sources]
-    plt.figure()
-    plt.bar(sources, values)
-    plt.xlabel("Источник логов")
-    plt.ylabel("Количество событий")
-    plt.title("Распределение событий по источникам")
-    plt.tight_layout()
-    plt.show()
+    fig = _new_figure()
+    ax = fig.add_subplot()
+    ax.bar(sources, values)
+    ax.set_xlabel("Источник логов")
+    ax.set_ylabel("Количество событий")
+    ax.set_title("Распределение событий по источникам")
+    return fig
+
+
+def plot_class_timeline(aggregates: EventAggregates, max_points: int = 1000):
+    # Таймлайн «событий в минуту» по классам, прореженный до max_points точек
+    starts, series, step = timeline_by_class(aggregates, max_points)
+    if not starts:
+        return None
+    fig = _new_figure(figsize=(9.0, 4.0))
+    ax = fig.add_subplot()
+    for cls, values in series.items():
+        if step > 1:
+            values = [v / step for v in values]
+        ax.step(starts, values, where="post", label=f"Класс {cls}")
+    ax.set_xlabel("Время")
+    ax.set_ylabel("Событий в минуту")
+    title = "Интенсивность событий по классам"
+    if step > 1:
+        title += f" (усреднение по {step} мин.)"
+    ax.set_title(title)
+    ax.legend()
+    fig.autofmt_xdate()
+    return fig
@@ -0,0 +1,324 @@
+import re
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple, TYPE_CHECKING
+from models import LogEvent
+from config_cache import ConfigCache
+
+if TYPE_CHECKING:
+    from config_manager import Config
+
+# Декларативные правила классификации.
+#
+# Каждое правило в rules.json — словарь вида:
+#   {
+#     "code": "VPN_ADMIN",                  # код причины (обязателен)
+#     "reason": "вход администратора по VPN",  # текст для пояснения (по умолчанию — code)
+#     "weight": 2,                          # баллы (могут быть отрицательными)
+#     "when": {                             # все условия объединяются по И
+#       "source": "vpn" | ["web", "proxy"],
+#       "event_type": "AUTH_SUCCESS" | [...],
+#       "has": ["user", "ip", "time"],
+#       "missing": ["time"],
+#       "details": {"status": "401", "method": ["POST", "PUT"]},
+#       "url_regex": "^/admin/"
+#     }
+#   }
+#
+# Правила компилируются один раз в Python-функции, специализированные по
+# источнику: для каждого источника остаются только применимые к нему правила,
+# константы подставляются напрямую, а множества и регулярные выражения
+# заранее собираются в глобальном пространстве имён сгенерированной функции.
+
+# (событие[, бонус к баллам, пояснение к бонусу]) -> None; класс и пояснение пишутся в событие
+RuleFunc = Callable[..., None]
+# оценка без изменения события: (событие, тип события[, бонус]) -> класс
+GradeFunc = Callable[..., str]
+
+PRESENCE_EXPR = {
+    "user": "ev.user",
+    "ip": "ev.ip",
+    "time": "ev.timestamp is not None",
+}
+
+KNOWN_CONDITIONS = ("source", "event_type", "has", "missing", "details", "url_regex")
+
+NO_DATA_REASON = "недостаточно данных для уверенной юридической оценки"
+
+AUTH_EVENT_TYPES = ["AUTH_SUCCESS", "AUTH_FAILURE", "AUTH_ATTEMPT"]
+SENSITIVE_EVENT_TYPES = ["ACCESS_SENSITIVE", "FILE_TRANSFER", "CONFIG_CHANGE"]
+
+
+def builtin_rules(cfg: "Config") -> List[Dict[str, Any]]:
+    # Базовые правила, веса которых берутся из ScoringWeights.
+    w = cfg.scoring
+    return [
+        {"code": "HAS_USER", "weight": w.weight_user,
+         "reason": "есть учётная запись пользователя",
+         "when": {"has": ["user"]}},
+        {"code": "HAS_IP", "weight": w.weight_ip,
+         "reason": "записан IP-адрес клиента",
+         "when": {"has": ["ip"]}},
+        {"code": "VPN_SOURCE", "weight": w.weight_vpn_source,
+         "reason": "событие на VPN-сервере (обычно связка учётка-IP более надёжна)",
+         "when": {"source": "vpn"}},
+        {"code": "AUTH_EVENT", "weight": w.weight_auth_event,
+         "reason": "аутентификация / попытка входа",
+         "when": {"event_type": AUTH_EVENT_TYPES}},
+        {"code": "SENSITIVE_EVENT", "weight": w.weight_sensitive_event,
+         "reason": "доступ к чувствительному ресурсу или изменение конфигурации",
+         "when": {"event_type": SENSITIVE_EVENT_TYPES}},
+        {"code": "NO_TIME", "weight": w.penalty_no_time,
+         "reason": "не удалось однозначно определить время события",
+         "when": {"missing": ["time"]}},
+    ]
+
+
+def _as_list(value: Any) -> List[Any]:
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return list(value)
+    return [value]
+
+
+@dataclass
+class _Rule:
+    code: str
+    reason: str
+    weight: int
+    sources: Optional[frozenset]  # None — любой источник
+    when: Dict[str, Any]
+
+
+def _parse_rule(raw: Any) -> _Rule:
+    if not isinstance(raw, dict):
+        raise ValueError("правило должно быть объектом JSON")
+    code = raw.get("code")
+    if not code or not isinstance(code, str):
+        raise ValueError("не задан код правила (code)")
+    weight = raw.get("weight", 0)
+    if not isinstance(weight, int) or isinstance(weight, bool):
+        raise ValueError(f"{code}: вес (weight) должен быть целым числом")
+    when = raw.get("when", {})
+    if not isinstance(when, dict):
+        raise ValueError(f"{code}: условия (when) должны быть объектом JSON")
+    unknown = set(when) - set(KNOWN_CONDITIONS)
+    if unknown:
+        raise ValueError(f"{code}: неизвестные условия: {', '.join(sorted(unknown))}")
+    for key in ("has", "missing"):
+        bad = [x for x in _as_list(when.get(key, [])) if x not in PRESENCE_EXPR]
+        if bad:
+            raise ValueError(f"{code}: в '{key}' допустимы только user, ip, time")
+    if "details" in when and not isinstance(when["details"], dict):
+        raise ValueError(f"{code}: условие details должно быть объектом JSON")
+    if "url_regex" in when:
+        try:
+            re.compile(when["url_regex"])
+        except (re.error, TypeError) as e:
+            raise ValueError(f"{code}: некорректное регулярное выражение: {e}")
+    if "source" in when:
+        sources = _as_list(when["source"])
+        if not sources or not all(isinstance(src, str) and src for src in sources):
+            raise ValueError(f"{code}: условие source — имя источника или список имён")
+        sources = frozenset(sources)
+    else:
+        sources = None
+    return _Rule(
+        code=code,
+        reason=str(raw.get("reason") or code),
+        weight=weight,
+        sources=sources,
+        when=when,
+    )
+
+
+def _rule_conditions(rule: _Rule, consts: Dict[str, Any]) -> List[str]:
+    # Условия правила в виде Python-выражений (источник уже учтён специализацией).
+    def const(value: Any) -> str:
+        name = f"_k{len(consts)}"
+        consts[name] = value
+        return name
+
+    conds: List[str] = []
+    when = rule.when
+    for what in _as_list(when.get("has", [])):
+        conds.append(PRESENCE_EXPR[what])
+    for what in _as_list(when.get("missing", [])):
+        conds.append(f"not ({PRESENCE_EXPR[what]})")
+    if "event_type" in when:
+        types = _as_list(when["event_type"])
+        if len(types) == 1:
+            conds.append(f"et == {str(types[0])!r}")
+        else:
+            conds.append(f"et in {const(frozenset(str(t) for t in types))}")
+    for fname, expected in when.get("details", {}).items():
+        values = _as_list(expected)
+        getter = f"d.get({str(fname)!r})"
+        if len(values) == 1:
+            conds.append(f"{getter} == {str(values[0])!r}")
+        else:
+            conds.append(f"{getter} in {const(frozenset(str(v) for v in values))}")
+    if "url_regex" in when:
+        search = const(re.compile(when["url_regex"]).search)
+        conds.append(f"{search}(d.get('url') or '') is not None")
+    return conds
+
+
+def _generate(rules: List[_Rule], thresholds: List[tuple], name: str) -> RuleFunc:
+    consts: Dict[str, Any] = {}
+    lines = [
+        f"def {name}(ev, bonus=0, bonus_reason=None):",
+        "    et = ev.event_type",
+        "    d = ev.details",
+        "    score = bonus",
+        "    reasons = []",
+    ]
+    for rule in rules:
+        conds = _rule_conditions(rule, consts)
+        body = [f"score += {rule.weight}"] if rule.weight else []
+        body.append(f"reasons.append({rule.reason!r})")
+        if conds:
+            lines.append(f"    if {' and '.join(conds)}:")
+            lines.extend(f"        {stmt}" for stmt in body)
+        else:
+            lines.extend(f"    {stmt}" for stmt in body)
+    # бонус вне правил (подтверждение другими источниками, см. corroboration)
+    lines.append("    if bonus_reason:")
+    lines.append("        reasons.append(bonus_reason)")
+
+    keyword = "if"
+    for cls, limit in thresholds:
+        lines.append(f"    {keyword} score >= {limit}:")
+        lines.append(f"        ev.evidential_class = {cls!r}")
+        keyword = "elif"
+    if thresholds:
+        lines.append("    else:")
+        indent = "        "
+    else:
+        indent = "    "
+    lines.append(f"{indent}ev.evidential_class = 'D'")
+    lines.append(f"{indent}if not reasons:")
+    lines.append(f"{indent}    reasons.append({NO_DATA_REASON!r})")
+    lines.append("    ev.notes = '; '.join(reasons)")
+
+    namespace = dict(consts)
+    exec(compile("\n".join(lines), f"<rules:{name}>", "exec"), namespace)
+    return namespace[name]
+
+
+def _generate_grader(rules: List[_Rule], thresholds: List[tuple], name: str) -> GradeFunc:
+    # Вариант _generate для сравнения конфигураций: тип события передаётся
+    # аргументом, событие не изменяется, пояснения не собираются.
+    consts: Dict[str, Any] = {}
+    lines = [
+        f"def {name}(ev, et, bonus=0):",
+        "    d = ev.details",
+        "    score = bonus",
+    ]
+    for rule in rules:
+        if not rule.weight:
+            continue
+        conds = _rule_conditions(rule, consts)
+        if conds:
+            lines.append(f"    if {' and '.join(conds)}:")
+            lines.append(f"        score += {rule.weight}")
+        else:
+            lines.append(f"    score += {rule.weight}")
+    for cls, limit in thresholds:
+        lines.append(f"    if score >= {limit}:")
+        lines.append(f"        return {cls!r}")
+    lines.append("    return 'D'")
+
+    namespace = dict(consts)
+    exec(compile("\n".join(lines), f"<grade:{name}>", "exec"), namespace)
+    grader = namespace[name]
+    # без условий на details результат зависит только от источника, типа
+    # и наличия user/ip/времени — это позволяет кэшировать оценку
+    grader.uses_details = any(
+        ("details" in r.when or "url_regex" in r.when) for r in rules if r.weight
+    )
+    return grader
+
+
+@dataclass
+class CompiledRules:
+    # Скомпилированный набор правил: функция классификации на каждый источник.
+    by_source: Dict[str, RuleFunc]
+    default: RuleFunc
+    rule_count: int = 0
+    errors: List[str] = field(default_factory=list)
+
+    def classify(self, ev: LogEvent) -> None:
+        self.by_source.get(ev.source, self.default)(ev)
+
+
+def _prepare(cfg: "Config") -> Tuple[List[_Rule], List[tuple], List[str], List[str]]:
+    # Разбор правил и порогов конфигурации: (правила, пороги, ошибки, источники).
+    raw_rules: List[Any] = []
+    if cfg.use_builtin_rules:
+        raw_rules.extend(builtin_rules(cfg))
+    raw_rules.extend(cfg.rules)
+
+    rules: List[_Rule] = []
+    errors: List[str] = []
+    for idx, raw in enumerate(raw_rules, start=1):
+        try:
+            rules.append(_parse_rule(raw))
+        except ValueError as e:
+            errors.append(f"правило №{idx}: {e}")
+
+    # классы A/B/C по убыванию порога; всё, что ниже — класс D
+    thresholds = []
+    for cls, limit in cfg.class_thresholds.items():
+        if cls == "D":
+            continue
+        if not isinstance(limit, int) or isinstance(limit, bool):
+            errors.append(f"порог класса {cls}: ожидается целое число")
+            continue
+        thresholds.append((cls, limit))
+    thresholds.sort(key=lambda item: item[1], reverse=True)
+
+    known_sources = {"web", "proxy", "vpn"}
+    for r in rules:
+        if r.sources:
+            known_sources |= r.sources
+    return rules, thresholds, errors, sorted(known_sources)
+
+
+def compile_rules(cfg: "Config") -> CompiledRules:
+    # Компиляция базовых и пользовательских правил из конфигурации.
+    rules, thresholds, errors, sources = _prepare(cfg)
+    by_source: Dict[str, RuleFunc] = {}
+    for src in sources:
+        applicable = [r for r in rules if r.sources is None or src in r.sources]
+        fname = "classify_" + re.sub(r"\W", "_", src)
+        by_source[src] = _generate(applicable, thresholds, fname)
+    default = _generate([r for r in rules if r.sources is None], thresholds, "classify_other")
+    return CompiledRules(by_source=by_source, default=default, rule_count=len(rules), errors=errors)
+
+
+def compile_graders(cfg: "Config") -> Tuple[Dict[str, GradeFunc], GradeFunc]:
+    # Функции оценки класса без изменения событий (для сравнения конфигураций).
+    rules, thresholds, _errors, sources = _prepare(cfg)
+    by_source: Dict[str, GradeFunc] = {}
+    for src in sources:
+        applicable = [r for r in rules if r.sources is None or src in r.sources]
+        by_source[src] = _generate_grader(applicable, thresholds, "grade_" + re.sub(r"\W", "_", src))
+    default = _generate_grader([r for r in rules if r.sources is None], thresholds, "grade_other")
+    return by_source, default
+
+
+# скомпилированные правила по объекту конфигурации (см. config_cache)
+_COMPILED: ConfigCache[CompiledRules] = ConfigCache()
+
+
+def compiled_rules(cfg: "Config") -> CompiledRules:
+    # Скомпилированные правила конфигурации (компиляция при первом обращении).
+    compiled = _COMPILED.get(cfg)
+    if compiled is None:
+        compiled = _COMPILED.set(cfg, compile_rules(cfg))
+    return compiled
+
+
+def recompile_rules(cfg: "Config") -> CompiledRules:
+    # Перекомпилировать правила после изменения конфигурации.
+    _COMPILED.discard(cfg)
+    return compiled_rules(cfg)
@@ -0,0 +1,420 @@
+import hashlib
+import heapq
+import math
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from models import LogEvent
+from rule_engine import SENSITIVE_EVENT_TYPES
+from timeutil import US_PER_MINUTE, from_micros
+
+# Вероятностные сводки (sketches) для объёмов, где точные множества и
+# счётчики по всем событиям не помещаются в память.
+#
+# - HyperLogLog: число различных пользователей и IP в ячейке
+#   (источник, тип события, класс, час). Ячейки сливаются взятием максимума
+#   регистров, поэтому любой срез (по часу, по классу, «все web за сутки»)
+#   считается объединением ячеек без повторного прохода. Пока ячейка мала,
+#   регистры хранятся разреженно (словарь), затем — bytearray.
+# - Count-Min: частоты значений с ошибкой не больше e/width·N с вероятностью
+#   1 - e^-depth.
+# - Space-Saving: кандидаты в top-K (capacity счётчиков); вместе с Count-Min
+#   дают интервал [нижняя граница, верхняя граница] для каждого лидера.
+#
+# Все сводки сливаются (файлы, узлы распределённого разбора) и используют
+# один детерминированный хэш (blake2b), а не hash() с солью процесса.
+
+HLL_PRECISION = 11          # 2048 регистров, стандартная ошибка ~2.3%
+CMS_WIDTH = 4096
+CMS_DEPTH = 4
+TOPK_CAPACITY = 1024
+HASH_CACHE_SIZE = 1 << 18
+FLUSH_EVERY = 1 << 16
+Z_95 = 1.96
+
+US_PER_HOUR = 60 * US_PER_MINUTE
+
+# потоки частых значений: имя -> (поле события, только чувствительные события)
+HEAVY_STREAMS: Dict[str, Tuple[str, bool]] = {
+    "users": ("user", False),
+    "ips": ("ip", False),
+    "sensitive_users": ("user", True),
+    "sensitive_ips": ("ip", True),
+}
+
+_SENSITIVE = frozenset(SENSITIVE_EVENT_TYPES)
+_HASHES: Dict[str, int] = {}
+
+
+def stable_hash(value: str) -> int:
+    # 64-битный хэш, одинаковый во всех процессах; значения в логах повторяются — кэш.
+    h = _HASHES.get(value)
+    if h is None:
+        h = int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "little")
+        if len(_HASHES) >= HASH_CACHE_SIZE:
+            _HASHES.clear()
+        _HASHES[value] = h
+    return h
+
+
+@dataclass
+class SketchEstimate:
+    value: float
+    low: float
+    high: float
+
+
+class HyperLogLog:
+    def __init__(self, precision: int = HLL_PRECISION):
+        self.p = precision
+        self.m = 1 << precision
+        self.sparse: Optional[Dict[int, int]] = {}
+        self.registers: Optional[bytearray] = None
+
+    def add_hash(self, h: int) -> None:
+        p = self.p
+        idx = h >> (64 - p)
+        rank = 64 - p - (h & ((1 << (64 - p)) - 1)).bit_length() + 1  # ведущие нули остатка + 1
+        self._set(idx, rank)
+
+    def _set(self, idx: int, rank: int) -> None:
+        sparse = self.sparse
+        if sparse is not None:
+            if sparse.get(idx, 0) < rank:
+                sparse[idx] = rank
+                if len(sparse) > self.m >> 3:
+                    self._densify()
+        elif self.registers[idx] < rank:
+            self.registers[idx] = rank
+
+    def _densify(self) -> None:
+        regs = bytearray(self.m)
+        for idx, rank in self.sparse.items():
+            regs[idx] = rank
+        self.registers = regs
+        self.sparse = None
+
+    def merge(self, other: "HyperLogLog") -> None:
+        if other.p != self.p:
+            raise ValueError("HyperLogLog разной точности не сливаются")
+        if other.sparse is not None:
+            for idx, rank in other.sparse.items():
+                self._set(idx, rank)
+            return
+        if self.sparse is not None:
+            self._densify()
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def copy(self) -> "HyperLogLog":
+        h = HyperLogLog(self.p)
+        h.sparse = dict(self.sparse) if self.sparse is not None else None
+        h.registers = bytearray(self.registers) if self.registers is not None else None
+        return h
+
+    @property
+    def relative_error(self) -> float:
+        return 1.04 / math.sqrt(self.m)
+
+    def count(self) -> float:
+        m = self.m
+        if self.sparse is not None:
+            values = self.sparse.values()
+            zeros = m - len(self.sparse)
+        else:
+            values = [r for r in self.registers if r]
+            zeros = m - len(values)
+        harmonic = zeros + sum(2.0 ** -r for r in values)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / harmonic
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)  # линейный счёт для малых множеств
+        return estimate
+
+    def estimate(self) -> SketchEstimate:
+        value = self.count()
+        spread = Z_95 * self.relative_error * value
+        return SketchEstimate(value, max(0.0, value - spread), value + spread)
+
+
+class CountMinSketch:
+    def __init__(self, width: int = CMS_WIDTH, depth: int = CMS_DEPTH):
+        self.width = width
+        self.depth = depth
+        self.rows: List[List[int]] = [[0] * width for _ in range(depth)]
+        self.total = 0
+
+    def indices(self, h: int) -> Tuple[int, ...]:
+        # двойное хэширование: h1 + i·h2 (mod width)
+        h1, h2 = h & 0xFFFFFFFF, (h >> 32) | 1
+        width = self.width
+        return tuple((h1 + i * h2) % width for i in range(self.depth))
+
+    def add(self, indices: Tuple[int, ...], count: int = 1) -> None:
+        for row, idx in zip(self.rows, indices):
+            row[idx] += count
+        self.total += count
+
+    def estimate(self, indices: Tuple[int, ...]) -> int:
+        return min(row[idx] for row, idx in zip(self.rows, indices))
+
+    @property
+    def error_bound(self) -> float:
+        # переоценка не больше этой величины с вероятностью confidence
+        return math.e / self.width * self.total
+
+    @property
+    def confidence(self) -> float:
+        return 1 - math.exp(-self.depth)
+
+    def merge(self, other: "CountMinSketch") -> None:
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError("Count-Min разного размера не сливаются")
+        self.rows = [[a + b for a, b in zip(mine, theirs)] for mine, theirs in zip(self.rows, other.rows)]
+        self.total += other.total
+
+
+class SpaceSaving:
+    # Top-K: не более capacity счётчиков; вытесняется минимальный, новое значение
+    # наследует его счёт как ошибку (count - error — нижняя граница частоты).
+
+    def __init__(self, capacity: int = TOPK_CAPACITY):
+        self.capacity = capacity
+        self.counts: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        # (счёт на момент записи, значение); счёт мог с тех пор вырасти — проверяется при вытеснении
+        self._heap: List[Tuple[int, str]] = []
+
+    def add(self, item: str, count: int = 1) -> None:
+        counts = self.counts
+        current = counts.get(item)
+        if current is not None:
+            counts[item] = current + count
+            return
+        if len(counts) < self.capacity:
+            counts[item] = count
+            self.errors[item] = 0
+            heapq.heappush(self._heap, (count, item))
+            return
+        floor, victim = self._pop_min()
+        del counts[victim]
+        del self.errors[victim]
+        counts[item] = floor + count
+        self.errors[item] = floor
+        heapq.heappush(self._heap, (floor + count, item))
+
+    def _pop_min(self) -> Tuple[int, str]:
+        heap, counts = self._heap, self.counts
+        while True:
+            stored, item = heapq.heappop(heap)
+            current = counts[item]
+            if current == stored:
+                return stored, item
+            heapq.heappush(heap, (current, item))
+
+    @property
+    def floor(self) -> int:
+        # частота любого значения вне списка не больше минимального счёта
+        if len(self.counts) < self.capacity:
+            return 0
+        return min(self.counts.values())
+
+    def merge(self, other: "SpaceSaving") -> None:
+        # слияние сводок: отсутствующему в одной из них значению добавляется её минимум
+        mine, theirs = self.floor, other.floor
+        counts: Dict[str, int] = {}
+        errors: Dict[str, int] = {}
+        for item in set(self.counts) | set(other.counts):
+            a = self.counts.get(item)
+            b = other.counts.get(item)
+            counts[item] = (a if a is not None else mine) + (b if b is not None else theirs)
+            errors[item] = (self.errors[item] if a is not None else mine) + (
+                other.errors[item] if b is not None else theirs)
+        keep = sorted(counts, key=counts.get, reverse=True)[:self.capacity]
+        self.counts = {item: counts[item] for item in keep}
+        self.errors = {item: errors[item] for item in keep}
+        self._heap = [(c, item) for item, c in self.counts.items()]
+        heapq.heapify(self._heap)
+
+    def top(self, n: int) -> List[Tuple[str, int, int]]:
+        # [(значение, верхняя граница, ошибка)]
+        items = sorted(self.counts.items(), key=lambda kv: (-kv[1], kv[0]))[:n]
+        return [(item, count, self.errors[item]) for item, count in items]
+
+
+class HeavyHitters:
+    # Count-Min + Space-Saving для одного потока значений.
+
+    def __init__(self, width: int = CMS_WIDTH, depth: int = CMS_DEPTH, capacity: int = TOPK_CAPACITY):
+        self.cms = CountMinSketch(width, depth)
+        self.topk = SpaceSaving(capacity)
+
+    def add(self, item: str, count: int = 1) -> None:
+        self.cms.add(self.cms.indices(stable_hash(item)), count)
+        self.topk.add(item, count)
+
+    def merge(self, other: "HeavyHitters") -> None:
+        self.cms.merge(other.cms)
+        self.topk.merge(other.topk)
+
+    def frequency(self, item: str) -> SketchEstimate:
+        # Оценка частоты: верхняя граница — Count-Min (и Space-Saving, если значение в списке),
+        # нижняя — Space-Saving (count - error) или ноль.
+        upper = self.cms.estimate(self.cms.indices(stable_hash(item)))
+        lower = 0
+        if item in self.topk.counts:
+            upper = min(upper, self.topk.counts[item])
+            lower = self.topk.counts[item] - self.topk.errors[item]
+        return SketchEstimate(upper, lower, upper)
+
+    def top(self, n: int) -> List[Tuple[str, SketchEstimate]]:
+        # кандидаты — все счётчики Space-Saving, порядок — по уточнённой частоте
+        result = [(item, self.frequency(item)) for item in self.topk.counts]
+        result.sort(key=lambda pair: (-pair[1].value, pair[0]))
+        return result[:n]
+
+
+Cell = Tuple[str, str, str, Optional[int]]   # (источник, тип события, класс, час от эпохи или None)
+
+
+def _match(value, wanted) -> bool:
+    # None — любое значение, набор — одно из значений набора
+    if wanted is None:
+        return True
+    if isinstance(wanted, (tuple, list, set, frozenset)):
+        return value in wanted
+    return value == wanted
+
+
+class EventSketches:
+    # Сводки по потоку классифицированных событий.
+    #
+    # add() только копит значения: множества по ячейкам и счётчики по потокам
+    # частых значений (повторы в логах схлопываются); в сводки они переносятся
+    # пачкой каждые FLUSH_EVERY событий и перед любым запросом или слиянием.
+
+    def __init__(self, precision: int = HLL_PRECISION, width: int = CMS_WIDTH,
+                 depth: int = CMS_DEPTH, capacity: int = TOPK_CAPACITY):
+        self.precision = precision
+        self.total = 0
+        # ячейка -> (HLL пользователей, HLL адресов)
+        self.cells: Dict[Cell, Tuple[HyperLogLog, HyperLogLog]] = {}
+        self.heavy: Dict[str, HeavyHitters] = {
+            name: HeavyHitters(width, depth, capacity) for name in HEAVY_STREAMS
+        }
+        self._pending_cells: Dict[Cell, Tuple[set, set]] = {}
+        self._pending_heavy: Dict[str, Dict[str, int]] = {name: {} for name in HEAVY_STREAMS}
+        self._pending = 0
+
+    def __getstate__(self):
+        self.flush()
+        return dict(self.__dict__)
+
+    def add(self, ev: LogEvent) -> None:
+        self.total += 1
+        ts = ev.ts_us
+        cell_key = (ev.source, ev.event_type, ev.evidential_class, ts // US_PER_HOUR if ts is not None else None)
+        cell = self._pending_cells.get(cell_key)
+        if cell is None:
+            cell = self._pending_cells[cell_key] = (set(), set())
+        user, ip = ev.user, ev.ip
+        heavy = self._pending_heavy
+        if user:
+            cell[0].add(user)
+            counts = heavy["users"]
+            counts[user] = counts.get(user, 0) + 1
+        if ip:
+            cell[1].add(ip)
+            counts = heavy["ips"]
+            counts[ip] = counts.get(ip, 0) + 1
+        if ev.event_type in _SENSITIVE:
+            if user:
+                counts = heavy["sensitive_users"]
+                counts[user] = counts.get(user, 0) + 1
+            if ip:
+                counts = heavy["sensitive_ips"]
+                counts[ip] = counts.get(ip, 0) + 1
+        self._pending += 1
+        if self._pending >= FLUSH_EVERY:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._pending:
+            return
+        p = self.precision
+        low_bits = (1 << (64 - p)) - 1
+        codes: Dict[str, Tuple[int, int]] = {}
+        for key, values in self._pending_cells.items():
+            cell = self.cells.get(key)
+            if cell is None:
+                cell = self.cells[key] = (HyperLogLog(p), HyperLogLog(p))
+            for hll, pending in zip(cell, values):
+                for value in pending:
+                    code = codes.get(value)
+                    if code is None:
+                        h = stable_hash(value)
+                        code = codes[value] = (h >> (64 - p), 64 - p - (h & low_bits).bit_length() + 1)
+                    hll._set(*code)
+        # сначала частые значения: Space-Saving точнее, если крупные счёты приходят первыми
+        for name, counts in self._pending_heavy.items():
+            hh = self.heavy[name]
+            for item, count in sorted(counts.items(), key=lambda kv: -kv[1]):
+                hh.add(item, count)
+        self._pending_cells = {}
+        self._pending_heavy = {name: {} for name in HEAVY_STREAMS}
+        self._pending = 0
+
+    def merge(self, other: "EventSketches") -> None:
+        self.flush()
+        other.flush()
+        self.total += other.total
+        for key, (users, ips) in other.cells.items():
+            cell = self.cells.get(key)
+            if cell is None:
+                self.cells[key] = (users.copy(), ips.copy())
+            else:
+                cell[0].merge(users)
+                cell[1].merge(ips)
+        for name, hh in other.heavy.items():
+            self.heavy[name].merge(hh)
+
+    def _union(self, kind: str, source=None, event_type=None, cls=None, hour=None) -> HyperLogLog:
+        self.flush()
+        slot = 0 if kind == "users" else 1
+        union = HyperLogLog(self.precision)
+        for (c_source, c_type, c_cls, c_hour), cell in self.cells.items():
+            if (_match(c_source, source) and _match(c_type, event_type)
+                    and _match(c_cls, cls) and _match(c_hour, hour)):
+                union.merge(cell[slot])
+        return union
+
+    def distinct(self, kind: str, source=None, event_type=None, cls=None, hour=None) -> SketchEstimate:
+        # Число различных пользователей (kind='users') или IP ('ips') в срезе;
+        # фильтр — значение, набор значений или None (любое).
+        return self._union(kind, source, event_type, cls, hour).estimate()
+
+    def distinct_by(self, kind: str, dimension: str, **filters) -> Dict[object, SketchEstimate]:
+        # Оценки по значениям одного измерения: 'source', 'event_type', 'class' или 'hour'.
+        self.flush()
+        pos = ("source", "event_type", "class", "hour").index(dimension)
+        wanted = filters.get("cls" if dimension == "class" else dimension)
+        values = sorted({key[pos] for key in self.cells if key[pos] is not None and _match(key[pos], wanted)})
+        arg = "cls" if dimension == "class" else dimension
+        return {value: self.distinct(kind, **dict(filters, **{arg: value})) for value in values}
+
+    def top(self, stream: str, n: int = 20) -> List[Tuple[str, SketchEstimate]]:
+        self.flush()
+        return self.heavy[stream].top(n)
+
+    @staticmethod
+    def hour_start(hour: int) -> datetime:
+        return from_micros(hour * US_PER_HOUR)
+
+    @property
+    def relative_error(self) -> float:
+        return 1.04 / math.sqrt(1 << self.precision)
+
+    def frequency_error(self, stream: str) -> Tuple[float, float]:
+        # (граница переоценки частоты, вероятность, с которой она выполняется)
+        self.flush()
+        cms = self.heavy[stream].cms
+        return cms.error_bound, cms.confidence
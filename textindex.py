@@ -0,0 +1,161 @@
+import re
+import sys
+from array import array
+from itertools import accumulate
+from typing import Dict, Iterable, List, Pattern, Set
+
+try:  # Python 3.11+
+    from re import _constants as sre_constants, _parser as sre_parse
+except ImportError:
+    import sre_constants
+    import sre_parse
+
+# Триграммный индекс для полнотекстового поиска по исходным строкам событий.
+#
+# Индексируются блоки хранилища строк (rawstore), а не отдельные строки: когда
+# блок заполнен, берётся множество триграмм его байтов (в нижнем регистре ASCII)
+# и номер блока дописывается в список каждой триграммы. Списки хранятся
+# сжатыми: разности соседних номеров блоков в varint (почти всегда по байту).
+# Поиск пересекает списки триграмм обязательных литералов запроса и проверяет
+# только блоки-кандидаты: подстрока — bytes.find по блоку, регулярное
+# выражение — по строкам блока. Строки короче 3 байт индекс не сужает.
+#
+# Подстрока ищется без учёта регистра ASCII. Из регулярного выражения берутся
+# литералы, которые обязаны встретиться в любом совпадении; при IGNORECASE
+# символы, совпадающие с не-ASCII буквами (i, k, s, кириллица и т.п.),
+# разрывают литерал — иначе индекс мог бы отсечь подходящий блок.
+
+TRIGRAM_MASK = 0xFFFFFF
+# ASCII-буквы, которым при re.IGNORECASE соответствуют и не-ASCII символы (İ ı K ſ)
+FOLD_UNSAFE = "iks"
+
+_REPEATS = tuple(
+    getattr(sre_constants, name)
+    for name in ("MAX_REPEAT", "MIN_REPEAT", "POSSESSIVE_REPEAT")
+    if hasattr(sre_constants, name)
+)
+
+
+def block_trigrams(data: bytes) -> Set[int]:
+    # Триграммы блока как числа (3 байта, little-endian). Байты читаются
+    # четвёрками со сдвигом 0..3 — все 4-граммы собираются в set на уровне C,
+    # каждая даёт две триграммы.
+    n = len(data)
+    if n < 4:
+        return {int.from_bytes(data[i:i + 3], "little") for i in range(n - 2)}
+    quads: Set[int] = set()
+    for shift in range(4):
+        words = array("I", data[shift:shift + (n - shift) // 4 * 4])
+        if sys.byteorder == "big":
+            words.byteswap()
+        quads.update(words)
+    result = {q & TRIGRAM_MASK for q in quads}
+    result.update(q >> 8 for q in quads)
+    return result
+
+
+def literal_trigrams(literal: bytes) -> Set[int]:
+    return {int.from_bytes(literal[i:i + 3], "little") for i in range(len(literal) - 2)}
+
+
+def required_literals(pattern: Pattern) -> List[str]:
+    # Литералы (подряд идущие символы), которые есть в любом совпадении pattern.
+    parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+    runs: List[str] = []
+    _collect(parsed, bool(parsed.state.flags & re.IGNORECASE), runs)
+    return runs
+
+
+def _collect(items, icase: bool, runs: List[str]) -> None:
+    run: List[str] = []
+
+    def close():
+        if run:
+            runs.append("".join(run))
+            run.clear()
+
+    for op, av in items:
+        if op is sre_constants.LITERAL:
+            ch = chr(av)
+            if icase and (av > 0x7F or ch.lower() in FOLD_UNSAFE):
+                close()
+            else:
+                run.append(ch)
+        elif op is sre_constants.AT:
+            continue  # ^, $, \b не занимают символов
+        elif op is sre_constants.SUBPATTERN:
+            close()
+            _group, add_flags, del_flags, sub = av
+            _collect(sub, (icase or bool(add_flags & re.IGNORECASE)) and not del_flags & re.IGNORECASE, runs)
+        elif op in _REPEATS:
+            close()
+            low, _high, sub = av
+            if low >= 1:
+                _collect(sub, icase, runs)
+        else:  # классы символов, альтернативы, ссылки на группы, проверки
+            close()
+    close()
+
+
+def _decode(postings: bytes) -> List[int]:
+    # Номера блоков из списка разностей; первая разность — от -1.
+    if max(postings) < 0x80:
+        return list(accumulate(postings, initial=-1))[1:]
+    blocks: List[int] = []
+    last, value, shift = -1, 0, 0
+    for byte in postings:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        last += value
+        blocks.append(last)
+        value = shift = 0
+    return blocks
+
+
+class TrigramIndex:
+    def __init__(self):
+        self.postings: Dict[int, bytearray] = {}
+        self._last: Dict[int, int] = {}   # последний записанный блок каждой триграммы
+
+    def add_block(self, n: int, data: bytes) -> None:
+        # Блоки добавляются по возрастанию номеров.
+        postings, last = self.postings, self._last
+        for t in block_trigrams(data.lower()):
+            post = postings.get(t)
+            if post is None:
+                post = postings[t] = bytearray()
+                delta = n + 1
+            else:
+                delta = n - last[t]
+            last[t] = n
+            while delta >= 0x80:
+                post.append(delta & 0x7F | 0x80)
+                delta >>= 7
+            post.append(delta)
+
+    def candidates(self, literals: Iterable[bytes], blocks: int) -> List[int]:
+        # Блоки, где есть все триграммы литералов (литералы — в нижнем регистре ASCII).
+        trigrams: Set[int] = set()
+        for literal in literals:
+            trigrams |= literal_trigrams(literal)
+        if not trigrams:
+            return list(range(blocks))
+        lists = []
+        for t in trigrams:
+            post = self.postings.get(t)
+            if post is None:
+                return []
+            lists.append(post)
+        lists.sort(key=len)
+        result = set(_decode(lists[0]))
+        for post in lists[1:]:
+            if not result:
+                break
+            result.intersection_update(_decode(post))
+        return sorted(result)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(map(len, self.postings.values()))
@@ -0,0 +1,171 @@
+import heapq
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Callable, Iterable, Iterator, List, Optional, Sequence, Tuple
+from models import LogEvent
+from config_manager import Config
+from dedup import LineDeduplicator
+from ingest import IngestStats, iter_log_file
+from timeutil import US_PER_SECOND
+
+# Слияние нескольких потоков событий в один, упорядоченный по времени,
+# без сбора всех событий в памяти.
+#
+# Каждый поток (файл web, proxy, vpn …) почти упорядочен по времени: время уже
+# приведено парсером к UTC (ts_us) с учётом зон и time_offsets_minutes, а
+# отдельные строки могут идти с небольшим опозданием. Поток сначала проходит через ограниченный буфер
+# переупорядочивания, затем потоки сливаются кучей: O(n log k) для k потоков.
+#
+# События без времени не имеют места в порядке и в сессии не попадают —
+# они выдаются сразу, как только прочитаны.
+
+ParserFunc = Callable[[str, Config], Optional[LogEvent]]
+
+
+@dataclass
+class ReorderStats:
+    reordered: int = 0   # событий, пришедших раньше уже буферизованных более поздних
+    late: int = 0        # событий, опоздавших больше окна: выданы вне порядка
+    max_buffered: int = 0
+
+
+def reorder_events(
+    events: Iterable[LogEvent],
+    window: timedelta = timedelta(minutes=5),
+    max_buffer: int = 100_000,
+    stats: Optional[ReorderStats] = None,
+) -> Iterator[LogEvent]:
+    # Восстановить порядок по времени в почти упорядоченном потоке. Событие
+    # задерживается, пока самое позднее прочитанное время не уйдёт от него
+    # дальше window, но в буфере не более max_buffer событий. Равные по
+    # времени события выдаются в порядке поступления.
+    if stats is None:
+        stats = ReorderStats()
+    heap: List[Tuple[int, int, LogEvent]] = []
+    push, pop = heapq.heappush, heapq.heappop
+    seq = 0
+    max_ts: Optional[int] = None
+    last_out: Optional[int] = None
+    window_us = int(window.total_seconds() * US_PER_SECOND)
+    for ev in events:
+        ts = ev.ts_us
+        if ts is None:
+            yield ev
+            continue
+        if last_out is not None and ts < last_out:
+            stats.late += 1
+            yield ev
+            continue
+        if max_ts is None or ts >= max_ts:
+            max_ts = ts
+        else:
+            stats.reordered += 1
+        push(heap, (ts, seq, ev))
+        seq += 1
+        if len(heap) > stats.max_buffered:
+            stats.max_buffered = len(heap)
+        horizon = max_ts - window_us
+        while heap and (heap[0][0] <= horizon or len(heap) > max_buffer):
+            last_out, _, out = pop(heap)
+            yield out
+    while heap:
+        yield pop(heap)[2]
+
+
+def merge_streams(streams: Sequence[Iterable[LogEvent]]) -> Iterator[LogEvent]:
+    # k-путевое слияние упорядоченных по времени потоков (события без
+    # времени проходят сразу). При равном времени раньше идёт поток с меньшим номером.
+    heap: List[Tuple[int, int, LogEvent, Iterator[LogEvent]]] = []
+    for idx, stream in enumerate(streams):
+        it = iter(stream)
+        for ev in it:
+            if ev.ts_us is None:
+                yield ev
+                continue
+            heap.append((ev.ts_us, idx, ev, it))
+            break
+    heapq.heapify(heap)
+    while heap:
+        _ts, idx, ev, it = heap[0]
+        yield ev
+        # следующее событие того же потока заменяет выданное (heapreplace дешевле pop+push)
+        for nxt in it:
+            if nxt.ts_us is None:
+                yield nxt
+                continue
+            heapq.heapreplace(heap, (nxt.ts_us, idx, nxt, it))
+            break
+        else:
+            heapq.heappop(heap)
+
+
+def merge_log_files(
+    files: Sequence[Tuple[str, ParserFunc, str]],
+    cfg: Config,
+    dedup: Optional[LineDeduplicator] = None,
+    window: timedelta = timedelta(minutes=5),
+    max_buffer: int = 100_000,
+) -> Tuple[Iterator[LogEvent], List[IngestStats], List[ReorderStats]]:
+    # Единый упорядоченный по времени поток событий из нескольких файлов.
+    # files — (путь, парсер, имя источника). Итоги чтения и переупорядочивания
+    # по файлам заполняются по мере чтения потока.
+    ingest_stats = [IngestStats() for _ in files]
+    reorder_stats = [ReorderStats() for _ in files]
+    streams = [
+        reorder_events(
+            iter_log_file(path, parser, cfg, dedup, source, ingest_stats[i]),
+            window, max_buffer, reorder_stats[i],
+        )
+        for i, (path, parser, source) in enumerate(files)
+    ]
+    return merge_streams(streams), ingest_stats, reorder_stats
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    from parsers import PARSERS, load_parser_plugins
+    from config_manager import load_config
+    from correlator import SessionCorrelator
+
+    load_parser_plugins()
+    ap = argparse.ArgumentParser(
+        description="Слияние файлов логов по времени и потоковая сборка сессий (формат=путь)"
+    )
+    ap.add_argument("files", nargs="+", metavar="FORMAT=PATH")
+    ap.add_argument("--window", type=float, default=5.0, help="окно переупорядочивания, минуты")
+    ap.add_argument("--max-buffer", type=int, default=100_000)
+    ap.add_argument("--sessions-out", help="файл JSONL для завершённых сессий")
+    args = ap.parse_args()
+
+    cfg = load_config()
+    files = []
+    for item in args.files:
+        fmt, _, path = item.partition("=")
+        if fmt not in PARSERS or not path:
+            ap.error(f"ожидается ФОРМАТ=ПУТЬ, форматы: {', '.join(sorted(PARSERS))}")
+        files.append((path, PARSERS[fmt], fmt))
+
+    from ingest_service import JsonlSessionSink
+    sink = JsonlSessionSink(args.sessions_out) if args.sessions_out else (lambda sess: None)
+    correlator = SessionCorrelator(cfg, sink=sink)
+    stream, ingest_stats, reorder_stats = merge_log_files(
+        files, cfg, window=timedelta(minutes=args.window), max_buffer=args.max_buffer
+    )
+    total = 0
+    for ev in stream:
+        correlator.add(ev)
+        total += 1
+    correlator.close()
+    if args.sessions_out:
+        sink.close()
+    print(json.dumps({
+        "events": total,
+        "sessions": correlator.finalized,
+        "late_for_sessions": correlator.late,
+        "files": [
+            {"path": path, "added": st.added, "skipped": st.skipped, "duplicates": st.duplicates,
+             "reordered": rs.reordered, "late": rs.late, "max_buffered": rs.max_buffered}
+            for (path, _p, _s), st, rs in zip(files, ingest_stats, reorder_stats)
+        ],
+    }, ensure_ascii=False, indent=2))
@@ -0,0 +1,127 @@
+import re
+import time
+from datetime import datetime, timedelta, timezone, tzinfo
+from typing import Dict, Optional, Tuple
+
+try:
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+except ImportError:  # Python < 3.9: только UTC, local и фиксированные смещения
+    ZoneInfo = None
+    ZoneInfoNotFoundError = KeyError
+
+# Время событий хранится в UTC: timestamp — «наивный» datetime в UTC для
+# отображения, ts_us — целые микросекунды от эпохи UTC для сравнений и
+# сортировки. Зона берётся из самой строки лога (+0100, +01:00, Z); для строк
+# без зоны — из настроек источника (Config.time_zones / default_time_zone).
+
+EPOCH = datetime(1970, 1, 1)
+EPOCH_ORDINAL = EPOCH.toordinal()
+US_PER_SECOND = 1_000_000
+US_PER_MINUTE = 60 * US_PER_SECOND
+
+OFFSET_RE = re.compile(r"^(?:UTC|GMT)?([+-])(\d{1,2}):?(\d{2})?$")
+
+ZONE_CACHE: Dict[str, tzinfo] = {}
+
+
+def to_micros(ts: datetime) -> int:
+    # Микросекунды от эпохи для «наивного» datetime (поля считаются UTC).
+    return (
+        ((ts.toordinal() - EPOCH_ORDINAL) * 86400 + ts.hour * 3600 + ts.minute * 60 + ts.second) * US_PER_SECOND
+        + ts.microsecond
+    )
+
+
+def from_micros(value: int) -> datetime:
+    return EPOCH + timedelta(microseconds=value)
+
+
+def fixed_zone(text: str) -> Optional[tzinfo]:
+    # Зона по смещению вида '+0100' / '-05:30'; None, если строка не смещение.
+    zone = ZONE_CACHE.get(text)
+    if zone is None:
+        m = OFFSET_RE.match(text)
+        if not m:
+            return None
+        delta = timedelta(hours=int(m.group(2)), minutes=int(m.group(3) or 0))
+        zone = ZONE_CACHE[text] = timezone(-delta if m.group(1) == "-" else delta)
+    return zone
+
+
+class LocalZone(tzinfo):
+    # Системный часовой пояс ('local') со сменой летнего времени: смещение
+    # берётся для каждого момента по правилам ОС (time.mktime / localtime),
+    # а не фиксируется по сегодняшнему дню. Смещения кэшируются по часам.
+
+    def __init__(self):
+        self._offsets: Dict[Tuple[int, int, int, int], timedelta] = {}
+
+    def utcoffset(self, dt: Optional[datetime]) -> timedelta:
+        if dt is None:
+            dt = datetime.now()
+        key = (dt.year, dt.month, dt.day, dt.hour)
+        off = self._offsets.get(key)
+        if off is None:
+            # время считается местным; неоднозначный час при переводе назад ОС
+            # разрешает сама (tm_isdst=-1)
+            stamp = time.mktime((dt.year, dt.month, dt.day, dt.hour, dt.minute, dt.second, 0, 0, -1))
+            off = timedelta(seconds=time.localtime(stamp).tm_gmtoff)
+            if len(self._offsets) > 100_000:
+                self._offsets.clear()
+            self._offsets[key] = off
+        return off
+
+    def dst(self, dt: Optional[datetime]) -> Optional[timedelta]:
+        return None
+
+    def tzname(self, dt: Optional[datetime]) -> str:
+        return "local"
+
+    def fromutc(self, dt: datetime) -> datetime:
+        local = datetime.fromtimestamp((dt.replace(tzinfo=None) - EPOCH).total_seconds())
+        return local.replace(tzinfo=self, microsecond=dt.microsecond)
+
+
+def resolve_zone(name: str) -> tzinfo:
+    # 'UTC', 'local', '+03:00' / '-0500' или имя IANA ('Europe/Moscow').
+    zone = ZONE_CACHE.get(name)
+    if zone is not None:
+        return zone
+    text = (name or "UTC").strip()
+    if text.upper() in ("UTC", "Z", "GMT"):
+        zone = timezone.utc
+    elif text.lower() == "local":
+        zone = LocalZone()
+    else:
+        zone = fixed_zone(text)
+        if zone is None:
+            if ZoneInfo is None:
+                raise ValueError(f"часовой пояс {name} требует Python 3.9+ (zoneinfo)")
+            try:
+                zone = ZoneInfo(text)
+            except (ZoneInfoNotFoundError, ValueError):
+                raise ValueError(f"неизвестный часовой пояс: {name}")
+    ZONE_CACHE[name] = zone
+    return zone
+
+
+def normalize_time(ts: datetime, zone_name: str, offset_minutes: int = 0) -> Tuple[datetime, int]:
+    # Привести время к UTC: (наивный datetime в UTC, микросекунды от эпохи).
+    # Время без зоны трактуется в zone_name; offset_minutes — поправка часов
+    # источника (time_offsets_minutes) поверх зоны.
+    off = ts.utcoffset()
+    if off is None:
+        zone = ZONE_CACHE.get(zone_name) or resolve_zone(zone_name)
+        off = zone.utcoffset(ts)
+        aware = False
+    else:
+        aware = True
+    us = (
+        ((ts.toordinal() - EPOCH_ORDINAL) * 86400 + ts.hour * 3600 + ts.minute * 60 + ts.second
+         + offset_minutes * 60 - off.days * 86400 - off.seconds) * US_PER_SECOND
+        + ts.microsecond
+    )
+    if aware or off or offset_minutes:
+        ts = EPOCH + timedelta(microseconds=us)
+    return ts, us
+
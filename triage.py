@@ -0,0 +1,384 @@
+import math
+import os
+import random
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from config_manager import Config
+from classifier import classify_event
+from ingest import IngestStats, ParserFunc, iter_log_lines, parser_source
+
+# Быстрая оценка (triage) больших файлов до полной загрузки.
+#
+# Файл делится на равные по байтам страты; в каждой страте из случайного места
+# читается проба PROBE_BYTES (первая неполная строка отбрасывается), строки
+# разбираются и классифицируются classify_event. Страты обходятся в случайном
+# порядке, поэтому после каждого раунда уже прочитанные пробы разбросаны по
+# всему файлу, и оценки уточняются по мере чтения (triage_files выдаёт снимок
+# после каждого раунда).
+#
+# Оценка числа событий класса c — отношение по байтам: T = размер файла ×
+# (событий класса c в пробах / байт в пробах). Пробы — кластеры соседних строк,
+# поэтому дисперсия считается по пробам, а не по строкам (строки одной пробы
+# похожи); файлы — независимые страты, дисперсии складываются. Доли — отношения
+# двух таких оценок (линеаризация). Интервалы — нормальное приближение.
+#
+# Для потока без перемотки (stdin) — резервуарная выборка строк (алгоритм L):
+# единица — строка, общее число строк известно точно.
+
+PROBE_BYTES = 16 * 1024
+DEFAULT_ROUNDS = 10
+MIN_PROBES = 20            # файл меньше MIN_PROBES проб читается целиком
+EXACT_PROBE_LINES = 1000   # при чтении целиком — пробы по столько строк
+TOP_N = 10
+
+
+@dataclass
+class Probe:
+    # Одна проба: прочитанный объём и что в нём нашлось.
+    units: int     # байты (файл) или 1 (строка потока)
+    lines: int
+    events: int
+    classes: Dict[str, int] = field(default_factory=dict)
+
+
+@dataclass
+class FileTriage:
+    # Выборка из одного файла.
+    path: str
+    source: str
+    size: int                  # объём генеральной совокупности в единицах выборки
+    unit: str = "bytes"        # 'bytes' или 'lines'
+    exact: bool = False        # прочитано всё — оценки точные
+    probes: List[Probe] = field(default_factory=list)
+    units_read: int = 0
+    stats: IngestStats = field(default_factory=IngestStats)
+    users: Counter = field(default_factory=Counter)
+    ips: Counter = field(default_factory=Counter)
+
+    @property
+    def fraction_read(self) -> float:
+        return min(1.0, self.units_read / self.size) if self.size else 1.0
+
+    @property
+    def scale(self) -> float:
+        # во сколько раз файл больше прочитанного
+        return self.size / self.units_read if self.units_read else 0.0
+
+
+@dataclass
+class Estimate:
+    value: float
+    low: Optional[float] = None    # None — интервал ещё не оценить (меньше двух проб)
+    high: Optional[float] = None
+
+
+def _z(confidence: float) -> float:
+    from statistics import NormalDist
+    return NormalDist().inv_cdf((1 + confidence) / 2)
+
+
+def _total(files: Sequence[FileTriage], value) -> Tuple[float, float]:
+    # Оценка суммы value(file, probe) по всем файлам и её дисперсия.
+    total = var = 0.0
+    for ft in files:
+        probes = ft.probes
+        m = len(probes)
+        read = ft.units_read
+        if not m or not read:
+            continue
+        ys = [value(ft, p) for p in probes]
+        ratio = sum(ys) / read
+        total += ft.size * ratio
+        if ft.exact:
+            continue
+        if m < 2:
+            var = math.inf
+            continue
+        fpc = max(0.0, 1.0 - read / ft.size)
+        mean_units = read / m
+        s2 = sum((y - ratio * p.units) ** 2 for y, p in zip(ys, probes)) / (m - 1)
+        var += ft.size ** 2 * fpc * s2 / (m * mean_units ** 2)
+    return total, var
+
+
+def _interval(value: float, var: float, z: float, lower: float = 0.0, upper: float = math.inf) -> Estimate:
+    if math.isinf(var):
+        return Estimate(value)
+    half = z * math.sqrt(var)
+    return Estimate(value, max(lower, value - half), min(upper, value + half))
+
+
+@dataclass
+class TriageReport:
+    files: List[FileTriage]
+    confidence: float = 0.95
+    elapsed: float = 0.0
+    done: bool = False
+
+    def _z(self) -> float:
+        return _z(self.confidence)
+
+    def events(self) -> Estimate:
+        total, var = _total(self.files, lambda ft, p: p.events)
+        return _interval(total, var, self._z())
+
+    def _shares(self, keys: Iterable[str], value) -> Dict[str, Tuple[Estimate, Estimate]]:
+        # key -> (оценка числа, оценка доли среди событий)
+        z = self._z()
+        events, _ = _total(self.files, lambda ft, p: p.events)
+        result = {}
+        for key in keys:
+            count, var = _total(self.files, lambda ft, p: value(ft, p, key))
+            if events:
+                share = count / events
+                _, var_share = _total(self.files, lambda ft, p: value(ft, p, key) - share * p.events)
+                share_est = _interval(share, var_share / events ** 2, z, 0.0, 1.0)
+            else:
+                share_est = Estimate(0.0)
+            result[key] = (_interval(count, var, z), share_est)
+        return result
+
+    def classes(self) -> Dict[str, Tuple[Estimate, Estimate]]:
+        keys = sorted({c for ft in self.files for p in ft.probes for c in p.classes})
+        return self._shares(keys, lambda ft, p, c: p.classes.get(c, 0))
+
+    def sources(self) -> Dict[str, Tuple[Estimate, Estimate]]:
+        keys = sorted({ft.source for ft in self.files})
+        return self._shares(keys, lambda ft, p, s: p.events if ft.source == s else 0)
+
+    def _top(self, attr: str, n: int) -> List[Tuple[str, float]]:
+        scaled: Counter = Counter()
+        for ft in self.files:
+            scale = ft.scale
+            for key, count in getattr(ft, attr).items():
+                scaled[key] += count * scale
+        return scaled.most_common(n)
+
+    def top_users(self, n: int = TOP_N) -> List[Tuple[str, float]]:
+        return self._top("users", n)
+
+    def top_ips(self, n: int = TOP_N) -> List[Tuple[str, float]]:
+        return self._top("ips", n)
+
+
+def _add_probe(ft: FileTriage, lines: List[bytes], units: int, parser: ParserFunc, cfg: Config) -> None:
+    classes: Dict[str, int] = {}
+    events = 0
+    users, ips = ft.users, ft.ips
+    for ev in iter_log_lines(lines, parser, cfg, None, ft.source, ft.stats):
+        classify_event(ev, cfg)
+        events += 1
+        cls = ev.evidential_class
+        classes[cls] = classes.get(cls, 0) + 1
+        if ev.user:
+            users[ev.user] += 1
+        if ev.ip:
+            ips[ev.ip] += 1
+    ft.probes.append(Probe(units, len(lines), events, classes))
+    ft.units_read += units
+
+
+def _read_probe(f, offset: int, length: int, size: int) -> Tuple[List[bytes], int]:
+    # Целые строки окна [offset, offset + length): первая неполная отбрасывается,
+    # последняя неполная — тоже (кроме конца файла).
+    f.seek(offset)
+    data = f.read(length)
+    if offset > 0:
+        cut = data.find(b"\n")
+        data = data[cut + 1:] if cut >= 0 else b""
+    if offset + length < size:
+        data = data[:data.rfind(b"\n") + 1]
+    return data.splitlines(), len(data)
+
+
+def _plan(size: int, fraction: float, probe_bytes: int, rng: random.Random) -> Optional[List[int]]:
+    # Смещения проб по стратам в случайном порядке; None — файл читается целиком.
+    budget = fraction * size
+    if fraction >= 1 or size <= probe_bytes * MIN_PROBES or budget >= size:
+        return None
+    count = max(MIN_PROBES, math.ceil(budget / probe_bytes))
+    width = size / count
+    offsets = []
+    for k in range(count):
+        start = int(k * width)
+        span = max(0, int((k + 1) * width) - probe_bytes - start)
+        offsets.append(start + rng.randint(0, span))
+    rng.shuffle(offsets)
+    return offsets
+
+
+def triage_files(
+    files: Sequence[Tuple[str, ParserFunc, str]],
+    cfg: Config,
+    fraction: Optional[float] = None,
+    rounds: int = DEFAULT_ROUNDS,
+    seed: Optional[int] = None,
+    probe_bytes: int = PROBE_BYTES,
+) -> Iterator[TriageReport]:
+    # files — (путь, парсер, имя источника). Снимок оценки после каждого раунда;
+    # последний — с done=True.
+    fraction = cfg.triage_fraction if fraction is None else fraction
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    report = TriageReport([], cfg.triage_confidence)
+    work = []
+    for path, parser, source in files:
+        size = os.path.getsize(path)
+        ft = FileTriage(path, parser_source(parser, source), size)
+        report.files.append(ft)
+        work.append((ft, parser, _plan(size, fraction, probe_bytes, rng)))
+
+    rounds = max(1, rounds)
+    for r in range(rounds):
+        for ft, parser, offsets in work:
+            if offsets is None:
+                if r == 0:
+                    _read_whole(ft, parser, cfg)
+                continue
+            lo = len(offsets) * r // rounds
+            hi = len(offsets) * (r + 1) // rounds
+            with open(ft.path, "rb") as f:
+                for offset in offsets[lo:hi]:
+                    lines, units = _read_probe(f, offset, probe_bytes, ft.size)
+                    _add_probe(ft, lines, units, parser, cfg)
+        report.elapsed = time.perf_counter() - started
+        report.done = r == rounds - 1
+        yield report
+
+
+def _read_whole(ft: FileTriage, parser: ParserFunc, cfg: Config) -> None:
+    with open(ft.path, "rb") as f:
+        batch: List[bytes] = []
+        units = 0
+        for line in f:
+            batch.append(line)
+            units += len(line)
+            if len(batch) >= EXACT_PROBE_LINES:
+                _add_probe(ft, batch, units, parser, cfg)
+                batch, units = [], 0
+        if batch:
+            _add_probe(ft, batch, units, parser, cfg)
+    ft.size = ft.units_read
+    ft.exact = True
+
+
+def triage_stream(
+    lines: Iterable[bytes],
+    parser: ParserFunc,
+    cfg: Config,
+    source: str = "",
+    sample_lines: int = 10_000,
+    report_every: int = 100_000,
+    seed: Optional[int] = None,
+) -> Iterator[TriageReport]:
+    # Поток строк без перемотки: резервуар из sample_lines строк, снимок оценки
+    # каждые report_every строк и в конце потока.
+    rng = random.Random(seed)
+    random_, randrange = rng.random, rng.randrange
+    k = sample_lines
+    reservoir: List[bytes] = []
+    started = time.perf_counter()
+    w = math.exp(math.log(random_()) / k)
+    next_i = k - 1 + math.floor(math.log(random_()) / math.log(1 - w)) + 1
+    seen = 0
+
+    def snapshot(done: bool) -> TriageReport:
+        ft = FileTriage("-", parser_source(parser, source), seen, unit="lines", exact=seen <= k)
+        for line in reservoir:
+            _add_probe(ft, [line], 1, parser, cfg)
+        return TriageReport([ft], cfg.triage_confidence, time.perf_counter() - started, done)
+
+    for i, line in enumerate(lines):
+        seen = i + 1
+        if i < k:
+            reservoir.append(line)
+        elif i == next_i:
+            reservoir[randrange(k)] = line
+            w *= math.exp(math.log(random_()) / k)
+            next_i += math.floor(math.log(random_()) / math.log(1 - w)) + 1
+        if seen % report_every == 0:
+            yield snapshot(False)
+    yield snapshot(True)
+
+
+def _fmt_count(value: float) -> str:
+    return f"{value:,.0f}".replace(",", " ")
+
+
+def _fmt_interval(est: Estimate, pct: bool = False) -> str:
+    fmt = (lambda v: f"{100 * v:.1f}%") if pct else _fmt_count
+    if est.low is None:
+        return f"{fmt(est.value)} [—]"
+    return f"{fmt(est.value)} [{fmt(est.low)} — {fmt(est.high)}]"
+
+
+def format_report(report: TriageReport) -> str:
+    lines = []
+    read = sum(ft.units_read for ft in report.files)
+    total = sum(ft.size for ft in report.files)
+    state = "итог" if report.done else "промежуточная"
+    lines.append(
+        f"Быстрая оценка ({state}): прочитано {100 * read / total if total else 100:.2f}% данных, "
+        f"проб {sum(len(ft.probes) for ft in report.files)}, {report.elapsed:.1f} с"
+    )
+    for ft in report.files:
+        unit = "байт" if ft.unit == "bytes" else "строк"
+        mode = "целиком" if ft.exact else f"{100 * ft.fraction_read:.2f}%"
+        lines.append(f"  {ft.path} ({ft.source}): {_fmt_count(ft.size)} {unit}, прочитано {mode}")
+    pct = int(round(100 * report.confidence))
+    lines.append(f"\nСобытий (≈, {pct}% ДИ): {_fmt_interval(report.events())}")
+    lines.append("\nКлассы — доля и число событий:")
+    for cls, (count, share) in report.classes().items():
+        lines.append(f"  {cls or '—'}: {_fmt_interval(share, True)}  ≈ {_fmt_interval(count)}")
+    lines.append("\nИсточники — доля и число событий:")
+    for src, (count, share) in report.sources().items():
+        lines.append(f"  {src}: {_fmt_interval(share, True)}  ≈ {_fmt_interval(count)}")
+    for title, top in (("Пользователи", report.top_users()), ("IP-адреса", report.top_ips())):
+        lines.append(f"\n{title} (оценка числа событий):")
+        for key, value in top:
+            lines.append(f"  {key}: ≈ {_fmt_count(value)}")
+        if not top:
+            lines.append("  —")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+    from parsers import PARSERS, load_parser_plugins
+    from config_manager import load_config
+
+    load_parser_plugins()
+    ap = argparse.ArgumentParser(
+        description="Быстрая оценка больших файлов логов по выборке (формат=путь, путь '-' — stdin)"
+    )
+    ap.add_argument("files", nargs="+", metavar="FORMAT=PATH")
+    ap.add_argument("--fraction", type=float, default=None, help="доля каждого файла (по умолчанию из конфигурации)")
+    ap.add_argument("--rounds", type=int, default=DEFAULT_ROUNDS, help="число уточнений оценки")
+    ap.add_argument("--sample-lines", type=int, default=10_000, help="размер резервуара для stdin")
+    ap.add_argument("--seed", type=int, default=None)
+    ap.add_argument("--final-only", action="store_true", help="печатать только итоговую оценку")
+    args = ap.parse_args()
+
+    cfg = load_config()
+    files = []
+    for item in args.files:
+        fmt, _, path = item.partition("=")
+        if fmt not in PARSERS or not path:
+            ap.error(f"ожидается ФОРМАТ=ПУТЬ, форматы: {', '.join(sorted(PARSERS))}")
+        files.append((path, PARSERS[fmt], fmt))
+
+    stdin = [f for f in files if f[0] == "-"]
+    if stdin and len(files) > 1:
+        ap.error("stdin ('-') оценивается отдельно от файлов")
+    if stdin:
+        _path, parser, fmt = stdin[0]
+        reports = triage_stream(sys.stdin.buffer, parser, cfg, fmt, args.sample_lines, seed=args.seed)
+    else:
+        reports = triage_files(files, cfg, args.fraction, args.rounds, args.seed)
+    for report in reports:
+        if report.done or not args.final_only:
+            print(format_report(report), flush=True)
+            print()
@@ -0,0 +1,151 @@
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+from models import LogEvent
+from config_manager import Config
+from corroboration import Corroboration
+from rule_engine import compile_graders
+
+# Сравнение конфигураций «что если»: несколько вариантов Config оцениваются
+# на уже загруженных событиях за один проход, без разбора исходных строк и
+# без изменения самих событий. Тип события пересчитывается только для
+# вариантов, у которых изменились ключевые слова или порог передачи файла —
+# остальные параметры на тип события не влияют.
+
+# параметры Config, от которых зависит тип события при разборе
+EVENT_TYPE_FIELDS = ("sensitive_keywords", "auth_keywords", "file_transfer_threshold")
+
+CLASS_ORDER = ("A", "B", "C", "D")
+
+
+@dataclass
+class WhatIfResult:
+    # Итоги одного варианта относительно текущей классификации событий.
+    name: str
+    class_counts: Counter = field(default_factory=Counter)
+    changed: int = 0                    # событий, сменивших класс
+    transitions: Counter = field(default_factory=Counter)  # (было, стало) -> число
+    retyped: int = 0                    # событий, сменивших тип
+    affected_sessions: Set[int] = field(default_factory=set)
+    retyping: bool = False              # пересчитывались ли типы событий
+
+
+def needs_retyping(base: Config, cfg: Config) -> bool:
+    return any(getattr(base, name) != getattr(cfg, name) for name in EVENT_TYPE_FIELDS)
+
+
+def retype_events(events: List[LogEvent], cfg: Config) -> int:
+    # Пересчитать типы событий под новые ключевые слова/порог; число изменившихся.
+    from parsers import event_typers
+    typers = event_typers()
+    changed = 0
+    for ev in events:
+        typer = typers.get(ev.source)
+        if typer is not None:
+            et = typer(ev, cfg)
+            if et != ev.event_type:
+                ev.event_type = et
+                changed += 1
+    return changed
+
+
+@dataclass
+class _Plan:
+    cfg: Config
+    graders: dict
+    default: object
+    typers: Optional[dict]
+    result: WhatIfResult
+    memo: Optional[dict] = None
+
+
+def evaluate_configs(
+    events: List[LogEvent],
+    candidates: Dict[str, Config],
+    base: Config,
+    corroboration: Optional[Corroboration] = None,
+) -> Tuple[List[WhatIfResult], float]:
+    # Оценить варианты конфигурации; base — конфигурация, которой события
+    # классифицированы сейчас. Возвращает итоги по вариантам и время прохода (с).
+    # corroboration — подтверждения, с которыми события классифицированы (бонус
+    # берётся из варианта, окно подтверждения не пересчитывается).
+    started = time.perf_counter()
+    typers_cache = None
+    plans: List[_Plan] = []
+    for name, cfg in candidates.items():
+        graders, default = compile_graders(cfg)
+        typers = None
+        if needs_retyping(base, cfg):
+            if typers_cache is None:
+                from parsers import event_typers
+                typers_cache = event_typers()
+            typers = typers_cache
+        plan = _Plan(cfg, graders, default, typers, WhatIfResult(name, retyping=typers is not None))
+        if typers is None and not any(g.uses_details for g in (default, *graders.values())):
+            plan.memo = {}
+        plans.append(plan)
+
+    masks = corroboration.masks if corroboration is not None else None
+    for i, ev in enumerate(events):
+        current = ev.evidential_class
+        src = ev.source
+        et0 = ev.event_type
+        corroborated = masks is not None and masks[i] != 0
+        signature = None
+        for plan in plans:
+            res = plan.result
+            bonus = plan.cfg.scoring.corroboration_bonus if corroborated else 0
+            if plan.memo is not None:
+                # класс зависит только от сигнатуры события — считаем один раз на сигнатуру
+                if signature is None:
+                    signature = (src, et0, not ev.user, not ev.ip, ev.timestamp is None, corroborated)
+                cls = plan.memo.get(signature)
+                if cls is None:
+                    cls = plan.memo[signature] = plan.graders.get(src, plan.default)(ev, et0, bonus)
+            else:
+                et = et0
+                if plan.typers is not None:
+                    typer = plan.typers.get(src)
+                    if typer is not None:
+                        et = typer(ev, plan.cfg)
+                        if et != et0:
+                            res.retyped += 1
+                cls = plan.graders.get(src, plan.default)(ev, et, bonus)
+            res.class_counts[cls] += 1
+            if cls != current:
+                res.changed += 1
+                res.transitions[(current, cls)] += 1
+                if ev.session_id is not None:
+                    res.affected_sessions.add(ev.session_id)
+
+    return [plan.result for plan in plans], time.perf_counter() - started
+
+
+def format_whatif_report(
+    results: List[WhatIfResult],
+    current_counts: Dict[str, int],
+    total: int,
+    elapsed: float,
+) -> str:
+    # Текстовый отчёт для окна сравнения.
+    lines = [f"Событий: {total}, проход занял {elapsed:.2f} с", ""]
+    for res in results:
+        lines.append(f"=== {res.name} ===")
+        for cls in CLASS_ORDER:
+            before = current_counts.get(cls, 0)
+            after = res.class_counts.get(cls, 0)
+            delta = after - before
+            sign = "+" if delta > 0 else ""
+            lines.append(f"  Класс {cls}: {before} -> {after} ({sign}{delta})")
+        lines.append(f"  Сменили класс: {res.changed}")
+        for (old, new), cnt in sorted(res.transitions.items(), key=lambda kv: -kv[1]):
+            lines.append(f"    {old or '—'} -> {new}: {cnt}")
+        if res.retyping:
+            lines.append(f"  Сменили тип события: {res.retyped}")
+        affected = sorted(res.affected_sessions)
+        shown = ", ".join(str(sid) for sid in affected[:30])
+        more = f" и ещё {len(affected) - 30}" if len(affected) > 30 else ""
+        lines.append(f"  Затронуто сессий: {len(affected)}" + (f" ({shown}{more})" if affected else ""))
+        lines.append("")
+    return "\n".join(lines)